@@ -0,0 +1,121 @@
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from cache import make_cache
+from invalidation import invalidation_bus
+from models import Test, Option
+from question_bank import test_question_ids
+from schemas import AnswerSubmit
+
+
+# Ключ ответов теста: для каждого question_id - правильные и все допустимые варианты
+class AnswerKey(NamedTuple):
+    correct: Dict[int, FrozenSet[int]]
+    options: Dict[int, FrozenSet[int]]
+
+
+class GradedAnswer(NamedTuple):
+    question_id: int
+    selected: FrozenSet[int]  # только варианты этого вопроса
+    is_correct: bool
+
+ANSWER_KEY_CACHE_SIZE = 256
+QUESTION_KEY_CACHE_SIZE = 8192
+
+# Ключ кэша - (test_id, version), как у снимков тестов: ключ ответов теста,
+# измененного в другом воркере, никогда не используется для проверки
+answer_key_cache = make_cache("answer_keys", ANSWER_KEY_CACHE_SIZE)
+
+# (правильные, все варианты) версии вопроса по question_id. Версии неизменяемы и их id
+# не переиспользуются, поэтому кэш не сбрасывается: вопрос банка, входящий во многие
+# тесты, читается из базы один раз
+question_key_cache = make_cache("question_keys", QUESTION_KEY_CACHE_SIZE)
+
+
+def compile_answer_key(db: Session, test_id: int) -> Optional[AnswerKey]:
+    # Тест без вопросов даёт пустой ключ, несуществующий тест - None
+    if db.query(Test.id).filter(Test.id == test_id).first() is None:
+        return None
+    return _build_answer_key(db, test_id)
+
+
+def _build_answer_key(db: Session, test_id: int) -> AnswerKey:
+    keys: Dict[int, Tuple[FrozenSet[int], FrozenSet[int]]] = {}
+    missing = []
+    for question_id in test_question_ids(db, test_id):
+        cached = question_key_cache.get(question_id)
+        if cached is None:
+            missing.append(question_id)
+        else:
+            keys[question_id] = cached
+
+    if missing:
+        correct: Dict[int, set] = {question_id: set() for question_id in missing}
+        options: Dict[int, set] = {question_id: set() for question_id in missing}
+        for question_id, option_id, is_correct in (
+            db.query(Option.question_id, Option.id, Option.is_correct)
+            .filter(Option.question_id.in_(missing))
+        ):
+            options[question_id].add(option_id)
+            if is_correct:
+                correct[question_id].add(option_id)
+        for question_id in missing:
+            keys[question_id] = (frozenset(correct[question_id]), frozenset(options[question_id]))
+            question_key_cache.put(question_id, keys[question_id])
+
+    return AnswerKey(
+        correct={question_id: key[0] for question_id, key in keys.items()},
+        options={question_id: key[1] for question_id, key in keys.items()},
+    )
+
+
+def get_answer_key(db: Session, test_id: int) -> Optional[AnswerKey]:
+    # Единственный обязательный запрос - версия теста по первичному ключу
+    version = db.query(Test.version).filter(Test.id == test_id).scalar()
+    if version is None:
+        return None
+    key = answer_key_cache.get((test_id, version))
+    if key is None:
+        key = _build_answer_key(db, test_id)
+        answer_key_cache.put((test_id, version), key)
+    return key
+
+
+def restrict_key(key: AnswerKey, question_ids: Iterable[int]) -> AnswerKey:
+    # Ключ только по вопросам варианта попытки (variants.variant_question_ids)
+    ids = [question_id for question_id in question_ids if question_id in key.correct]
+    return AnswerKey(
+        correct={question_id: key.correct[question_id] for question_id in ids},
+        options={question_id: key.options[question_id] for question_id in ids},
+    )
+
+
+def invalidate_answer_key(test_id: int) -> None:
+    # Освобождает память под ключи прежних версий (и удаленного теста)
+    answer_key_cache.invalidate_where(lambda key: key[0] == test_id)
+
+
+invalidation_bus.track(answer_key_cache)
+invalidation_bus.subscribe("test", lambda key: invalidate_answer_key(int(key)))
+
+
+def grade(key: AnswerKey, answers: Iterable[AnswerSubmit]) -> Tuple[int, List[GradedAnswer]]:
+    # Ответы на вопросы не из теста отбрасываются; повторный ответ на вопрос заменяет предыдущий
+    graded: Dict[int, GradedAnswer] = {}
+    for answer in answers:
+        correct_options = key.correct.get(answer.question_id)
+        if correct_options is None:
+            continue
+
+        # Варианты не из этого вопроса отбрасываются до проверки: проверяется тот же набор,
+        # что сохраняется в user_answer_options и по которому пересчитываются карточка
+        # результата и анализ вопросов (maintenance.py rebuild-item-stats)
+        selected = frozenset(answer.selected_option_ids) & key.options[answer.question_id]
+        # Ответ правильный только если выбраны ВСЕ правильные и НЕ выбраны неправильные
+        graded[answer.question_id] = GradedAnswer(
+            question_id=answer.question_id,
+            selected=selected,
+            is_correct=selected == correct_options,
+        )
+
+    score = sum(1 for answer in graded.values() if answer.is_correct)
+    return score, list(graded.values())
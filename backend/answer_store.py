@@ -0,0 +1,134 @@
+import json
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from sqlalchemy import insert, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from database import supports_bulk_returning
+from answer_keys import GradedAnswer
+from models import UserAnswer, UserAnswerOption
+
+# Хранение выбранных вариантов в нормализованном виде (user_answer_options)
+# вместо JSON-строки в user_answers.selected_options
+
+
+def save_answer_sets(db: Session, answer_sets: List[Tuple[int, List[GradedAnswer]]]) -> None:
+    # Ответы нескольких результатов двумя пакетными INSERT; коммит делает вызывающий код
+    rows = [
+        {"result_id": result_id, "question_id": answer.question_id}
+        for result_id, answers in answer_sets
+        for answer in answers
+    ]
+    if not rows:
+        return
+
+    if supports_bulk_returning(db):
+        # (result_id, question_id) уникальна, по ней сопоставляются строки RETURNING
+        returned = db.execute(
+            insert(UserAnswer).returning(UserAnswer.id, UserAnswer.result_id, UserAnswer.question_id), rows
+        ).all()
+        answer_ids = {(result_id, question_id): answer_id for answer_id, result_id, question_id in returned}
+    else:
+        answer_ids = {
+            (row["result_id"], row["question_id"]): db.execute(insert(UserAnswer).values(**row)).inserted_primary_key[0]
+            for row in rows
+        }
+
+    option_rows = [
+        {"user_answer_id": answer_ids[(result_id, answer.question_id)], "option_id": option_id}
+        for result_id, answers in answer_sets
+        for answer in answers
+        for option_id in sorted(answer.selected)
+    ]
+    if option_rows:
+        db.execute(insert(UserAnswerOption), option_rows)
+
+
+def save_answers(db: Session, result_id: int, answers: List[GradedAnswer]) -> None:
+    # Два пакетных INSERT на всю попытку
+    save_answer_sets(db, [(result_id, answers)])
+
+
+def legacy_option_ids(legacy_json: Optional[str]) -> Set[int]:
+    # Варианты из устаревшего JSON; поврежденная строка читается как пустой ответ
+    try:
+        return {int(option_id) for option_id in json.loads(legacy_json)}
+    except (ValueError, TypeError):
+        return set()
+
+
+def load_selected_many(db: Session, result_ids: List[int]) -> Dict[int, Dict[int, FrozenSet[int]]]:
+    # result_id -> question_id -> выбранные варианты, одним запросом по индексам
+    rows = (
+        db.query(UserAnswer.result_id, UserAnswer.question_id, UserAnswer.selected_options, UserAnswerOption.option_id)
+        .outerjoin(UserAnswerOption, UserAnswerOption.user_answer_id == UserAnswer.id)
+        .filter(UserAnswer.result_id.in_(result_ids))
+        .all()
+    ) if result_ids else []
+
+    selected: Dict[int, Dict[int, set]] = {}
+    for result_id, question_id, legacy_json, option_id in rows:
+        options = selected.setdefault(result_id, {}).setdefault(question_id, set())
+        if option_id is not None:
+            options.add(option_id)
+        elif legacy_json:
+            # Строка еще не перенесена из JSON (см. maintenance.py migrate-answers)
+            options.update(legacy_option_ids(legacy_json))
+
+    return {
+        result_id: {question_id: frozenset(ids) for question_id, ids in questions.items()}
+        for result_id, questions in selected.items()
+    }
+
+
+def load_selected(db: Session, result_id: int) -> Dict[int, FrozenSet[int]]:
+    return load_selected_many(db, [result_id]).get(result_id, {})
+
+
+def migrate_json_answers(db: Session, batch_size: int = 5000) -> int:
+    # Перенос selected_options из JSON в user_answer_options пачками; идемпотентен
+    migrated = 0
+    while True:
+        rows = (
+            db.query(UserAnswer.id, UserAnswer.selected_options)
+            .filter(UserAnswer.selected_options.isnot(None))
+            .order_by(UserAnswer.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return migrated
+
+        option_rows = [
+            {"user_answer_id": answer_id, "option_id": option_id}
+            for answer_id, legacy_json in rows
+            for option_id in sorted(legacy_option_ids(legacy_json))
+        ]
+        if option_rows:
+            _insert_missing_options(db, option_rows)
+        db.execute(
+            update(UserAnswer)
+            .where(UserAnswer.id.in_([answer_id for answer_id, _ in rows]))
+            .values(selected_options=None)
+        )
+        db.commit()
+        migrated += len(rows)
+
+
+def _insert_missing_options(db: Session, option_rows: List[dict]) -> None:
+    # Пары (ответ, вариант), уже перенесенные прерванным запуском, пропускаются
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert_ = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        db.execute(insert_(UserAnswerOption).on_conflict_do_nothing(), option_rows)
+        return
+
+    existing = set(
+        db.query(UserAnswerOption.user_answer_id, UserAnswerOption.option_id)
+        .filter(tuple_(UserAnswerOption.user_answer_id, UserAnswerOption.option_id).in_(
+            [(row["user_answer_id"], row["option_id"]) for row in option_rows]
+        ))
+        .all()
+    )
+    missing = [row for row in option_rows if (row["user_answer_id"], row["option_id"]) not in existing]
+    if missing:
+        db.execute(insert(UserAnswerOption), missing)
@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from config import AUTOSAVE_BATCH_SIZE, AUTOSAVE_FLUSH_INTERVAL_MS, AUTOSAVE_MAX_PENDING
+from database import SessionLocal
+from metrics import counter, distribution, gauge
+from models import Attempt
+from schemas import AnswerSubmit
+
+# Автосохранение ответов незавершенных попыток. Клиент присылает изменения часто (на каждый
+# щелчок), но в базу они попадают не по одной записи на изменение: буфер в памяти процесса
+# сводит изменения каждой попытки к последнему ответу на вопрос, фоновый поток раз в интервал
+# записывает все накопившиеся попытки пакетными UPDATE. Число транзакций в секунду не зависит
+# от частоты щелчков: 1 / интервал * ceil(попыток с изменениями / AUTOSAVE_BATCH_SIZE).
+# Запечатанные отправкой попытки не перезаписываются (условие submitted_at IS NULL), поэтому
+# запоздавшая запись буфера - в том числе из другого процесса - не меняет отправленные ответы.
+
+logger = logging.getLogger(__name__)
+
+# {question_id: [option_id, ...]}
+Answers = Dict[int, List[int]]
+
+
+def decode_answers(value: Optional[str]) -> Answers:
+    return {int(question_id): options for question_id, options in json.loads(value).items()} if value else {}
+
+
+def encode_answers(answers: Answers) -> str:
+    return json.dumps({str(question_id): answers[question_id] for question_id in sorted(answers)},
+                      separators=(",", ":"))
+
+
+def answer_patch(answers: Iterable[AnswerSubmit]) -> Answers:
+    # Повторный ответ на вопрос в одном изменении заменяет предыдущий, как при проверке
+    return {answer.question_id: sorted(set(answer.selected_option_ids)) for answer in answers}
+
+
+def answer_list(answers: Answers) -> List[AnswerSubmit]:
+    return [AnswerSubmit(question_id=question_id, selected_option_ids=options)
+            for question_id, options in answers.items()]
+
+
+def answers_json(answers: Answers) -> bytes:
+    # Поле answers ответа AttemptResponse
+    return json.dumps([{"question_id": question_id, "selected_option_ids": options}
+                       for question_id, options in answers.items()], separators=(",", ":")).encode()
+
+
+def write_progress(db: Session, patches: Dict[int, Answers]) -> int:
+    # Слияние изменений с сохраненными ответами и одно пакетное UPDATE по первичному ключу;
+    # возвращает число записанных попыток, коммит делает вызывающий код
+    saved = dict(
+        db.query(Attempt.id, Attempt.answers)
+        .filter(Attempt.id.in_(list(patches)), Attempt.submitted_at.is_(None))
+    )
+    if not saved:
+        return 0
+    saved_at = datetime.utcnow()
+    rows = [
+        {"id": attempt_id, "answers": encode_answers({**decode_answers(saved[attempt_id]), **patch}),
+         "saved_at": saved_at}
+        for attempt_id, patch in patches.items()
+        if attempt_id in saved
+    ]
+    db.execute(
+        update(Attempt).where(Attempt.submitted_at.is_(None)).execution_options(synchronize_session=None),
+        rows,
+    )
+    return len(rows)
+
+
+pending_attempts = gauge("autosave_pending_attempts", "Attempts with answer changes waiting to be written")
+patches_received = counter("autosave_patches_total", "Answer patches accepted by the autosave buffer")
+patches_direct = counter("autosave_direct_writes_total", "Answer patches written immediately (buffer stopped or full)")
+attempts_written = counter("autosave_attempts_written_total", "Attempt rows written by the autosave flusher")
+flushes_failed = counter("autosave_flush_failed_total", "Autosave batches that could not be written")
+flush_seconds = distribution("autosave_flush_seconds", "Time to write and commit one autosave batch")
+flush_batch_size = distribution("autosave_flush_batch_size", "Attempts per committed autosave batch")
+
+
+class AutosaveBuffer:
+    def __init__(self, session_factory=SessionLocal, batch_size: int = AUTOSAVE_BATCH_SIZE,
+                 flush_interval: float = AUTOSAVE_FLUSH_INTERVAL_MS / 1000, max_pending: int = AUTOSAVE_MAX_PENDING):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, Answers] = {}
+        self._writing: Dict[int, Answers] = {}  # пачка, которая записывается сейчас
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="autosave-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        # Новые изменения больше не принимаются, накопленные записываются до выхода
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+    def patch(self, attempt_id: int, answers: Answers) -> bool:
+        # False - буфер не запущен или переполнен: вызывающий код пишет изменение сам.
+        # Изменения уже ожидающей попытки принимаются всегда - они не увеличивают буфер
+        with self._lock:
+            if not self._running:
+                return False
+            current = self._pending.get(attempt_id)
+            if current is None:
+                if len(self._pending) >= self.max_pending:
+                    return False
+                current = self._pending[attempt_id] = {}
+            current.update(answers)
+        patches_received.inc()
+        return True
+
+    def peek(self, attempt_id: int) -> Answers:
+        # Еще не записанные изменения попытки (только этого процесса)
+        with self._lock:
+            return {**self._writing.get(attempt_id, {}), **self._pending.get(attempt_id, {})}
+
+    def discard(self, attempt_id: int) -> None:
+        # Попытка запечатана и закоммичена: ее изменения вошли в окончательные ответы
+        with self._lock:
+            self._pending.pop(attempt_id, None)
+
+    def flush(self) -> int:
+        # Все накопленные попытки: по транзакции на batch_size попыток
+        with self._flush_lock:
+            with self._lock:
+                batch = self._writing = self._pending
+                self._pending = {}
+            if not batch:
+                return 0
+            attempt_ids = list(batch)
+            written = 0
+            try:
+                for start in range(0, len(attempt_ids), self.batch_size):
+                    written += self._write({attempt_id: batch[attempt_id]
+                                            for attempt_id in attempt_ids[start:start + self.batch_size]})
+            finally:
+                with self._lock:
+                    self._writing = {}
+            return written
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Autosave flush failed")
+
+    def _write(self, patches: Dict[int, Answers]) -> int:
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            written = write_progress(db, patches)
+            db.commit()
+            attempts_written.inc(written)
+            return written
+        except Exception:
+            # Изменения возвращаются в буфер под более новыми, если те пришли за время записи
+            db.rollback()
+            flushes_failed.inc()
+            logger.exception("Autosave batch of %d attempts failed", len(patches))
+            with self._lock:
+                for attempt_id, answers in patches.items():
+                    self._pending[attempt_id] = {**answers, **self._pending.get(attempt_id, {})}
+            return 0
+        finally:
+            db.close()
+            flush_seconds.observe(time.perf_counter() - started)
+            flush_batch_size.observe(len(patches))
+
+
+autosave_buffer = AutosaveBuffer()
+
+
+def save_answers(db: Session, attempt_id: int, answers: Answers) -> bool:
+    # True - изменение в буфере; False - буфер остановлен или переполнен, записано сразу
+    if autosave_buffer.patch(attempt_id, answers):
+        return True
+    write_progress(db, {attempt_id: answers})
+    db.commit()
+    patches_direct.inc()
+    return False
+
+
+def current_answers(saved: Optional[str], attempt_id: int) -> Answers:
+    # Сохраненные ответы попытки вместе с еще не записанными изменениями этого процесса
+    return {**decode_answers(saved), **autosave_buffer.peek(attempt_id)}
+pending_attempts.set_function(autosave_buffer.pending)
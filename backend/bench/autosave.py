@@ -0,0 +1,104 @@
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from bench.common import temp_database_url, make_engine, make_client, latency_summary
+from bench.seed import seed
+from config import AUTH_SECRET
+from models import Test, User
+from security import issue_token
+import autosave
+
+# Автосохранение ответов: класс студентов щелкает по вариантам, каждый щелчок - PATCH
+# /student/attempts/{id}/answers. Сравнение записи каждого изменения сразу с буфером,
+# который сводит изменения попыток и пишет их пачками раз в интервал: латентность PATCH,
+# число транзакций записи и транзакции в секунду.
+# Запуск из backend/: python -m bench.autosave --students 300 --clicks 20 --interval-ms 1000
+
+
+def run_mode(client, attempts, clicks, workers, buffered, interval):
+    buffer = autosave.autosave_buffer
+    buffer.flush_interval = interval
+    if buffered:
+        buffer.start()
+    direct_before = autosave.patches_direct.collect()["value"]
+    batches_before = autosave.flush_batch_size.collect()["count"]
+
+    def student(attempt):
+        authorization, attempt_id, question_ids, option_ids = attempt
+        samples = []
+        for click in range(clicks):
+            question_id = question_ids[click % len(question_ids)]
+            started = time.perf_counter()
+            client.patch(f"/student/attempts/{attempt_id}/answers", headers={"Authorization": authorization},
+                         json={"answers": [{"question_id": question_id,
+                                            "selected_option_ids": option_ids[click % len(option_ids)]}]}
+                         ).raise_for_status()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        samples = [sample for result in pool.map(student, attempts) for sample in result]
+    buffer.stop()
+    elapsed = time.perf_counter() - started
+
+    if buffered:
+        transactions = autosave.flush_batch_size.collect()["count"] - batches_before
+    else:
+        transactions = autosave.patches_direct.collect()["value"] - direct_before
+    return {
+        "patch": latency_summary(samples),
+        "patches": len(samples),
+        "write_transactions": transactions,
+        "transactions_per_s": round(transactions / elapsed, 1),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def run(students, questions, clicks, workers, interval_ms):
+    engine = make_engine(temp_database_url())
+    seed(engine, students=students, tests=1, questions=questions, options=4)
+    autosave.autosave_buffer.session_factory = sessionmaker(bind=engine)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        test_id = db.query(Test.id).scalar()
+        student_ids = [user_id for user_id, in db.query(User.id).filter(User.role == "student")]
+    finally:
+        db.close()
+
+    client = make_client(engine)
+    report = {"scale": {"students": students, "questions": questions, "clicks_per_student": clicks,
+                        "interval_ms": interval_ms}}
+    for mode, buffered in (("direct", False), ("buffered", True)):
+        attempts = []
+        for user_id in student_ids:
+            authorization = f"Bearer {issue_token(user_id, 'student', secret=AUTH_SECRET)}"
+            response = client.post(f"/student/tests/{test_id}/attempts", headers={"Authorization": authorization})
+            response.raise_for_status()
+            variant = response.json()
+            attempts.append((authorization, variant["attempt_id"], [q["id"] for q in variant["questions"]],
+                             [[option["id"]] for option in variant["questions"][0]["options"]] + [[]]))
+        report[mode] = run_mode(client, attempts, clicks, workers, buffered, interval_ms / 1000)
+
+    with engine.connect() as conn:
+        report["saved_attempts"] = conn.execute(text("SELECT count(*) FROM attempts WHERE answers IS NOT NULL")).scalar()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attempt autosave benchmark")
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--clicks", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--interval-ms", type=float, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.students, args.questions, args.clicks, args.workers, args.interval_ms), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import json
+from bench.common import temp_database_url, make_engine, make_client, latency_summary, measure
+from bench.seed import seed
+
+# Сравнение каталога /student/tests с полной выдачей (?full=true):
+# суммарный размер ответа и время выгрузки всех страниц при заданном масштабе.
+# Запуск из backend/: python -m bench.catalog --tests 1000 --questions 50
+
+
+def fetch_all_pages(client, params):
+    # Проход по всем страницам каталога через курсор; возвращает (байт, элементов)
+    total_bytes, items, cursor = 0, 0, None
+    while True:
+        page_params = dict(params, cursor=cursor) if cursor else params
+        response = client.get("/student/tests", params=page_params)
+        response.raise_for_status()
+        total_bytes += len(response.content)
+        items += len(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return total_bytes, items
+
+
+def run(tests, questions, options, limit, repeat):
+    engine = make_engine(temp_database_url())
+    seed(engine, tests=tests, questions=questions, options=options)
+    client = make_client(engine)
+
+    report = {"scale": {"tests": tests, "questions_per_test": questions, "options": options, "limit": limit}}
+    for mode, params in (("catalog", {}), ("full", {"full": "true"})):
+        (payload_bytes, items), samples = measure(
+            lambda: fetch_all_pages(client, {"limit": limit, **params}), repeat
+        )
+        report[mode] = {"payload_bytes": payload_bytes, "items": items, **latency_summary(samples)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog vs full /student/tests benchmark")
+    parser.add_argument("--tests", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tests, args.questions, args.options, args.limit, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
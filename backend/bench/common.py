@@ -0,0 +1,67 @@
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy.orm import sessionmaker
+
+# Общие помощники бенчмарков: временная база и клиент приложения поверх нее
+
+
+def temp_database_url(name="bench.db"):
+    directory = tempfile.mkdtemp(prefix="testing-bench-")
+    return f"sqlite:///{os.path.join(directory, name)}"
+
+
+def make_engine(url):
+    # Тот же движок, что и у приложения (пул и PRAGMA из config)
+    from database import create_db_engine
+    return create_db_engine(url)
+
+
+def bind_app(engine):
+    # Приложение, у которого зависимость get_db работает с базой бенчмарка
+    from database import get_db, SyncSessionRunner
+    from main import app
+
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    async def override_get_db():
+        db = SyncSessionRunner(session_factory())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return app
+
+
+def make_client(engine):
+    from fastapi.testclient import TestClient
+    return TestClient(bind_app(engine))
+
+
+def latency_summary(samples):
+    # Латентности в миллисекундах
+    ordered = sorted(samples)
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pct(0.50), 3),
+        "p95_ms": round(pct(0.95), 3),
+        "p99_ms": round(pct(0.99), 3),
+    }
+
+
+def measure(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, samples
@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+import httpx
+from sqlalchemy import select
+from bench.common import bind_app, latency_summary, make_engine
+from bench.load import BACKEND_DIR, BENCH_AUTH_SECRET, free_port, start_server, wait_ready
+from bench.seed import seed
+from config import AUTH_SECRET
+from metrics import series_key
+from models import TestResult, User
+from security import issue_token
+
+# Экзаменационный день: студенты одновременно смотрят каталог, открывают тесты, отправляют
+# ответы и смотрят результаты. Приложение вызывается в том же процессе (ASGI, без сети)
+# и/или через uvicorn по HTTP. По каждому маршруту - пропускная способность, p50/p95/p99
+# и среднее число SQL-запросов на вызов (из /metrics сервера). Отчет - JSON, который можно
+# сохранить (--output) и сравнить с отчетом другого коммита (--compare).
+# Запуск из backend/: python -m bench.examday --transport inprocess http --output before.json
+#                    python -m bench.examday --compare before.json
+
+# Доли операций по умолчанию (веса, не обязательно в сумме 100)
+DEFAULT_MIX = {"list": 10, "open": 35, "submit": 25, "my_results": 15, "detail": 15}
+
+ROUTES = {
+    "list": ("GET", "/student/tests"),
+    "open": ("GET", "/student/tests/{test_id}"),
+    "submit": ("POST", "/student/submit"),
+    "my_results": ("GET", "/student/my-results"),
+    "detail": ("GET", "/student/results/{result_id}"),
+}
+
+TRANSPORTS = ("inprocess", "http")
+
+COMPARED = ("requests_per_sec", "p50_ms", "p95_ms", "p99_ms", "sql_statements_per_request")
+
+
+def parse_mix(value):
+    # "open=40,submit=30" - переопределение части весов
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, value.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {', '.join(ROUTES)}")
+        mix[name] = float(weight)
+    return mix
+
+
+# --- Подготовка базы ---
+
+def prepare_template(args, workdir):
+    # Засеянная база кэшируется по масштабу: повторные запуски не тратят время на seed
+    scale = (args.teachers, args.students, args.tests, args.questions, args.options, args.attempts, args.seed)
+    template = os.path.join(workdir, "template-" + "-".join(map(str, scale)) + ".db")
+    if not os.path.exists(template):
+        engine = make_engine(f"sqlite:///{template}")
+        seed(engine, teachers=args.teachers, students=args.students, tests=args.tests,
+             questions=args.questions, options=args.options, attempts=args.attempts, random_seed=args.seed)
+        engine.dispose()
+    return template
+
+
+def fresh_database(workdir, template):
+    # Каждый прогон начинается с одинаковой копии базы
+    database = os.path.join(workdir, "database.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    shutil.copyfile(template, database)
+    return database
+
+
+def load_population(database):
+    # id студентов и уже существующих результатов каждого из них
+    engine = make_engine(f"sqlite:///{database}")
+    try:
+        with engine.connect() as conn:
+            students = conn.execute(select(User.id).where(User.role == "student").order_by(User.id)).scalars().all()
+            owned = {}
+            for result_id, user_id in conn.execute(select(TestResult.id, TestResult.user_id)):
+                owned.setdefault(user_id, []).append(result_id)
+    finally:
+        engine.dispose()
+    return students, owned
+
+
+# --- Нагрузка ---
+
+async def sql_series(client):
+    # Гистограммы числа и времени SQL по маршрутам (RequestMetricsMiddleware)
+    response = await client.get("/metrics", params={"format": "json"})
+    return response.json() if response.status_code == 200 else {}
+
+
+def sql_per_request(before, after, name):
+    method, route = ROUTES[name]
+    labels = {"method": method, "route": route}
+    statements = series_key("http_request_sql_statements", labels)
+    seconds = series_key("http_request_sql_seconds", labels)
+    if statements not in after:
+        return None, None
+    requests = after[statements]["count"] - before.get(statements, {}).get("count", 0)
+    if not requests:
+        return None, None
+    count = after[statements]["sum"] - before.get(statements, {}).get("sum", 0)
+    elapsed = after[seconds]["sum"] - before.get(seconds, {}).get("sum", 0)
+    return round(count / requests, 2), round(elapsed / requests * 1000, 3)
+
+
+async def exam_day(client, args, secret, students, owned):
+    test_ids = list(range(1, args.tests + 1))
+    # Содержимое тестов для формирования ответов (заодно прогрев кэшей)
+    contents = {}
+    for test_id in test_ids:
+        response = await client.get(f"/student/tests/{test_id}")
+        response.raise_for_status()
+        contents[test_id] = response.json()
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    before = await sql_series(client)
+    deadline = time.monotonic() + args.duration
+
+    async def worker(index):
+        # Последовательность операций каждого клиента детерминирована (--seed)
+        rnd = random.Random(args.seed * 1000003 + index)
+        student_id = students[index % len(students)]
+        headers = {"Authorization": f"Bearer {issue_token(student_id, 'student', secret=secret)}"}
+        results = owned.setdefault(student_id, [])
+        while time.monotonic() < deadline:
+            name = rnd.choices(names, weights)[0]
+            if name == "detail" and not results:
+                name = "my_results"
+            test_id = rnd.choice(test_ids)
+            started = time.perf_counter()
+            if name == "list":
+                response = await client.get("/student/tests", headers=headers)
+            elif name == "open":
+                response = await client.get(f"/student/tests/{test_id}", headers=headers)
+            elif name == "submit":
+                answers = [
+                    {"question_id": question["id"], "selected_option_ids": [rnd.choice(question["options"])["id"]]}
+                    for question in contents[test_id]["questions"]
+                ]
+                response = await client.post("/student/submit", headers=headers,
+                                             json={"test_id": test_id, "answers": answers})
+            elif name == "my_results":
+                response = await client.get("/student/my-results", params={"limit": 20}, headers=headers)
+            else:
+                response = await client.get(f"/student/results/{rnd.choice(results)}", headers=headers)
+            elapsed = time.perf_counter() - started
+
+            if response.status_code >= 400:
+                errors[name] += 1
+                continue
+            samples[name].append(elapsed)
+            if name == "submit" and response.json().get("result_id"):
+                results.append(response.json()["result_id"])
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(index) for index in range(args.clients)))
+    elapsed = time.monotonic() - started
+    after = await sql_series(client)
+
+    endpoints = {}
+    for name in names:
+        statements, sql_ms = sql_per_request(before, after, name)
+        endpoints[name] = {
+            "route": " ".join(ROUTES[name]),
+            "requests": len(samples[name]),
+            "errors": errors[name],
+            "requests_per_sec": round(len(samples[name]) / elapsed, 1),
+            **latency_summary(samples[name] or [0.0]),
+            "sql_statements_per_request": statements,
+            "sql_ms_per_request": sql_ms,
+        }
+    everything = [sample for values in samples.values() for sample in values]
+    return {
+        "duration_s": round(elapsed, 2),
+        "total": {
+            "requests": len(everything),
+            "errors": sum(errors.values()),
+            "requests_per_sec": round(len(everything) / elapsed, 1),
+            **latency_summary(everything or [0.0]),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def run_inprocess(args, database, students, owned):
+    # ASGI-вызовы без сети: видна стоимость самого приложения и БД
+    engine = make_engine(f"sqlite:///{database}")
+    app = bind_app(engine)
+
+    async def go():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await exam_day(client, args, AUTH_SECRET, students, owned)
+
+    try:
+        return asyncio.run(go())
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+def run_http(args, workdir, students, owned):
+    # Отдельный uvicorn над базой в workdir; переменные окружения бенчмарка передаются серверу
+    port = free_port()
+    server = start_server(workdir, port, {})
+    base_url = f"http://127.0.0.1:{port}"
+
+    async def go():
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            return await exam_day(client, args, BENCH_AUTH_SECRET, students, owned)
+
+    try:
+        wait_ready(base_url)
+        return asyncio.run(go())
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# --- Отчет ---
+
+def _git(*command):
+    try:
+        return subprocess.run(["git", *command], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "env": {key: value for key, value in os.environ.items()
+                if key in ("ASYNC_DB", "SQLITE_TUNING", "SUBMIT_QUEUE", "USE_STATS_SUMMARY", "RATE_LIMITING")},
+    }
+
+
+def _change(baseline, current):
+    change = None
+    if isinstance(baseline, (int, float)) and isinstance(current, (int, float)) and baseline:
+        change = round((current - baseline) / baseline * 100, 1)
+    return {"baseline": baseline, "current": current, "change_pct": change}
+
+
+def compare(baseline, report):
+    # Изменение ключевых показателей по маршрутам относительно сохраненного отчета
+    comparison = {"baseline_commit": baseline.get("meta", {}).get("commit")}
+    for transport in TRANSPORTS:
+        if transport not in baseline or transport not in report:
+            continue
+        comparison[transport] = {
+            name: {metric: _change(baseline[transport]["endpoints"][name].get(metric), current.get(metric))
+                   for metric in COMPARED}
+            for name, current in report[transport]["endpoints"].items()
+            if name in baseline[transport]["endpoints"]
+        }
+    return comparison
+
+
+def run(args):
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    template = prepare_template(args, workdir)
+    report = {"meta": {**environment(), "scale": {key: value for key, value in vars(args).items()
+                                                   if key not in ("output", "compare")}}}
+    for transport in args.transport:
+        database = fresh_database(workdir, template)
+        students, owned = load_population(database)
+        if transport == "inprocess":
+            report[transport] = run_inprocess(args, database, students, owned)
+        else:
+            report[transport] = run_http(args, workdir, students, owned)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            report["comparison"] = compare(json.load(baseline), report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exam-day API benchmark")
+    parser.add_argument("--transport", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS))
+    parser.add_argument("--workdir", default="bench-examday")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="operation weights, e.g. open=40,submit=30 (list, open, submit, my_results, detail)")
+    parser.add_argument("--teachers", type=int, default=5)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--tests", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=25)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from bench.common import latency_summary, make_engine
+from bench.seed import seed
+from security import issue_token
+
+# Нагрузочное сравнение синхронного и асинхронного режима БД (ASYNC_DB).
+# Для каждого режима поднимается отдельный uvicorn над одной и той же засеянной базой,
+# и несколько сотен параллельных клиентов вызывают /student/tests/{id} и /student/submit.
+# Запуск из backend/: python -m bench.load --clients 300 --duration 20
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Общий с сервером секрет: токены студентов выпускаются локально, без /auth/login
+BENCH_AUTH_SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, port, env_overrides):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, AUTH_SECRET=BENCH_AUTH_SECRET, **env_overrides)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/tests/?limit=1").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+def bearer(user_id, role):
+    return {"Authorization": f"Bearer {issue_token(user_id, role, secret=BENCH_AUTH_SECRET)}"}
+
+
+async def drive(base_url, clients, duration, submit_share, test_ids, student_ids, rnd):
+    headers = {student_id: bearer(student_id, "student") for student_id in student_ids}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        # Содержимое тестов для формирования ответов
+        contents = {}
+        for test_id in test_ids:
+            contents[test_id] = (await client.get(f"/student/tests/{test_id}")).json()
+
+        samples = {"open": [], "submit": []}
+        errors = {"open": 0, "submit": 0}
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            while time.monotonic() < deadline:
+                test_id = rnd.choice(test_ids)
+                started = time.perf_counter()
+                if rnd.random() < submit_share:
+                    kind = "submit"
+                    answers = [
+                        {"question_id": question["id"],
+                         "selected_option_ids": [rnd.choice(question["options"])["id"]]}
+                        for question in contents[test_id]["questions"]
+                    ]
+                    response = await client.post(
+                        "/student/submit",
+                        headers=headers[rnd.choice(student_ids)],
+                        json={"test_id": test_id, "answers": answers},
+                    )
+                else:
+                    kind = "open"
+                    response = await client.get(f"/student/tests/{test_id}")
+                if response.status_code >= 400:
+                    errors[kind] += 1
+                else:
+                    samples[kind].append(time.perf_counter() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.monotonic() - started
+
+    return {
+        kind: {"requests_per_sec": round(len(values) / elapsed, 1), "errors": errors[kind],
+               **latency_summary(values or [0.0])}
+        for kind, values in samples.items()
+    }
+
+
+def run_profiles(args, profiles):
+    # profiles: [(имя, переменные окружения сервера)]
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    template = os.path.join(workdir, "template.db")
+    if not os.path.exists(template):
+        engine = make_engine(f"sqlite:///{template}")
+        seed(engine, students=args.students, tests=args.tests,
+             questions=args.questions, options=args.options)
+        # В режиме WAL данные попадают в основной файл при закрытии последнего соединения
+        engine.dispose()
+
+    rnd = random.Random(args.seed)
+    test_ids = list(range(1, args.tests + 1))
+    student_ids = list(range(2, args.students + 2))  # id 1 - преподаватель из seed
+    report = {"scale": vars(args)}
+
+    for mode, env in profiles:
+        # Каждый профиль стартует с одинаковой копии базы
+        for suffix in ("", "-wal", "-shm"):
+            path = os.path.join(workdir, "database.db" + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.copyfile(template, os.path.join(workdir, "database.db"))
+        port = free_port()
+        server = start_server(workdir, port, env)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(base_url)
+            report[mode] = asyncio.run(drive(
+                base_url, args.clients, args.duration, args.submit_share, test_ids, student_ids, rnd
+            ))
+        finally:
+            server.terminate()
+            server.wait()
+
+    return report
+
+
+def run(args):
+    return run_profiles(args, [("sync", {"ASYNC_DB": "0"}), ("async", {"ASYNC_DB": "1"})])
+
+
+def add_arguments(parser):
+    parser.add_argument("--workdir", default="bench-load")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--submit-share", type=float, default=0.3)
+    parser.add_argument("--tests", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async database mode load benchmark")
+    add_arguments(parser)
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
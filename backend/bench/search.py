@@ -0,0 +1,119 @@
+import argparse
+import itertools
+import json
+import random
+import time
+from sqlalchemy.orm import sessionmaker
+from bench.common import temp_database_url, make_engine, make_client, latency_summary, measure
+from bench.seed import seed
+from config import AUTH_SECRET
+from content_writer import insert_tests
+from models import User
+from schemas import OptionCreate, QuestionCreate, TestCreate
+from search import index_tests
+from security import issue_token
+
+# Поиск /tests/search по банку с заданным числом вопросов: время ответа для редкого, обычного
+# и самого частого слова (как служебные слова языка), нескольких слов, основы слова,
+# короткого префикса, фильтра mine и второй страницы.
+# Тексты - случайные "слова" из слогов с распределением частот по закону Ципфа.
+# Запуск из backend/: python -m bench.search --tests 4000 --questions 25
+
+SYLLABLES = [
+    "ка", "ло", "ми", "ре", "ту", "на", "вер", "сти", "пол", "гра", "ник", "ост", "ма", "зе", "дан",
+    "бу", "жи", "про", "слу", "ван", "тор", "кри", "ше", "ю", "фа", "дру", "мос", "чи", "ль", "ся",
+]
+
+
+def make_vocabulary(rnd, size):
+    # Слова в порядке убывания частоты; частота не связана с алфавитным порядком
+    words = set()
+    while len(words) < size:
+        words.add("".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))))
+    vocabulary = sorted(words)
+    rnd.shuffle(vocabulary)
+    return vocabulary
+
+
+def fill_bank(engine, rnd, vocabulary, tests, questions, options, batch):
+    # Тесты пишутся тем же путем, что и импорт JSONL: insert_tests и index_tests пачками
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    session_factory = sessionmaker(bind=engine)
+
+    def phrase(words):
+        return " ".join(rnd.choices(vocabulary, cum_weights=cumulative, k=words))
+
+    db = session_factory()
+    try:
+        teacher_ids = [user_id for user_id, in db.query(User.id).filter(User.role == "teacher")]
+        for start in range(0, tests, batch):
+            chunk = [
+                TestCreate(title=phrase(3), description=phrase(8), questions=[
+                    QuestionCreate(question_text=phrase(12), options=[
+                        OptionCreate(option_text=phrase(3), is_correct=n == 0) for n in range(options)
+                    ])
+                    for _ in range(questions)
+                ])
+                for _ in range(min(batch, tests - start))
+            ]
+            teacher_id = teacher_ids[start // batch % len(teacher_ids)]
+            index_tests(db, insert_tests(db, chunk, teacher_id))
+            db.commit()
+        return teacher_ids
+    finally:
+        db.close()
+
+
+def run(tests, questions, options, vocabulary_size, repeat, seed_value):
+    rnd = random.Random(seed_value)
+    engine = make_engine(temp_database_url())
+    seed(engine, teachers=4, tests=0)
+    vocabulary = make_vocabulary(rnd, vocabulary_size)
+
+    started = time.perf_counter()
+    teacher_ids = fill_bank(engine, rnd, vocabulary, tests, questions, options, batch=200)
+    indexing_s = time.perf_counter() - started
+
+    client = make_client(engine)
+    headers = {"Authorization": f"Bearer {issue_token(teacher_ids[0], 'teacher', secret=AUTH_SECRET)}"}
+
+    def fetch(params):
+        response = client.get("/tests/search", params=params, headers=headers)
+        response.raise_for_status()
+        return len(response.json()), response.headers.get("X-Next-Cursor")
+
+    frequent, typical, rare = vocabulary[0], vocabulary[100], vocabulary[len(vocabulary) // 4]
+    _, cursor = fetch({"q": typical})
+    cases = {
+        "rare_word": {"q": rare},
+        "typical_word": {"q": typical},
+        "frequent_word": {"q": frequent},
+        "two_words": {"q": f"{typical} {vocabulary[50]}"},
+        "word_stem": {"q": typical[:max(3, len(typical) - 2)]},
+        "short_prefix": {"q": typical[:2]},
+        "mine": {"q": typical, "mine": "true"},
+        "second_page": {"q": typical, "cursor": cursor},
+    }
+    report = {"scale": {"tests": tests, "questions": tests * questions, "options_per_question": options,
+                        "vocabulary": vocabulary_size}, "indexing_s": round(indexing_s, 2)}
+    for name, params in cases.items():
+        (hits, _), samples = measure(lambda: fetch(params), repeat)
+        report[name] = {"q": params["q"], "hits": hits, **latency_summary(samples)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/tests/search benchmark")
+    parser.add_argument("--tests", type=int, default=4000)
+    parser.add_argument("--questions", type=int, default=25)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tests, args.questions, args.options, args.vocabulary, args.repeat, args.seed),
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main()
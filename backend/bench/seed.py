@@ -0,0 +1,123 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, func
+from models import User, Test, Question, Option, TestQuestion, TestResult, UserAnswer, UserAnswerOption
+from question_bank import content_hash
+import migrations
+
+# Синтетическая база для бенчмарков: масштаб задается параметрами,
+# вставка идет пакетами через executemany, без ORM-объектов.
+
+BATCH_SIZE = 5000
+
+
+def _insert_batches(conn, table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def seed(engine, teachers=1, students=0, tests=10, questions=10, options=4, attempts=0, random_seed=0):
+    rnd = random.Random(random_seed)
+    migrations.upgrade(engine)
+
+    with engine.begin() as conn:
+        _insert_batches(conn, User.__table__, [
+            {"username": f"teacher{i}", "password": "bench", "role": "teacher"} for i in range(teachers)
+        ] + [
+            {"username": f"student{i}", "password": "bench", "role": "student"} for i in range(students)
+        ])
+        teacher_ids = conn.execute(select(User.id).where(User.role == "teacher")).scalars().all()
+        student_ids = conn.execute(select(User.id).where(User.role == "student")).scalars().all()
+
+        created = datetime.utcnow()
+        _insert_batches(conn, Test.__table__, [
+            {
+                "title": f"Test {i}",
+                "description": f"Synthetic test {i}",
+                "teacher_id": teacher_ids[i % len(teacher_ids)],
+                "created_at": created,
+            }
+            for i in range(tests)
+        ])
+        test_ids = conn.execute(select(Test.id).order_by(Test.id)).scalars().all()
+
+        # Тексты вопросов разных тестов различаются: каждая ссылка теста - своя версия банка
+        contents = {
+            (test_id, n): (f"Question {n} of test {test_id}: what is {n} + {n}?",
+                           [(f"Answer {k}", k == 0) for k in range(options)])
+            for test_id in test_ids
+            for n in range(questions)
+        }
+        hashes = {place: content_hash(content) for place, content in contents.items()}
+        _insert_batches(conn, Question.__table__, [
+            {"content_hash": hashes[place], "question_text": content[0], "created_at": created}
+            for place, content in contents.items()
+        ])
+        version_ids = dict(conn.execute(select(Question.content_hash, Question.id)).all())
+
+        _insert_batches(conn, TestQuestion.__table__, [
+            {"test_id": test_id, "question_id": version_ids[hashes[test_id, n]], "position": n}
+            for test_id, n in contents
+        ])
+        _insert_batches(conn, Option.__table__, [
+            {"question_id": version_ids[hashes[place]], "option_text": text, "is_correct": correct, "position": k}
+            for place, content in contents.items()
+            for k, (text, correct) in enumerate(content[1])
+        ])
+
+        if attempts and student_ids:
+            seed_attempts(conn, rnd, student_ids, attempts)
+
+    return {"teachers": teachers, "students": students, "tests": tests,
+            "questions": tests * questions, "options": tests * questions * options,
+            "attempts": attempts}
+
+
+def seed_attempts(conn, rnd, student_ids, attempts):
+    # Попытки с равномерно случайными ответами и распределенными по времени датами
+    key = {}
+    for question_id, test_id, option_id, is_correct in conn.execute(
+        select(TestQuestion.question_id, TestQuestion.test_id, Option.id, Option.is_correct)
+        .join(Option, Option.question_id == TestQuestion.question_id)
+        .order_by(TestQuestion.test_id, TestQuestion.position, Option.id)
+    ):
+        question = key.setdefault(test_id, {}).setdefault(question_id, [[], set()])
+        question[0].append(option_id)
+        if is_correct:
+            question[1].add(option_id)
+
+    test_ids = sorted(key)
+    start = datetime.utcnow() - timedelta(days=180)
+    first_id = (conn.execute(select(func.max(TestResult.id))).scalar() or 0) + 1
+    answer_id = conn.execute(select(func.max(UserAnswer.id))).scalar() or 0
+
+    results, answers, selections = [], [], []
+    for n in range(attempts):
+        test_id = rnd.choice(test_ids)
+        score = 0
+        for question_id, (option_ids, correct) in key[test_id].items():
+            selected = rnd.choice(option_ids)
+            if {selected} == correct:
+                score += 1
+            answer_id += 1
+            answers.append({"id": answer_id, "result_id": first_id + n, "question_id": question_id})
+            selections.append({"user_answer_id": answer_id, "option_id": selected})
+        results.append({
+            "id": first_id + n,
+            "user_id": rnd.choice(student_ids),
+            "test_id": test_id,
+            "score": score,
+            "total_questions": len(key[test_id]),
+            "completed_at": start + timedelta(seconds=rnd.randrange(180 * 86400)),
+        })
+        if len(answers) >= BATCH_SIZE:
+            _flush_attempts(conn, results, answers, selections)
+            results, answers, selections = [], [], []
+
+    _flush_attempts(conn, results, answers, selections)
+
+
+def _flush_attempts(conn, results, answers, selections):
+    _insert_batches(conn, TestResult.__table__, results)
+    _insert_batches(conn, UserAnswer.__table__, answers)
+    _insert_batches(conn, UserAnswerOption.__table__, selections)
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import httpx
+from bench.common import make_engine
+from bench.load import bearer, free_port, start_server, wait_ready
+from bench.seed import seed
+
+# Потоковая выдача /teacher/results?stream=true при росте числа результатов:
+# время до первого байта, полное время и пиковая память (VmHWM) процесса сервера.
+# Для каждого масштаба поднимается отдельный uvicorn, чтобы пик памяти не накапливался.
+# Запуск из backend/: python -m bench.streaming --attempts 10000 50000 200000
+
+
+def peak_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return None
+
+
+def fetch(base_url, headers):
+    started = time.perf_counter()
+    first_byte, size = None, 0
+    with httpx.stream("GET", f"{base_url}/teacher/results", params={"stream": "true"},
+                      headers={**bearer(1, "teacher"), **headers}, timeout=600) as response:
+        response.raise_for_status()
+        for data in response.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(data)
+    return {"ttfb_ms": round(first_byte * 1000, 1), "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "payload_bytes": size}
+
+
+def run(args):
+    workdir = os.path.abspath(args.workdir)
+    report = {}
+    for attempts in args.attempts:
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        engine = make_engine(f"sqlite:///{os.path.join(workdir, 'database.db')}")
+        seed(engine, students=args.students, tests=args.tests, questions=args.questions, attempts=attempts)
+        engine.dispose()
+
+        port = free_port()
+        server = start_server(workdir, port, {})
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(base_url)
+            baseline = peak_rss_kb(server.pid)
+            report[attempts] = {
+                "json": fetch(base_url, {}),
+                "ndjson": fetch(base_url, {"Accept": "application/x-ndjson"}),
+                "server_rss_kb": {"before": baseline, "peak": peak_rss_kb(server.pid)},
+            }
+        finally:
+            server.terminate()
+            server.wait()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming results endpoint benchmark")
+    parser.add_argument("--attempts", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--tests", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--workdir", default="bench-streaming")
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import argparse
+import json
+from bench.load import add_arguments, run_profiles
+
+# Смешанная нагрузка чтение/отправка до и после профиля SQLite (WAL, synchronous=NORMAL,
+# mmap, cache_size, busy_timeout, явный пул): SQLITE_TUNING=0 против SQLITE_TUNING=1.
+# Запуск из backend/: python -m bench.tuning --clients 300 --duration 20 --submit-share 0.5
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite tuning profile benchmark")
+    add_arguments(parser)
+    parser.set_defaults(workdir="bench-load-tuning")
+    parser.add_argument("--async-db", action="store_true", help="run both profiles with ASYNC_DB=1")
+    args = parser.parse_args()
+    mode = {"ASYNC_DB": "1" if args.async_db else "0"}
+    profiles = [
+        ("default", {"SQLITE_TUNING": "0", **mode}),
+        ("tuned", {"SQLITE_TUNING": "1", **mode}),
+    ]
+    print(json.dumps(run_profiles(args, profiles), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import random
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from bench.common import temp_database_url, make_engine, make_client, latency_summary, measure
+from bench.seed import seed
+from config import AUTH_SECRET
+from models import Test, User
+from schemas import TestResponseStudent
+from security import issue_token
+from variants import build_canonical, get_canonical, render_variant
+
+# Варианты попыток: стоимость сборки одного варианта из закэшированной канонической
+# структуры (в микросекундах) против сериализации того же варианта через pydantic,
+# и время POST /student/tests/{id}/attempts и GET /student/attempts/{id} для класса студентов.
+# Запуск из backend/: python -m bench.variants --students 500 --questions 60 --per-attempt 25
+
+
+def per_variant_us(fn, count):
+    started = time.perf_counter()
+    for seed_value in range(count):
+        fn(seed_value)
+    return round((time.perf_counter() - started) / count * 1e6, 2)
+
+
+def run(students, questions, options, per_attempt):
+    engine = make_engine(temp_database_url())
+    seed(engine, students=students, tests=1, questions=questions, options=options)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE tests SET shuffle_questions = 1, shuffle_options = 1, questions_per_attempt = :size"
+        ), {"size": per_attempt})
+
+    db = sessionmaker(bind=engine)()
+    try:
+        test_id = db.query(Test.id).scalar()
+        student_ids = [user_id for user_id, in db.query(User.id).filter(User.role == "student")]
+        _, cold = measure(lambda: build_canonical(db, test_id), 5)
+        canonical = get_canonical(db, test_id)
+
+        # Тот же вариант через ORM-объекты и pydantic - как без канонической структуры
+        test = db.query(Test).filter(Test.id == test_id).first()
+
+        def pydantic_variant(seed_value):
+            rnd = random.Random(seed_value)
+            picked = rnd.sample(list(test.questions), per_attempt)
+            TestResponseStudent(id=test.id, title=test.title, description=test.description, questions=[
+                {"id": question.id, "question_text": question.question_text,
+                 "options": rnd.sample([{"id": option.id, "option_text": option.option_text}
+                                        for option in question.options], len(question.options))}
+                for question in picked
+            ]).model_dump_json()
+
+        report = {
+            "scale": {"students": students, "questions": questions, "options": options,
+                      "questions_per_attempt": per_attempt},
+            "canonical_build": latency_summary(cold),
+            "render_variant_us": per_variant_us(lambda seed_value: render_variant(canonical, 1, seed_value), students),
+            "pydantic_variant_us": per_variant_us(pydantic_variant, students),
+        }
+    finally:
+        db.close()
+
+    client = make_client(engine)
+    tokens = iter([{"Authorization": f"Bearer {issue_token(user_id, 'student', secret=AUTH_SECRET)}"}
+                   for user_id in student_ids])
+    attempts = []
+
+    def start():
+        response = client.post(f"/student/tests/{test_id}/attempts", headers=next(tokens))
+        response.raise_for_status()
+        attempts.append((response.request.headers["Authorization"], response.json()["attempt_id"]))
+
+    _, samples = measure(start, students)
+    report["start_attempt"] = latency_summary(samples)
+
+    resumed = iter(attempts)
+
+    def resume():
+        authorization, attempt_id = next(resumed)
+        client.get(f"/student/attempts/{attempt_id}", headers={"Authorization": authorization}).raise_for_status()
+
+    _, samples = measure(resume, students)
+    report["get_attempt"] = latency_summary(samples)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-attempt test variants benchmark")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--per-attempt", type=int, default=25)
+    args = parser.parse_args()
+    print(json.dumps(run(args.students, args.questions, args.options, args.per_attempt), indent=2))
+
+
+if __name__ == "__main__":
+    main()
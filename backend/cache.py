@@ -0,0 +1,169 @@
+import json
+import os
+import pickle
+import sqlite3
+from collections import OrderedDict
+from threading import Lock, local
+from time import monotonic, time
+from typing import Any, Callable, Hashable, Optional
+from config import CACHE_BACKEND, CACHE_SQLITE_PATH
+
+# Кэши приложения создаются через make_cache и имеют общий интерфейс:
+# get / put / invalidate / invalidate_where / clear.
+#   local  - LRU в памяти процесса (быстрее всего; при нескольких воркерах устаревшие
+#            записи сбрасываются через шину инвалидации, см. invalidation.py)
+#   sqlite - общий для всех воркеров файл SQLite (CACHE_SQLITE_PATH) - локальная замена
+#            внешнего кэша; запись, удаленная одним воркером, исчезает для всех сразу
+
+
+# Потокобезопасный LRU-кэш с ограничением по числу записей
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# LRU-кэш, записи которого дополнительно устаревают через ttl секунд
+class TTLCache(LRUCache):
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = super().get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= monotonic():
+            self.invalidate(key)
+            return None
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        super().put(key, (monotonic() + self.ttl, value))
+
+
+class SQLiteCache:
+    # Общий кэш в файле SQLite: значения сериализуются pickle, ключи - JSON.
+    # Вытеснение по порядку записи (FIFO): обновлять время обращения при каждом чтении -
+    # это запись в общий файл на каждый запрос
+    PRUNE_EVERY = 100
+
+    def __init__(self, namespace: str, maxsize: int, ttl: Optional[float] = None, path: str = CACHE_SQLITE_PATH):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self._local = local()
+        self._puts = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение на поток: sqlite3 не разрешает использовать соединение из разных потоков
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _encode(key: Hashable) -> str:
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    @staticmethod
+    def _decode(key: str) -> Hashable:
+        value = json.loads(key)
+        return tuple(value) if isinstance(value, list) else value
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, self._encode(key)),
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time():
+            self.invalidate(key)
+            return None
+        return pickle.loads(value)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, self._encode(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             time() + self.ttl if self.ttl else None),
+        )
+        self._puts += 1
+        if self._puts % self.PRUNE_EVERY == 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND rowid NOT IN ("
+                " SELECT rowid FROM cache_entries WHERE namespace = ? ORDER BY rowid DESC LIMIT ?)",
+                (self.namespace, self.namespace, self.maxsize),
+            )
+
+    def invalidate(self, key: Hashable) -> None:
+        self._connection().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, self._encode(key))
+        )
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        conn = self._connection()
+        keys = [key for key, in conn.execute("SELECT key FROM cache_entries WHERE namespace = ?", (self.namespace,))]
+        doomed = [(self.namespace, key) for key in keys if predicate(self._decode(key))]
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", doomed)
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+def make_cache(namespace: str, maxsize: int, ttl: Optional[float] = None, backend: str = CACHE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteCache(namespace, maxsize, ttl)
+    if backend != "local":
+        raise ValueError(f"Unknown cache backend: {backend!r}")
+    return TTLCache(maxsize, ttl) if ttl else LRUCache(maxsize)
@@ -0,0 +1,169 @@
+import os
+import secrets
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Подключение к БД: sqlite:///... или postgresql://...
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
+
+# Пул соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Профиль SQLite для продакшена: PRAGMA выполняются на каждом новом соединении.
+# SQLITE_TUNING=0 оставляет настройки SQLite по умолчанию (rollback journal, FULL)
+SQLITE_TUNING = env_flag("SQLITE_TUNING", True)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Схема БД создается и обновляется миграциями (python migrate.py upgrade) до запуска серверов;
+# при старте процесс только проверяет версию схемы. MIGRATE_ON_STARTUP=1 применяет
+# недостающие миграции при старте (удобно для разработки; безопасно и при нескольких воркерах)
+MIGRATE_ON_STARTUP = env_flag("MIGRATE_ON_STARTUP")
+
+# Асинхронный режим БД: AsyncSession поверх aiosqlite / asyncpg вместо пула потоков
+ASYNC_DB = env_flag("ASYNC_DB")
+
+# Читать статистику из инкрементальной таблицы test_score_summary
+# вместо агрегации по test_results (перед включением: python maintenance.py rebuild-stats)
+USE_STATS_SUMMARY = env_flag("USE_STATS_SUMMARY")
+
+# Порог (в процентах), начиная с которого попытка считается сданной
+PASS_THRESHOLD = float(os.getenv("PASS_THRESHOLD", "50"))
+
+# Хранилище кэшей (ключи ответов, снимки тестов, пользователи):
+# local - память процесса, sqlite - общий для воркеров файл CACHE_SQLITE_PATH
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "./cache.db")
+
+# Шина инвалидации для нескольких воркеров: изменения тестов записываются в таблицу
+# cache_invalidations в той же транзакции, каждый процесс раз в CACHE_BUS_INTERVAL_MS
+# читает новые события и сбрасывает свои локальные кэши. Если опрос не удается дольше
+# CACHE_BUS_MAX_STALENESS секунд, локальные кэши очищаются целиком
+CACHE_BUS = env_flag("CACHE_BUS")
+CACHE_BUS_INTERVAL_MS = float(os.getenv("CACHE_BUS_INTERVAL_MS", "500"))
+CACHE_BUS_MAX_STALENESS = float(os.getenv("CACHE_BUS_MAX_STALENESS", "5"))
+# Сколько секунд хранятся события шины
+CACHE_BUS_RETENTION = float(os.getenv("CACHE_BUS_RETENTION", "3600"))
+
+# Число готовых JSON-снимков тестов в памяти процесса
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "512"))
+
+# Дополнительно сохранять снимки в таблицу test_snapshots (переживают рестарт)
+PERSIST_TEST_SNAPSHOTS = env_flag("PERSIST_TEST_SNAPSHOTS")
+
+# Сколько тестов из JSON Lines записывается в одной транзакции при импорте
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "100"))
+MAX_IMPORT_CHUNK_SIZE = 1000
+
+# Отложенная запись отправленных тестов: балл возвращается сразу, результат и ответы
+# записываются фоновым потоком пачками (одна транзакция на пачку).
+# Принятые, но еще не записанные попытки дописываются при штатной остановке,
+# при аварийном завершении процесса они теряются
+SUBMIT_QUEUE = env_flag("SUBMIT_QUEUE")
+SUBMIT_BATCH_SIZE = int(os.getenv("SUBMIT_BATCH_SIZE", "200"))
+SUBMIT_FLUSH_INTERVAL_MS = float(os.getenv("SUBMIT_FLUSH_INTERVAL_MS", "50"))
+# При переполнении очереди попытка записывается синхронно, как без SUBMIT_QUEUE
+SUBMIT_QUEUE_MAX = int(os.getenv("SUBMIT_QUEUE_MAX", "10000"))
+
+# Автосохранение ответов незавершенных попыток: изменения копятся в памяти процесса
+# (последний ответ на вопрос побеждает) и записываются раз в AUTOSAVE_FLUSH_INTERVAL_MS -
+# не больше одной записи строки попытки за интервал, транзакции по AUTOSAVE_BATCH_SIZE попыток.
+# При аварийном завершении теряются изменения последнего интервала.
+# AUTOSAVE_COALESCE=0 - каждое изменение записывается сразу
+AUTOSAVE_COALESCE = env_flag("AUTOSAVE_COALESCE", True)
+AUTOSAVE_FLUSH_INTERVAL_MS = float(os.getenv("AUTOSAVE_FLUSH_INTERVAL_MS", "2000"))
+AUTOSAVE_BATCH_SIZE = int(os.getenv("AUTOSAVE_BATCH_SIZE", "500"))
+# Сколько попыток может ждать записи; изменения новых попыток сверх этого пишутся сразу
+AUTOSAVE_MAX_PENDING = int(os.getenv("AUTOSAVE_MAX_PENDING", "20000"))
+
+# Строк в одной порции чтения при выгрузке /teacher/export
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+def persistent_secret(path: str) -> str:
+    # Секрет из файла; при первом запуске файл создается атомарно (os.link не перезаписывает
+    # файл, уже созданный другим воркером), так что все процессы получают один и тот же секрет
+    if not os.path.exists(path):
+        temp = f"{path}.{os.getpid()}.tmp"
+        descriptor = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as file:
+            file.write(secrets.token_urlsafe(32))
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp)
+    with open(path) as file:
+        secret = file.read().strip()
+    if not secret:
+        raise RuntimeError(f"Auth secret file {path} is empty")
+    return secret
+
+
+# Аутентификация: подписанные HMAC-SHA256 токены доступа.
+# AUTH_SECRET должен быть общим для всех процессов сервера. Без него секрет генерируется
+# один раз и хранится в AUTH_SECRET_FILE: его читают все воркеры машины и следующие запуски.
+# Серверам на разных машинах нужен общий AUTH_SECRET
+AUTH_SECRET_FILE = os.getenv("AUTH_SECRET_FILE", "./auth_secret")
+AUTH_SECRET = os.getenv("AUTH_SECRET") or persistent_secret(AUTH_SECRET_FILE)
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", str(12 * 3600)))
+
+# Кэш пользователей по id для проверки токена без запроса к БД; после изменения
+# пользователя старые данные живут в кэше не дольше PRINCIPAL_CACHE_TTL секунд
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+# PBKDF2-HMAC-SHA256: число итераций (рекомендация OWASP на 2023 год).
+# Хеши с меньшим числом итераций и пароли в открытом виде обновляются при входе
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "600000"))
+
+# Переходный режим для старых клиентов: без токена пользователь берется
+# из параметра teacher_id / student_id, как раньше (небезопасно)
+ALLOW_ID_PARAMS = env_flag("ALLOW_ID_PARAMS")
+
+# Ограничение нагрузки (пиковые часы экзаменов): маркерные ведра на пользователя
+# (или IP без токена, лимит anonymous) и на всю группу маршрутов, плюс лимит одновременных запросов
+# группы с короткой ограниченной очередью. При перегрузке - быстрый 429 / 503 с Retry-After
+RATE_LIMITING = env_flag("RATE_LIMITING")
+# Значения по умолчанию: "user=<в секунду>:<запас>,anonymous=<в секунду>:<запас>,global=<в секунду>:<запас>,
+# concurrency=N,queue=N"; без anonymous запросы без токена ограничиваются по IP лимитом user.
+# Переопределяются переменными RATE_LIMIT_AUTH, RATE_LIMIT_TESTS и т.д. (можно частично),
+# 0 отключает соответствующее ограничение
+RATE_LIMIT_DEFAULTS = {
+    # Вход и регистрация - PBKDF2 нагружает CPU, лимит по IP защищает и от перебора паролей;
+    # запас anonymous - на класс за одним NAT, входящий в начале урока
+    "auth": "user=1:5,anonymous=5:40,global=20:40,concurrency=4,queue=16",
+    "tests": "user=10:30,global=200:400,concurrency=16,queue=64",
+    # Запросы без токена (каталог и тест до входа) - на весь класс за одним NAT
+    "student": "user=5:20,anonymous=100:400,global=500:1000,concurrency=32,queue=256",
+    "teacher": "user=10:30,global=100:200,concurrency=8,queue=32",
+}
+RATE_LIMITS = {group: os.getenv(f"RATE_LIMIT_{group.upper()}", "") for group in RATE_LIMIT_DEFAULTS}
+# Сколько запрос может ждать места в очереди, прежде чем получить 503
+RATE_LIMIT_QUEUE_TIMEOUT = float(os.getenv("RATE_LIMIT_QUEUE_TIMEOUT", "2"))
+# Число отслеживаемых пользователей / IP (давно не обращавшиеся вытесняются)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Метрики запросов: гистограммы длительности и числа SQL-запросов по маршрутам (/metrics)
+REQUEST_METRICS = env_flag("REQUEST_METRICS", True)
+# Журнал медленных запросов: запросы дольше SLOW_REQUEST_MS (0 - выключен) пишутся
+# в логгер "slow_requests" вместе с выполненным SQL (одинаковые запросы сгруппированы)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# Сколько разных SQL-запросов показывать в одной записи журнала
+SLOW_REQUEST_MAX_STATEMENTS = int(os.getenv("SLOW_REQUEST_MAX_STATEMENTS", "20"))
+
+# Полнотекстовый поиск /tests/search: совпадения ранжируются bm25, пока их не больше
+# SEARCH_MAX_RANKED; по более общим запросам (частые слова, короткие префиксы) оценка
+# всех совпадений заняла бы сотни миллисекунд - они выдаются от новых документов к старым
+SEARCH_MAX_RANKED = int(os.getenv("SEARCH_MAX_RANKED", "10000"))
@@ -0,0 +1,119 @@
+from typing import List, Tuple
+from fastapi import HTTPException
+from sqlalchemy import insert, update, delete
+from sqlalchemy.orm import Session
+from models import Test, Question, Option, TestQuestion
+from question_bank import content_of, link_questions, store_questions
+from queries import bank_questions
+from schemas import QuestionCreate, QuestionUpdate, TestCreate
+
+# Запись содержимого тестов. Вопросы теста - ссылки на версии из банка (question_bank):
+# версии всей пачки ищутся по хешу одним запросом, недостающие вставляются пакетно,
+# затем пакетно вставляются ссылки test_questions. position задает порядок вопросов в тесте.
+
+
+def _check_unique(question_ids: List[int]) -> None:
+    # Одна версия вопроса входит в тест один раз: ответы и статистика привязаны к question_id
+    if len(set(question_ids)) != len(question_ids):
+        raise HTTPException(status_code=400, detail="Duplicate question in test")
+
+
+def insert_question_sets(db: Session, question_sets: List[Tuple[int, List[QuestionCreate]]]) -> List[List[int]]:
+    # Вопросы нескольких тестов: версии и ссылки пакетно; возвращает id вопросов по каждому тесту
+    version_ids = iter(store_questions(db, [
+        content_of(question) for _, questions in question_sets for question in questions
+    ]))
+    result, links = [], []
+    for test_id, questions in question_sets:
+        question_ids = [next(version_ids) for _ in questions]
+        _check_unique(question_ids)
+        links.extend((test_id, question_id, position) for position, question_id in enumerate(question_ids))
+        result.append(question_ids)
+    link_questions(db, links)
+    return result
+
+
+def insert_questions(db: Session, test_id: int, questions: List[QuestionCreate]) -> List[int]:
+    return insert_question_sets(db, [(test_id, questions)])[0]
+
+
+def insert_tests(db: Session, tests: List[TestCreate], teacher_id: int) -> List[int]:
+    # Пачка тестов: строки тестов по одной (нужны их id), версии вопросов и ссылки всей пачки -
+    # пакетными запросами. Коммит делает вызывающий код
+    test_ids = [
+        db.execute(
+            insert(Test).values(
+                title=test.title,
+                description=test.description,
+                teacher_id=teacher_id,
+                shuffle_questions=test.shuffle_questions,
+                shuffle_options=test.shuffle_options,
+                questions_per_attempt=test.questions_per_attempt,
+            )
+        ).inserted_primary_key[0]
+        for test in tests
+    ]
+    insert_question_sets(db, [(test_id, test.questions) for test_id, test in zip(test_ids, tests)])
+    return test_ids
+
+
+def apply_question_diff(db: Session, test_id: int, questions: List[QuestionUpdate], teacher_id: int) -> dict:
+    # Новый список вопросов теста. Вопрос с содержимым сводится к версии с тем же хешем
+    # (неизмененный вопрос остается той же версией с теми же id вариантов), вопрос только
+    # с id - ссылка на версию из банка этого преподавателя (версии, входящие в его тесты);
+    # чужие версии для ссылки не видны, как и неизвестные. Меняются лишь ссылки test_questions:
+    # вставка, удаление и UPDATE позиций; сами версии не изменяются никогда.
+    current = dict(
+        db.query(TestQuestion.question_id, TestQuestion.position).filter(TestQuestion.test_id == test_id)
+    )
+    current_options = dict(
+        db.query(Option.id, Option.question_id).filter(Option.question_id.in_(list(current)))
+    ) if current else {}
+
+    references = {question.id for question in questions if question.question_text is None}
+    known = {
+        row.id for row in bank_questions(db, teacher_id).filter(Question.id.in_(references - set(current)))
+    } if references - set(current) else set()
+
+    edited = []
+    for question in questions:
+        if question.question_text is None:
+            if question.id not in current and question.id not in known:
+                raise HTTPException(status_code=400, detail=f"Unknown question id {question.id}")
+            continue
+        if question.id is not None:
+            if question.id not in current:
+                raise HTTPException(status_code=400, detail=f"Unknown question id {question.id}")
+            for option in question.options:
+                if option.id is not None and current_options.get(option.id) != question.id:
+                    raise HTTPException(status_code=400, detail=f"Unknown option id {option.id}")
+        edited.append(question)
+
+    stored = iter(store_questions(db, [content_of(question) for question in edited]))
+    question_ids = [
+        question.id if question.question_text is None else next(stored)
+        for question in questions
+    ]
+    _check_unique(question_ids)
+
+    positions = {question_id: position for position, question_id in enumerate(question_ids)}
+    removed = [question_id for question_id in current if question_id not in positions]
+    added = [(test_id, question_id, position) for question_id, position in positions.items() if question_id not in current]
+    moved = [
+        {"test_id": test_id, "question_id": question_id, "position": position}
+        for question_id, position in positions.items()
+        if question_id in current and current[question_id] != position
+    ]
+
+    if removed:
+        db.execute(delete(TestQuestion).where(TestQuestion.test_id == test_id, TestQuestion.question_id.in_(removed)))
+    if moved:
+        db.execute(update(TestQuestion), moved)
+    link_questions(db, added)
+
+    return {
+        "questions_added": len(added),
+        "questions_removed": len(removed),
+        "questions_moved": len(moved),
+        "questions_kept": len(positions) - len(added),
+    }
@@ -1,20 +1,189 @@
-from sqlalchemy import create_engine
+import threading
+from contextlib import contextmanager
+from fastapi.concurrency import run_in_threadpool
+from typing import Union
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import config
+from config import ASYNC_DB, REQUEST_METRICS
+from instrumentation import install_query_hooks
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./database.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def sqlite_pragmas() -> dict:
+    return {
+        "journal_mode": config.SQLITE_JOURNAL_MODE,
+        "synchronous": config.SQLITE_SYNCHRONOUS,
+        "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+        # Отрицательное значение cache_size - размер в KiB, а не в страницах
+        "cache_size": -config.SQLITE_CACHE_SIZE_KB,
+        "mmap_size": config.SQLITE_MMAP_SIZE,
+    }
+
+
+def install_sqlite_pragmas(sync_engine) -> None:
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def engine_options(url: str) -> dict:
+    # SQLite в памяти живет в одном соединении, явный пул для него не задается
+    if is_sqlite(url) and ":memory:" in url:
+        return {}
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_pre_ping": not is_sqlite(url),
+    }
+
+
+def create_db_engine(url: str = None):
+    # Фабрика движка по настройкам из config (переменные окружения)
+    url = url or SQLALCHEMY_DATABASE_URL
+    connect_args = {"check_same_thread": False} if is_sqlite(url) else {}
+    db_engine = create_engine(url, connect_args=connect_args, **engine_options(url))
+    if is_sqlite(url) and config.SQLITE_TUNING:
+        install_sqlite_pragmas(db_engine)
+    if REQUEST_METRICS:
+        install_query_hooks(db_engine)
+    return db_engine
+
+
+class LazySessionmaker(sessionmaker):
+    # Фабрика сессий, которая привязывается к движку при открытии первой сессии
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Асинхронные драйверы для тех же баз
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+def make_async_sessionmaker(url: str):
+    # Импорт внутри функции: aiosqlite / asyncpg нужны только в асинхронном режиме
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(async_url(url), **engine_options(url))
+    if is_sqlite(url) and config.SQLITE_TUNING:
+        install_sqlite_pragmas(async_engine.sync_engine)
+    if REQUEST_METRICS:
+        install_query_hooks(async_engine.sync_engine)
+    return async_engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=True)
+
+
+# Движки создаются при первом обращении, а не при импорте: импорт приложения,
+# миграций или служебных команд не открывает соединений с БД
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _lazy(name: str, factory):
+    if name not in _engines:
+        with _engines_lock:
+            if name not in _engines:
+                _engines[name] = factory()
+    return _engines[name]
+
+
+def get_engine():
+    return _lazy("sync", create_db_engine)
+
+
+def get_async_sessionmaker():
+    return _lazy("async", lambda: make_async_sessionmaker(SQLALCHEMY_DATABASE_URL))[1]
+
+
+def get_async_engine():
+    return _lazy("async", lambda: make_async_sessionmaker(SQLALCHEMY_DATABASE_URL))[0]
+
+
+async def dispose_engines():
+    with _engines_lock:
+        engines = dict(_engines)
+        _engines.clear()
+    if "sync" in engines:
+        await run_in_threadpool(engines["sync"].dispose)
+    if "async" in engines:
+        await engines["async"][0].dispose()
+
+
+class SyncSessionRunner:
+    # Интерфейс AsyncSession.run_sync поверх обычной Session:
+    # синхронная работа с БД выполняется в пуле потоков и не блокирует event loop
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.session.close)
+
+
+# Тип зависимости get_db: у обоих вариантов есть run_sync
+Database = Union[AsyncSession, SyncSessionRunner]
+
+
+def supports_bulk_returning(db) -> bool:
+    # INSERT ... RETURNING для executemany (SQLite 3.35+, PostgreSQL)
+    return getattr(db.get_bind().dialect, "insert_executemany_returning", False)
+
+
+async def get_db():
+    # Маршруты работают с БД через `await db.run_sync(fn, ...)`, где fn(session, ...) -
+    # обычный синхронный код SQLAlchemy. В асинхронном режиме run_sync выполняет его
+    # поверх асинхронного драйвера, в синхронном - в пуле потоков.
+    if ASYNC_DB:
+        async with get_async_sessionmaker()() as session:
+            yield session
+        return
+
+    db = SyncSessionRunner(SessionLocal())
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+
+@contextmanager
+def count_queries(bind=None):
+    # Подсчет SQL-запросов внутри блока (для проверки отсутствия N+1)
+    bind = bind or (get_async_engine().sync_engine if ASYNC_DB else get_engine())
+    counter = {"count": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["count"] += 1
+
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
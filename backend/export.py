@@ -0,0 +1,225 @@
+import csv
+import io
+from typing import Iterator, List, Optional
+from sqlalchemy import select
+from database import SessionLocal
+from config import EXPORT_CHUNK_SIZE
+from models import TestResult, UserAnswer, UserAnswerOption
+from queries import results_with_refs, ResultFilters
+from answer_store import legacy_option_ids
+
+# Выгрузка результатов для отчетов: строки читаются из БД порциями (yield_per)
+# в виде кортежей колонок, без ORM-объектов и Pydantic-моделей, и сразу пишутся в ответ.
+# Память ограничена размером порции, а не числом результатов.
+# Arrow / Parquet требуют pyarrow, распределение баллов считается через NumPy, если он установлен.
+
+RESULT_COLUMNS = [
+    "result_id", "user_id", "test_id", "score", "total_questions",
+    "completed_at", "username", "test_title", "percentage",
+]
+ANSWER_COLUMNS = ["answer_id", "result_id", "question_id", "selected_option_ids"]
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def partitions(session, statement) -> Iterator[list]:
+    # Порции строк через серверный курсор (для SQLite - постепенный fetchmany)
+    result = session.execute(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    for partition in result.partitions():
+        yield partition
+
+
+def result_chunks(filters: ResultFilters) -> Iterator[List[tuple]]:
+    # Отдельная сессия: выгрузка продолжается после возврата из обработчика запроса
+    session = SessionLocal()
+    try:
+        query = filters.apply(results_with_refs(session)).order_by(TestResult.id)
+        for rows in partitions(session, query.statement):
+            yield [
+                (*row, round(row.score / row.total_questions * 100, 2) if row.total_questions else 0.0)
+                for row in rows
+            ]
+    finally:
+        session.close()
+
+
+def answer_chunks(filters: ResultFilters) -> Iterator[List[tuple]]:
+    # Одна строка на ответ: выбранные варианты склеиваются через ";"
+    session = SessionLocal()
+    try:
+        statement = filters.apply(
+            select(UserAnswer.id, UserAnswer.result_id, UserAnswer.question_id,
+                   UserAnswer.selected_options, UserAnswerOption.option_id)
+            .join(TestResult, TestResult.id == UserAnswer.result_id)
+            .outerjoin(UserAnswerOption, UserAnswerOption.user_answer_id == UserAnswer.id)
+        ).order_by(UserAnswer.id, UserAnswerOption.option_id)
+
+        current, options = None, []
+        for rows in partitions(session, statement):
+            chunk = []
+            for answer_id, result_id, question_id, legacy_json, option_id in rows:
+                if current is not None and current[0] != answer_id:
+                    chunk.append((*current, ";".join(options)))
+                    options = []
+                current = (answer_id, result_id, question_id)
+                if option_id is not None:
+                    options.append(str(option_id))
+                elif legacy_json:
+                    # Еще не перенесенные из JSON ответы (maintenance.py migrate-answers)
+                    options.extend(str(legacy_id) for legacy_id in sorted(legacy_option_ids(legacy_json)))
+            if chunk:
+                yield chunk
+        if current is not None:
+            yield [(*current, ";".join(options))]
+    finally:
+        session.close()
+
+
+def iter_csv(columns: List[str], chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Файлоподобный приемник для pyarrow: записанные байты забираются после каждой порции
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _arrow_schema(pa, answers: bool):
+    # Явная схема: порции с одними NULL в колонке не меняют ее тип, пустая выгрузка остается валидной
+    if answers:
+        return pa.schema([
+            ("answer_id", pa.int64()), ("result_id", pa.int64()),
+            ("question_id", pa.int64()), ("selected_option_ids", pa.string()),
+        ])
+    return pa.schema([
+        ("result_id", pa.int64()), ("user_id", pa.int64()), ("test_id", pa.int64()),
+        ("score", pa.int64()), ("total_questions", pa.int64()),
+        ("completed_at", pa.timestamp("us")), ("username", pa.string()),
+        ("test_title", pa.string()), ("percentage", pa.float64()),
+    ])
+
+
+def iter_arrow(answers: bool, chunks: Iterator[List[tuple]], parquet: bool) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa, answers)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if parquet else pa.ipc.new_stream(sink, schema)
+    for rows in chunks:
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+            schema=schema,
+        )
+        if parquet:
+            # Одна порция - одна группа строк Parquet
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def iter_export(fmt: str, answers: bool, filters: ResultFilters) -> Iterator[bytes]:
+    chunks = answer_chunks(filters) if answers else result_chunks(filters)
+    if fmt == "csv":
+        return iter_csv(ANSWER_COLUMNS if answers else RESULT_COLUMNS, chunks)
+    return iter_arrow(answers, chunks, parquet=fmt == "parquet")
+
+
+def _histogram_percentile(counts: List[int], total: int, q: float) -> Optional[float]:
+    # Перцентиль по гистограмме целых процентов 0..100
+    if not total:
+        return None
+    target = q * (total - 1)
+    seen = 0
+    for percent, count in enumerate(counts):
+        seen += count
+        if target < seen:
+            return float(percent)
+    return 100.0
+
+
+def score_distribution(filters: ResultFilters) -> dict:
+    # Распределение процентов по всем отфильтрованным попыткам за один проход по порциям:
+    # копится гистограмма из 101 ячейки (целые проценты), память не зависит от числа строк
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    counts = [0] * 101
+    attempts, percentage_sum = 0, 0.0
+    session = SessionLocal()
+    try:
+        statement = filters.apply(select(TestResult.score, TestResult.total_questions)).order_by(TestResult.id)
+        for rows in partitions(session, statement):
+            if np is not None:
+                columns = np.array(rows, dtype=float).reshape(-1, 2)
+                scores, totals = columns[:, 0], columns[:, 1]
+                percentages = np.divide(scores * 100, totals, out=np.zeros_like(scores), where=totals > 0)
+                percentages = np.clip(percentages, 0, 100)
+                counts = (np.asarray(counts) + np.bincount(np.floor(percentages).astype(int), minlength=101)).tolist()
+                percentage_sum += float(percentages.sum())
+            else:
+                for score, total in rows:
+                    percentage = min(max(score * 100 / total, 0), 100) if total else 0.0
+                    counts[int(percentage)] += 1
+                    percentage_sum += percentage
+            attempts += len(rows)
+    finally:
+        session.close()
+
+    # Ячейки по 10%: [0, 10), [10, 20), ... , [90, 100]
+    buckets = [sum(counts[start:start + 10]) for start in range(0, 90, 10)] + [sum(counts[90:])]
+    return {
+        "attempts": attempts,
+        "avg_percentage": round(percentage_sum / attempts, 2) if attempts else 0,
+        "median_percentage": _histogram_percentile(counts, attempts, 0.5),
+        "p90_percentage": _histogram_percentile(counts, attempts, 0.9),
+        "histogram": [
+            {"from": start, "to": start + 10, "attempts": count}
+            for start, count in zip(range(0, 100, 10), buckets)
+        ],
+    }
@@ -0,0 +1,134 @@
+import logging
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+from sqlalchemy import event
+from config import SLOW_REQUEST_MS, SLOW_REQUEST_MAX_STATEMENTS
+import metrics
+
+# Инструментирование: длительность запросов по маршрутам и SQL, выполненный во время запроса.
+# Статистика SQL текущего запроса лежит в contextvar - run_in_threadpool и run_sync
+# копируют контекст, поэтому запросы из пула потоков и асинхронного драйвера попадают в нее же.
+# Запросы вне HTTP (фоновая запись, maintenance.py) учитываются только в общих счетчиках.
+
+slow_request_log = logging.getLogger("slow_requests")
+
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+statements_total = metrics.counter("db_statements_total", "SQL statements executed")
+statement_seconds = metrics.histogram("db_statement_seconds", "SQL statement execution time")
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self, capture: bool):
+        self.count = 0
+        self.seconds = 0.0
+        # SQL -> [число выполнений, суммарное время]; только для журнала медленных запросов
+        self.statements: Optional[Dict[str, list]] = {} if capture else None
+
+
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+def install_query_hooks(sync_engine) -> None:
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Контекст выполнения свой у каждого запроса; при ошибке он просто отбрасывается
+        context._instrumentation_started = perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - context._instrumentation_started
+        statements_total.inc()
+        statement_seconds.observe(elapsed)
+        stats = current_query_stats.get()
+        if stats is None:
+            return
+        stats.count += 1
+        stats.seconds += elapsed
+        if stats.statements is not None:
+            entry = stats.statements.setdefault(statement, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+
+class RouteMetrics:
+    __slots__ = ("labels", "requests", "duration", "sql_count", "sql_seconds")
+
+    def __init__(self, method: str, route: str):
+        labels = self.labels = {"method": method, "route": route}
+        self.requests = {}
+        self.duration = metrics.histogram("http_request_duration_seconds", "Request latency", labels=labels)
+        self.sql_count = metrics.histogram("http_request_sql_statements", "SQL statements per request",
+                                           SQL_COUNT_BUCKETS, labels)
+        self.sql_seconds = metrics.histogram("http_request_sql_seconds", "SQL time per request", labels=labels)
+
+    def count(self, status: int) -> None:
+        counter = self.requests.get(status)
+        if counter is None:
+            counter = self.requests[status] = metrics.counter(
+                "http_requests_total", "Completed requests", {**self.labels, "status": str(status)},
+            )
+        counter.inc()
+
+
+def log_slow_request(method: str, path: str, status: int, elapsed: float, stats: QueryStats) -> None:
+    top = sorted(stats.statements.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_REQUEST_MAX_STATEMENTS]
+    lines = [
+        f"{method} {path} -> {status} in {elapsed * 1000:.1f} ms, "
+        f"{stats.count} SQL statements in {stats.seconds * 1000:.1f} ms"
+    ]
+    lines.extend(
+        f"  {count:>4} x {seconds * 1000:8.1f} ms  {' '.join(statement.split())}"
+        for statement, (count, seconds) in top
+    )
+    slow_request_log.warning("\n".join(lines))
+
+
+class RequestMetricsMiddleware:
+    # ASGI-middleware: время запроса до конца отправки ответа (включая потоковые),
+    # статус и SQL по шаблону маршрута ("/tests/{test_id}"), а не по фактическому пути
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_threshold = slow_request_ms / 1000 if slow_request_ms > 0 else None
+        self.routes: Dict[tuple, RouteMetrics] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(capture=self.slow_threshold is not None)
+        token = current_query_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - started
+            current_query_stats.reset(token)
+            self.record(scope, status, elapsed, stats)
+
+    def record(self, scope, status: int, elapsed: float, stats: QueryStats) -> None:
+        method = scope["method"]
+        route = scope.get("route")
+        # Несуществующие пути - одной меткой, чтобы не плодить ряды метрик
+        template = getattr(route, "path", None) or "unmatched"
+        route_metrics = self.routes.get((method, template))
+        if route_metrics is None:
+            route_metrics = self.routes[(method, template)] = RouteMetrics(method, template)
+        route_metrics.count(status)
+        route_metrics.duration.observe(elapsed)
+        route_metrics.sql_count.observe(stats.count)
+        route_metrics.sql_seconds.observe(stats.seconds)
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            log_slow_request(method, scope["path"], status, elapsed, stats)
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from cache import LRUCache
+from config import CACHE_BUS, CACHE_BUS_INTERVAL_MS, CACHE_BUS_MAX_STALENESS, CACHE_BUS_RETENTION
+from database import SessionLocal
+from metrics import counter, gauge
+from models import CacheInvalidation
+
+# Шина инвалидации кэшей между воркерами. Изменение теста добавляет событие (тема, ключ)
+# в таблицу cache_invalidations в той же транзакции, что и само изменение: событие видно
+# другим процессам ровно тогда, когда видны новые данные. Фоновый поток каждого процесса
+# читает новые события и вызывает обработчики темы (сброс записей локальных кэшей).
+# Задержка ограничена интервалом опроса; если опрос не удается дольше CACHE_BUS_MAX_STALENESS,
+# локальные кэши очищаются целиком, чтобы не отдавать данные неизвестной давности.
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних id перечитывается при каждом опросе: в PostgreSQL транзакции
+# с меньшим id могут зафиксироваться позже (в SQLite запись последовательна)
+REORDER_WINDOW = 100
+PRUNE_INTERVAL = 60
+
+events_applied = counter("cache_bus_events_applied_total", "Invalidation events applied by this process")
+poll_errors = counter("cache_bus_poll_errors_total", "Failed invalidation bus polls")
+stale_clears = counter("cache_bus_stale_clears_total", "Local caches cleared because the bus could not be polled")
+
+
+def publish_invalidation(db: Session, topic: str, key: Hashable) -> None:
+    # Вызывается до commit изменения; без CACHE_BUS события не записываются
+    if CACHE_BUS:
+        db.add(CacheInvalidation(topic=topic, key=str(key)))
+
+
+class InvalidationBus:
+    def __init__(self, session_factory=SessionLocal, interval: float = CACHE_BUS_INTERVAL_MS / 1000,
+                 max_staleness: float = CACHE_BUS_MAX_STALENESS, retention: float = CACHE_BUS_RETENTION):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.retention = retention
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._caches: List[LRUCache] = []
+        self._last_id: Optional[int] = None
+        self._recent: Dict[int, float] = {}
+        self._last_success = time.monotonic()
+        self._last_prune = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, topic: str, handler: Callable[[str], None]) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def track(self, cache) -> None:
+        # Локальный кэш, который очищается целиком, если шина недоступна.
+        # Общий кэш (SQLiteCache) виден всем процессам и в этом не нуждается
+        if isinstance(cache, LRUCache):
+            self._caches.append(cache)
+
+    def dispatch(self, topic: str, key: str) -> None:
+        for handler in self._handlers.get(topic, ()):
+            handler(key)
+
+    def lag(self) -> float:
+        if self._thread is None:
+            return 0.0
+        return time.monotonic() - self._last_success
+
+    def poll(self) -> int:
+        # Одно чтение по индексу первичного ключа; возвращает число примененных событий
+        db = self.session_factory()
+        try:
+            if self._last_id is None:
+                # Первый опрос: кэши процесса еще пусты, старые события не нужны
+                self._last_id = db.query(func.max(CacheInvalidation.id)).scalar() or 0
+                events = []
+            else:
+                events = (
+                    db.query(CacheInvalidation.id, CacheInvalidation.topic, CacheInvalidation.key)
+                    .filter(CacheInvalidation.id > self._last_id - REORDER_WINDOW)
+                    .order_by(CacheInvalidation.id)
+                    .all()
+                )
+            if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+                self._prune(db)
+        finally:
+            db.close()
+
+        applied = 0
+        for event_id, topic, key in events:
+            if event_id in self._recent:
+                continue
+            self._recent[event_id] = time.monotonic()
+            self.dispatch(topic, key)
+            applied += 1
+        if events:
+            self._last_id = max(self._last_id, events[-1][0])
+        # Запоминаем только id из окна перечитывания
+        for event_id in [event_id for event_id in self._recent if event_id <= self._last_id - REORDER_WINDOW]:
+            del self._recent[event_id]
+
+        self._last_success = time.monotonic()
+        events_applied.inc(applied)
+        return applied
+
+    def _prune(self, db: Session) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        db.query(CacheInvalidation).filter(CacheInvalidation.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        self._last_prune = time.monotonic()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._last_success = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                poll_errors.inc()
+                logger.exception("Cache invalidation bus poll failed")
+                if self.lag() > self.max_staleness:
+                    for cache in self._caches:
+                        cache.clear()
+                    stale_clears.inc()
+            self._stop.wait(self.interval)
+
+
+invalidation_bus = InvalidationBus()
+gauge("cache_bus_lag_seconds", "Seconds since the last successful invalidation bus poll", invalidation_bus.lag)
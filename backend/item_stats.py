@@ -0,0 +1,185 @@
+from math import sqrt
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from answer_keys import GradedAnswer, compile_answer_key
+from answer_store import load_selected_many
+from models import Test, Question, Option, TestQuestion, TestResult, QuestionStat, OptionStat
+
+# Анализ вопросов (item analysis) из инкрементально поддерживаемых сумм:
+# question_stats - попытки, правильные ответы и суммы долей балла по вопросу,
+# option_stats - число выборов варианта. Отчет читает O(вопросов) строк, а не O(попыток).
+# Попытка вопроса - ответ на него в отправке (фронтенд отправляет все вопросы теста).
+# Суммы ведутся по (тест, версия вопроса): вопрос банка в разных тестах анализируется отдельно.
+
+# (test_id, доля балла за попытку, проверенные ответы)
+ItemEntry = Tuple[int, float, List[GradedAnswer]]
+
+QUESTION_SUMS = ("attempts", "correct", "score_sum", "score_sq_sum", "correct_score_sum")
+
+
+def _increment(db: Session, model, keys: Tuple[str, ...], sums: Tuple[str, ...], rows: List[dict]) -> None:
+    # Прибавление сумм к строкам по ключу; отсутствующие строки создаются
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in sums},
+        )
+        db.execute(stmt, rows)
+        return
+
+    for row in rows:
+        updated = (
+            db.query(model)
+            .filter(*(getattr(model, key) == row[key] for key in keys))
+            .update({getattr(model, name): getattr(model, name) + row[name] for name in sums},
+                    synchronize_session=False)
+        )
+        if not updated:
+            db.add(model(**row))
+
+
+def record_items(db: Session, entries: List[ItemEntry]) -> None:
+    # Вызывается в транзакции сохранения результатов, коммит делает вызывающий код
+    questions: Dict[Tuple[int, int], dict] = {}
+    options: Dict[Tuple[int, int], dict] = {}
+
+    for test_id, fraction, graded in entries:
+        for answer in graded:
+            row = questions.setdefault((test_id, answer.question_id), {
+                "question_id": answer.question_id, "test_id": test_id,
+                **{name: 0 for name in QUESTION_SUMS},
+            })
+            row["attempts"] += 1
+            row["score_sum"] += fraction
+            row["score_sq_sum"] += fraction * fraction
+            if answer.is_correct:
+                row["correct"] += 1
+                row["correct_score_sum"] += fraction
+
+            for option_id in answer.selected:
+                option = options.setdefault((test_id, option_id), {
+                    "test_id": test_id, "option_id": option_id, "question_id": answer.question_id,
+                    "selections": 0,
+                })
+                option["selections"] += 1
+
+    _increment(db, QuestionStat, ("test_id", "question_id"), QUESTION_SUMS, list(questions.values()))
+    _increment(db, OptionStat, ("test_id", "option_id"), ("selections",), list(options.values()))
+
+
+def forget_items(db: Session, test_id: int) -> None:
+    db.query(OptionStat).filter(OptionStat.test_id == test_id).delete(synchronize_session=False)
+    db.query(QuestionStat).filter(QuestionStat.test_id == test_id).delete(synchronize_session=False)
+
+
+def rebuild_items(db: Session, batch_size: int = 1000) -> int:
+    # Полный пересчет из test_results / user_answers. Правильность ответов определяется
+    # по текущему ключу теста: для вопросов, измененных после попыток, это приближение
+    db.query(OptionStat).delete(synchronize_session=False)
+    db.query(QuestionStat).delete(synchronize_session=False)
+
+    processed = 0
+    for test_id, in db.query(Test.id).order_by(Test.id).all():
+        key = compile_answer_key(db, test_id)
+        last_id = 0
+        while True:
+            results = (
+                db.query(TestResult.id, TestResult.score, TestResult.total_questions)
+                .filter(TestResult.test_id == test_id, TestResult.id > last_id)
+                .order_by(TestResult.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not results:
+                break
+            last_id = results[-1].id
+
+            selected_by_result = load_selected_many(db, [result.id for result in results])
+            entries = []
+            for result_id, score, total in results:
+                graded = [
+                    GradedAnswer(question_id, selected & key.options[question_id],
+                                 selected == key.correct[question_id])
+                    for question_id, selected in selected_by_result.get(result_id, {}).items()
+                    if question_id in key.correct
+                ]
+                entries.append((test_id, score / total if total else 0.0, graded))
+            record_items(db, entries)
+            processed += len(results)
+
+        db.commit()
+
+    return processed
+
+
+def _discrimination(stat: QuestionStat) -> Optional[float]:
+    # Точечно-бисериальная корреляция правильности ответа с долей балла за попытку:
+    # r = (M1 - M0) / s * sqrt(p * q)
+    n, correct = stat.attempts, stat.correct
+    if not n or correct in (0, n):
+        return None
+    mean = stat.score_sum / n
+    variance = stat.score_sq_sum / n - mean * mean
+    if variance <= 1e-12:
+        return None
+    mean_correct = stat.correct_score_sum / correct
+    mean_incorrect = (stat.score_sum - stat.correct_score_sum) / (n - correct)
+    p = correct / n
+    return (mean_correct - mean_incorrect) / sqrt(variance) * sqrt(p * (1 - p))
+
+
+def item_analysis(db: Session, test_id: int) -> List[dict]:
+    # Вопросы теста с вариантами и накопленной статистикой - три запроса
+    content = (
+        db.query(Question.id, Question.question_text, Option.id, Option.option_text, Option.is_correct)
+        .join(TestQuestion, TestQuestion.question_id == Question.id)
+        .outerjoin(Option, Option.question_id == Question.id)
+        .filter(TestQuestion.test_id == test_id)
+        .order_by(TestQuestion.position, Option.position, Option.id)
+        .all()
+    )
+    question_stats = {
+        stat.question_id: stat
+        for stat in db.query(QuestionStat).filter(QuestionStat.test_id == test_id)
+    }
+    selections = dict(
+        db.query(OptionStat.option_id, OptionStat.selections)
+        .filter(OptionStat.test_id == test_id)
+        .all()
+    )
+
+    questions: Dict[int, dict] = {}
+    for question_id, question_text, option_id, option_text, is_correct in content:
+        stat = question_stats.get(question_id)
+        attempts = stat.attempts if stat else 0
+        question = questions.get(question_id)
+        if question is None:
+            discrimination = _discrimination(stat) if stat else None
+            question = questions[question_id] = {
+                "question_id": question_id,
+                "question_text": question_text,
+                "attempts": attempts,
+                "correct": stat.correct if stat else 0,
+                # Трудность - доля правильных ответов (p-value): чем меньше, тем труднее вопрос
+                "difficulty": round(stat.correct / attempts, 4) if attempts else None,
+                "discrimination": round(discrimination, 4) if discrimination is not None else None,
+                "options": [],
+            }
+        if option_id is not None:
+            selected = selections.get(option_id, 0)
+            question["options"].append({
+                "option_id": option_id,
+                "option_text": option_text,
+                "is_correct": is_correct,
+                "selections": selected,
+                "selection_rate": round(selected / attempts, 4) if attempts else None,
+            })
+
+    return list(questions.values())
@@ -1,12 +1,50 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
+from database import get_engine, dispose_engines
 from routes import auth, tests, student, teacher
+from pagination import NEXT_CURSOR_HEADER
+from config import SUBMIT_QUEUE, RATE_LIMITING, REQUEST_METRICS, MIGRATE_ON_STARTUP, CACHE_BUS, AUTOSAVE_COALESCE
+from invalidation import invalidation_bus
+from instrumentation import RequestMetricsMiddleware
+from ratelimit import AdmissionControlMiddleware
+from submission_queue import submission_writer
+from autosave import autosave_buffer
+import metrics
+import migrations
 
-# Создание таблиц
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Testing System API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема создается миграциями (python migrate.py upgrade), здесь - только проверка версии
+    await run_in_threadpool(migrations.ensure_schema, get_engine(), MIGRATE_ON_STARTUP)
+    if SUBMIT_QUEUE:
+        submission_writer.start()
+    if CACHE_BUS:
+        invalidation_bus.start()
+    if AUTOSAVE_COALESCE:
+        autosave_buffer.start()
+    yield
+    await run_in_threadpool(invalidation_bus.stop)
+    # Накопленные изменения ответов записываются до завершения процесса
+    await run_in_threadpool(autosave_buffer.stop)
+    # Дописываем принятые попытки до завершения процесса
+    await run_in_threadpool(submission_writer.stop)
+    await dispose_engines()
+
+
+app = FastAPI(title="Testing System API", lifespan=lifespan)
+
+# Ограничение нагрузки по группам маршрутов. Подключается до CORS, чтобы ответы
+# 429 / 503 тоже получали CORS-заголовки (последний добавленный middleware - внешний)
+if RATE_LIMITING:
+    app.add_middleware(AdmissionControlMiddleware)
+
+# Метрики запросов - снаружи ограничения нагрузки, чтобы учитывались и ответы 429 / 503
+if REQUEST_METRICS:
+    app.add_middleware(RequestMetricsMiddleware)
 
 # CORS для работы с frontend
 app.add_middleware(
@@ -15,6 +53,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Подключение роутеров
@@ -24,3 +63,9 @@ app.include_router(student.router)
 app.include_router(teacher.router)
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(format: str = "prometheus"):
+    # Текстовый формат Prometheus; ?format=json - прежний JSON-снимок
+    if format == "json":
+        return JSONResponse(metrics.snapshot())
+    return PlainTextResponse(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,74 @@
+import argparse
+from database import SessionLocal
+from score_stats import rebuild_summary
+from answer_store import migrate_json_answers
+from item_stats import rebuild_items
+from search import rebuild_index
+from question_bank import prune_unused
+
+# Служебные команды обслуживания базы: python maintenance.py <команда>
+
+
+def rebuild_stats(args):
+    db = SessionLocal()
+    try:
+        rows = rebuild_summary(db)
+    finally:
+        db.close()
+    print(f"test_score_summary rebuilt: {rows} rows")
+
+
+def migrate_answers(args):
+    db = SessionLocal()
+    try:
+        rows = migrate_json_answers(db)
+    finally:
+        db.close()
+    print(f"user_answers migrated to user_answer_options: {rows} rows")
+
+
+def rebuild_item_stats(args):
+    db = SessionLocal()
+    try:
+        results = rebuild_items(db)
+    finally:
+        db.close()
+    print(f"question_stats / option_stats rebuilt from {results} results")
+
+
+def rebuild_search_index(args):
+    db = SessionLocal()
+    try:
+        documents = rebuild_index(db)
+    finally:
+        db.close()
+    print(f"search_documents / search_index rebuilt: {documents} documents")
+
+
+def prune_question_bank(args):
+    db = SessionLocal()
+    try:
+        versions = prune_unused(db)
+    finally:
+        db.close()
+    print(f"questions: {versions} unused versions removed")
+
+
+COMMANDS = {
+    "rebuild-stats": rebuild_stats,
+    "migrate-answers": migrate_answers,
+    "rebuild-item-stats": rebuild_item_stats,
+    "rebuild-search-index": rebuild_search_index,
+    "prune-question-bank": prune_question_bank,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testing System maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
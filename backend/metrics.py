@@ -0,0 +1,204 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+# Простые метрики процесса: счетчики, значения, распределения (count / sum / max)
+# и гистограммы с фиксированными границами. Все метрики регистрируются в REGISTRY
+# и отдаются целиком через snapshot() (JSON) или render_prometheus() (текстовый формат Prometheus).
+# Метки (labels) задают отдельный ряд метрики: counter("x", ..., {"group": "student"}).
+
+Labels = Optional[Dict[str, str]]
+
+
+def series_key(name: str, labels: Labels) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def collect(self) -> dict:
+        return {"value": self._value}
+
+
+class Gauge:
+    # Текущее значение: либо выставляется явно, либо вычисляется функцией при чтении
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, func: Optional[Callable[[], float]] = None, labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self._value = 0
+        self._func = func
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def set_function(self, func: Callable[[], float]) -> None:
+        self._func = func
+
+    def collect(self) -> dict:
+        return {"value": self._func() if self._func else self._value}
+
+
+class Distribution:
+    # Наблюдения (длительности, размеры пачек): число, сумма и максимум
+    kind = "summary"
+
+    def __init__(self, name: str, description: str, labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def collect(self) -> dict:
+        with self._lock:
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 6),
+                "avg": round(self._sum / self._count, 6) if self._count else 0,
+                "max": round(self._max, 6),
+            }
+
+
+# Границы по умолчанию - длительности в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    # Число наблюдений в каждой ячейке "<= граница" (как в Prometheus), сумма и общее число
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def collect(self) -> dict:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            buckets["+Inf" if bound == math.inf else _format_value(bound)] = cumulative
+        return {"count": cumulative, "sum": round(total, 6), "buckets": buckets}
+
+
+REGISTRY: Dict[str, object] = {}
+
+
+def register(metric):
+    # Повторная регистрация возвращает уже существующую метрику
+    return REGISTRY.setdefault(series_key(metric.name, metric.labels), metric)
+
+
+def counter(name: str, description: str, labels: Labels = None) -> Counter:
+    return register(Counter(name, description, labels))
+
+
+def gauge(name: str, description: str, func: Optional[Callable[[], float]] = None, labels: Labels = None) -> Gauge:
+    return register(Gauge(name, description, func, labels))
+
+
+def distribution(name: str, description: str, labels: Labels = None) -> Distribution:
+    return register(Distribution(name, description, labels))
+
+
+def histogram(name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS,
+              labels: Labels = None) -> Histogram:
+    return register(Histogram(name, description, buckets, labels))
+
+
+def snapshot() -> dict:
+    return {name: metric.collect() for name, metric in sorted(REGISTRY.items())}
+
+
+# --- Текстовый формат Prometheus ---
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _series(name: str, labels: dict, value: float) -> str:
+    if labels:
+        label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in sorted(labels.items()))
+        return f"{name}{{{label_text}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def _metric_lines(metric) -> list:
+    data = metric.collect()
+    if metric.kind == "histogram":
+        lines = [
+            _series(f"{metric.name}_bucket", {**metric.labels, "le": bound}, count)
+            for bound, count in data["buckets"].items()
+        ]
+        return lines + [_series(f"{metric.name}_sum", metric.labels, data["sum"]),
+                        _series(f"{metric.name}_count", metric.labels, data["count"])]
+    if metric.kind == "summary":
+        return [_series(f"{metric.name}_sum", metric.labels, data["sum"]),
+                _series(f"{metric.name}_count", metric.labels, data["count"])]
+    return [_series(metric.name, metric.labels, data["value"])]
+
+
+def render_prometheus() -> str:
+    # Ряды одной метрики с разными метками идут подряд под общими HELP / TYPE
+    families: Dict[str, list] = {}
+    for metric in list(REGISTRY.values()):
+        families.setdefault(metric.name, []).append(metric)
+    lines = []
+    for name in sorted(families):
+        first = families[name][0]
+        lines.append(f"# HELP {name} {first.description}")
+        lines.append(f"# TYPE {name} {first.kind}")
+        for metric in families[name]:
+            lines.extend(_metric_lines(metric))
+        if first.kind == "summary":
+            # Максимум распределения - отдельным значением
+            lines.append(f"# TYPE {name}_max gauge")
+            lines.extend(_series(f"{name}_max", metric.labels, metric.collect()["max"]) for metric in families[name])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+import argparse
+import migrations
+from database import get_engine
+
+# Миграции схемы БД - отдельный шаг перед запуском серверов: python migrate.py <команда>
+#   upgrade [--to REV]  применить недостающие версии
+#   current             последняя примененная версия
+#   history             список версий
+#   check               расхождения между моделями и базой
+
+
+def upgrade(args):
+    applied = migrations.upgrade(get_engine(), args.to, log=print)
+    print(f"Database is at {migrations.current(get_engine())}" + ("" if applied else " (nothing to apply)"))
+
+
+def current(args):
+    revision = migrations.current(get_engine())
+    pending = migrations.pending(get_engine())
+    print(revision or "empty", f"({len(pending)} pending)" if pending else "(head)")
+
+
+def history(args):
+    applied = migrations.current(get_engine())
+    for migration in migrations.load_migrations():
+        marker = " <- current" if migration.revision == applied else ""
+        print(f"{migration.revision}  {migration.description}{marker}")
+
+
+def check(args):
+    import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+    from database import Base
+
+    problems = migrations.check(get_engine(), Base.metadata)
+    pending = migrations.pending(get_engine())
+    for problem in problems:
+        print(problem)
+    if pending:
+        print(f"pending migrations: {', '.join(pending)}")
+    if problems or pending:
+        raise SystemExit(1)
+    print("Schema matches models")
+
+
+COMMANDS = {
+    "upgrade": upgrade,
+    "current": current,
+    "history": history,
+    "check": check,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testing System database migrations")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--to", help="target revision for upgrade (default: latest)")
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import importlib
+import pkgutil
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, insert, select, text
+
+# Версионированные миграции схемы (по образцу Alembic): каждая версия - модуль в
+# migrations/versions с revision, down_revision, description и upgrade(conn).
+# Примененные версии записываются в schema_migrations в той же транзакции, что и сама миграция.
+# Миграции выполняются отдельным шагом (python migrate.py upgrade) до запуска серверов;
+# при старте процесс только проверяет, что схема актуальна.
+# Миграции только вперед: для отката - резервная копия базы.
+
+VERSION_TABLE = "schema_migrations"
+
+version_table = Table(
+    VERSION_TABLE, MetaData(),
+    Column("revision", String(32), primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Ключ рекомендательной блокировки PostgreSQL на время миграции
+ADVISORY_LOCK_KEY = 7_302_415_001
+
+
+@lru_cache(maxsize=1)
+def load_migrations() -> tuple:
+    # Версии в порядке имен модулей; цепочка down_revision должна быть линейной
+    from migrations import versions
+
+    chain, previous = [], None
+    for module_info in sorted(pkgutil.iter_modules(versions.__path__), key=lambda info: info.name):
+        module = importlib.import_module(f"{versions.__name__}.{module_info.name}")
+        if module.down_revision != previous:
+            raise RuntimeError(
+                f"Migration {module.revision} follows {module.down_revision!r}, expected {previous!r}"
+            )
+        chain.append(module)
+        previous = module.revision
+    return tuple(chain)
+
+
+def head() -> Optional[str]:
+    migrations = load_migrations()
+    return migrations[-1].revision if migrations else None
+
+
+def applied_revisions(conn) -> set:
+    if not inspect(conn).has_table(VERSION_TABLE):
+        return set()
+    return set(conn.execute(select(version_table.c.revision)).scalars())
+
+
+def current(engine) -> Optional[str]:
+    # Последняя примененная версия цепочки
+    with engine.connect() as conn:
+        applied = applied_revisions(conn)
+    revision = None
+    for migration in load_migrations():
+        if migration.revision in applied:
+            revision = migration.revision
+    return revision
+
+
+def pending(engine) -> List[str]:
+    with engine.connect() as conn:
+        applied = applied_revisions(conn)
+    return [migration.revision for migration in load_migrations() if migration.revision not in applied]
+
+
+@contextmanager
+def locked_transaction(engine):
+    # Транзакция, которую одновременно держит только один процесс:
+    # SQLite - BEGIN IMMEDIATE (блокировка записи), PostgreSQL - pg_advisory_xact_lock.
+    # Несколько воркеров, запустивших миграции разом, выполнят каждую версию один раз
+    if engine.dialect.name == "sqlite":
+        # pysqlite сам не открывает транзакцию перед DDL - управляем ею вручную
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+    else:
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            yield conn
+
+
+def upgrade(engine, target: Optional[str] = None, log=None) -> List[str]:
+    # Применяет недостающие версии до target (по умолчанию - до последней).
+    # Каждая версия - отдельная транзакция: при ошибке остаются примененными предыдущие
+    revisions = [migration.revision for migration in load_migrations()]
+    if target is not None and target not in revisions:
+        raise ValueError(f"Unknown revision {target!r}")
+
+    applied_now = []
+    for migration in load_migrations():
+        with locked_transaction(engine) as conn:
+            version_table.create(conn, checkfirst=True)
+            # Проверка под блокировкой: версию мог уже применить другой процесс
+            if migration.revision not in applied_revisions(conn):
+                if log:
+                    log(f"Applying {migration.revision}: {migration.description}")
+                migration.upgrade(conn)
+                conn.execute(insert(version_table).values(
+                    revision=migration.revision,
+                    description=migration.description,
+                    applied_at=datetime.utcnow(),
+                ))
+                applied_now.append(migration.revision)
+        if migration.revision == target:
+            break
+    return applied_now
+
+
+def check(engine, metadata) -> List[str]:
+    # Расхождения между моделями и базой: недостающие таблицы, колонки и индексы
+    problems = []
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                problems.append(f"missing table {table.name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            problems.extend(
+                f"missing column {table.name}.{column.name}" for column in table.columns if column.name not in columns
+            )
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            problems.extend(
+                f"missing index {index.name} on {table.name}"
+                for index in sorted(table.indexes, key=lambda index: index.name) if index.name not in indexes
+            )
+    return problems
+
+
+def ensure_schema(engine, auto_upgrade: bool = False) -> None:
+    # Проверка при старте процесса: одно чтение таблицы версий, без рефлексии всей схемы
+    missing = pending(engine)
+    if not missing:
+        return
+    if auto_upgrade:
+        upgrade(engine)
+        return
+    raise RuntimeError(
+        f"Database schema is not up to date (pending migrations: {', '.join(missing)}). "
+        "Run `python migrate.py upgrade` before starting the server"
+    )
@@ -0,0 +1,59 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+# Операции миграций. Все они идемпотентны: базы, созданные раньше через create_all
+# в любом промежуточном состоянии схемы, доводятся до одной и той же схемы.
+
+
+def has_table(conn, name: str) -> bool:
+    return inspect(conn).has_table(name)
+
+
+def column_names(conn, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def index_names(conn, table: str) -> set:
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def create_table(conn, table) -> None:
+    # Новая таблица вместе с индексами; у существующей - только недостающие индексы
+    if not has_table(conn, table.name):
+        table.create(conn)
+    else:
+        create_indexes(conn, table)
+
+
+def create_indexes(conn, table) -> None:
+    existing = index_names(conn, table.name)
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if index.name not in existing:
+            index.create(conn)
+
+
+def add_column(conn, column) -> None:
+    # Новая колонка NOT NULL должна иметь server_default
+    if column.name not in column_names(conn, column.table.name):
+        ddl = CreateColumn(column).compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {ddl}"))
+
+
+def sqlite_table_sql(conn, name: str) -> str:
+    return conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+    ).scalar() or ""
+
+
+def rebuild_sqlite_table(conn, table) -> None:
+    # SQLite не меняет определение таблицы на месте (например, AUTOINCREMENT):
+    # новая таблица, перенос строк, удаление старой и переименование, затем индексы.
+    # Ссылки других таблиц по имени остаются верными
+    temporary = f"_new_{table.name}"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    conn.execute(text(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {temporary} ", 1)))
+    columns = ", ".join(column.name for column in table.columns)
+    conn.execute(text(f"INSERT INTO {temporary} ({columns}) SELECT {columns} FROM {table.name}"))
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {temporary} RENAME TO {table.name}"))
+    create_indexes(conn, table)
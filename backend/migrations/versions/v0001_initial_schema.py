@@ -0,0 +1,66 @@
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text
+from migrations.ops import create_table
+
+# Исходная схема: пользователи, тесты с вопросами и вариантами, результаты и ответы.
+# Определения таблиц зафиксированы здесь и не зависят от текущих моделей
+
+revision = "0001"
+down_revision = None
+description = "initial schema"
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True, nullable=False),
+    Column("password", String, nullable=False),
+    Column("role", String, nullable=False),
+)
+
+tests = Table(
+    "tests", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, nullable=False),
+    Column("description", Text),
+    Column("teacher_id", Integer, ForeignKey("users.id")),
+    Column("created_at", DateTime),
+)
+
+questions = Table(
+    "questions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("test_id", Integer, ForeignKey("tests.id")),
+    Column("question_text", Text, nullable=False),
+)
+
+options = Table(
+    "options", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("question_id", Integer, ForeignKey("questions.id")),
+    Column("option_text", String, nullable=False),
+    Column("is_correct", Boolean),
+)
+
+test_results = Table(
+    "test_results", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("test_id", Integer, ForeignKey("tests.id")),
+    Column("score", Integer),
+    Column("total_questions", Integer),
+    Column("completed_at", DateTime),
+)
+
+user_answers = Table(
+    "user_answers", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("result_id", Integer, ForeignKey("test_results.id")),
+    Column("question_id", Integer, ForeignKey("questions.id")),
+    Column("selected_options", Text),
+)
+
+
+def upgrade(conn):
+    for table in metadata.sorted_tables:
+        create_table(conn, table)
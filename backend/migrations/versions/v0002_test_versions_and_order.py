@@ -0,0 +1,55 @@
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, MetaData, String, Table, Text, text
+from migrations.ops import add_column, create_indexes, rebuild_sqlite_table, sqlite_table_sql
+
+# Версия теста (снимки и ETag), порядок вопросов и вариантов, индексы по внешним ключам.
+# В SQLite вопросы и варианты пересоздаются с AUTOINCREMENT: id удаленных строк
+# не используются повторно, и старые ответы не привязываются к новым вопросам
+
+revision = "0002"
+down_revision = "0001"
+description = "test versions, question and option order"
+
+metadata = MetaData()
+
+tests = Table(
+    "tests", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False, server_default="1"),
+)
+
+questions = Table(
+    "questions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("test_id", Integer, ForeignKey("tests.id"), index=True),
+    Column("question_text", Text, nullable=False),
+    Column("position", Integer, nullable=False, server_default="0"),
+    sqlite_autoincrement=True,
+)
+
+options = Table(
+    "options", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("question_id", Integer, ForeignKey("questions.id"), index=True),
+    Column("option_text", String, nullable=False),
+    Column("is_correct", Boolean),
+    Column("position", Integer, nullable=False, server_default="0"),
+    sqlite_autoincrement=True,
+)
+
+
+def upgrade(conn):
+    add_column(conn, tests.c.version)
+    for table in (questions, options):
+        add_column(conn, table.c.position)
+        if conn.dialect.name == "sqlite" and "AUTOINCREMENT" not in sqlite_table_sql(conn, table.name).upper():
+            rebuild_sqlite_table(conn, table)
+        else:
+            create_indexes(conn, table)
+
+    if conn.dialect.name == "sqlite":
+        # Счетчик id вопросов - не ниже id, на которые ссылаются сохраненные ответы
+        # (вопросы, удаленные до миграции, иначе получили бы новые строки)
+        conn.execute(text(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT COALESCE(MAX(question_id), 0) FROM user_answers)) "
+            "WHERE name = 'questions'"
+        ))
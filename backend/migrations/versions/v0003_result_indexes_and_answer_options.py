@@ -0,0 +1,43 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, MetaData, Table
+from migrations.ops import create_indexes, create_table
+
+# Индексы под keyset-пагинацию и фильтры списков результатов, выборку ответов попытки
+# и таблица выбранных вариантов (вместо JSON в user_answers.selected_options;
+# перенос старых ответов - python maintenance.py migrate-answers)
+
+revision = "0003"
+down_revision = "0002"
+description = "result list indexes, user_answer_options"
+
+metadata = MetaData()
+
+test_results = Table(
+    "test_results", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("test_id", Integer),
+    Column("completed_at", DateTime),
+    Index("ix_test_results_completed", "completed_at", "id"),
+    Index("ix_test_results_test_completed", "test_id", "completed_at", "id"),
+    Index("ix_test_results_user_completed", "user_id", "completed_at", "id"),
+)
+
+user_answers = Table(
+    "user_answers", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("result_id", Integer, index=True),
+)
+
+options = Table("options", metadata, Column("id", Integer, primary_key=True))
+
+user_answer_options = Table(
+    "user_answer_options", metadata,
+    Column("user_answer_id", Integer, ForeignKey("user_answers.id"), primary_key=True),
+    Column("option_id", Integer, ForeignKey("options.id"), primary_key=True, index=True),
+)
+
+
+def upgrade(conn):
+    create_indexes(conn, test_results)
+    create_indexes(conn, user_answers)
+    create_table(conn, user_answer_options)
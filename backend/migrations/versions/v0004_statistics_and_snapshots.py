@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Float, ForeignKey, Integer, LargeBinary, MetaData, String, Table
+from migrations.ops import create_table
+
+# Инкрементальная статистика (гистограмма баллов, анализ вопросов и вариантов)
+# и сохраненные снимки тестов. Заполнение по существующим результатам:
+# python maintenance.py rebuild-stats и rebuild-item-stats
+
+revision = "0004"
+down_revision = "0003"
+description = "score summary, item statistics, test snapshots"
+
+metadata = MetaData()
+
+Table("tests", metadata, Column("id", Integer, primary_key=True))
+Table("questions", metadata, Column("id", Integer, primary_key=True))
+Table("options", metadata, Column("id", Integer, primary_key=True))
+
+test_score_summary = Table(
+    "test_score_summary", metadata,
+    Column("test_id", Integer, ForeignKey("tests.id"), primary_key=True),
+    Column("score", Integer, primary_key=True),
+    Column("total_questions", Integer, primary_key=True),
+    Column("attempts", Integer, nullable=False),
+)
+
+question_stats = Table(
+    "question_stats", metadata,
+    Column("question_id", Integer, ForeignKey("questions.id"), primary_key=True),
+    Column("test_id", Integer, ForeignKey("tests.id"), index=True),
+    Column("attempts", Integer, nullable=False),
+    Column("correct", Integer, nullable=False),
+    Column("score_sum", Float, nullable=False),
+    Column("score_sq_sum", Float, nullable=False),
+    Column("correct_score_sum", Float, nullable=False),
+)
+
+option_stats = Table(
+    "option_stats", metadata,
+    Column("option_id", Integer, ForeignKey("options.id"), primary_key=True),
+    Column("question_id", Integer, ForeignKey("questions.id"), index=True),
+    Column("selections", Integer, nullable=False),
+)
+
+test_snapshots = Table(
+    "test_snapshots", metadata,
+    Column("test_id", Integer, ForeignKey("tests.id"), primary_key=True),
+    Column("version", Integer, primary_key=True),
+    Column("view", String, primary_key=True),
+    Column("etag", String, nullable=False),
+    Column("body", LargeBinary, nullable=False),
+)
+
+
+def upgrade(conn):
+    for table in (test_score_summary, question_stats, option_stats, test_snapshots):
+        create_table(conn, table)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from migrations.ops import create_table
+
+# События шины инвалидации кэшей между воркерами (invalidation.py)
+
+revision = "0005"
+down_revision = "0004"
+description = "cache invalidation events"
+
+metadata = MetaData()
+
+cache_invalidations = Table(
+    "cache_invalidations", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("topic", String, nullable=False),
+    Column("key", String, nullable=False),
+    Column("created_at", DateTime, nullable=False, index=True),
+    sqlite_autoincrement=True,
+)
+
+
+def upgrade(conn):
+    create_table(conn, cache_invalidations)
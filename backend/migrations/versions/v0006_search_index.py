@@ -0,0 +1,109 @@
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table, Text, text
+from migrations.ops import create_table, has_table
+
+# Полнотекстовый поиск по тестам и вопросам (search.py): таблица документов и,
+# в SQLite со сборкой FTS5, внешний индекс search_index над ней. Индекс синхронизируется
+# триггерами, приложение меняет только search_documents. Документы заполняются
+# по существующим тестам; повторная сборка - python maintenance.py rebuild-search-index
+
+revision = "0006"
+down_revision = "0005"
+description = "full-text search index"
+
+metadata = MetaData()
+
+Table("tests", metadata, Column("id", Integer, primary_key=True))
+Table("questions", metadata, Column("id", Integer, primary_key=True))
+
+search_documents = Table(
+    "search_documents", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("test_id", Integer, ForeignKey("tests.id"), nullable=False, index=True),
+    Column("question_id", Integer, ForeignKey("questions.id")),
+    Column("title", Text, nullable=False),
+    Column("description", Text, nullable=False),
+    Column("question_text", Text, nullable=False),
+    Column("option_text", Text, nullable=False),
+    sqlite_autoincrement=True,
+)
+
+COLUMNS = "title, description, question_text, option_text"
+
+# unicode61 с remove_diacritics 2: совпадение без учета регистра (в том числе кириллицы) и диакритики латиницы;
+# префиксные индексы длиной 2-6 символов: запрос по основе слова ("уравн*") не перебирает все ее формы
+FTS_DDL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    {COLUMNS},
+    content='search_documents', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6'
+)
+"""
+
+TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_index (rowid, {COLUMNS})
+        VALUES (new.id, new.title, new.description, new.question_text, new.option_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_index (search_index, rowid, {COLUMNS})
+        VALUES ('delete', old.id, old.title, old.description, old.question_text, old.option_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_index (search_index, rowid, {COLUMNS})
+        VALUES ('delete', old.id, old.title, old.description, old.question_text, old.option_text);
+        INSERT INTO search_index (rowid, {COLUMNS})
+        VALUES (new.id, new.title, new.description, new.question_text, new.option_text);
+    END
+    """,
+)
+
+# Веса колонок для bm25: совпадение в названии теста важнее совпадения в тексте варианта
+RANK = "bm25(10.0, 4.0, 2.0, 1.0)"
+
+
+def fts5_available(conn) -> bool:
+    # Модуль FTS5 есть не в каждой сборке SQLite; без него поиск работает через LIKE
+    try:
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+    except Exception:
+        return False
+    conn.exec_driver_sql("DROP TABLE temp._fts5_probe")
+    return True
+
+
+def backfill(conn) -> None:
+    # Строка на каждый тест и на каждый вопрос с текстом всех его вариантов
+    aggregates = {"sqlite": "group_concat(o.option_text, ' ')", "postgresql": "string_agg(o.option_text, ' ')"}
+    aggregate = aggregates.get(conn.dialect.name)
+    conn.execute(text(f"""
+        INSERT INTO search_documents (test_id, question_id, {COLUMNS})
+        SELECT id, NULL, title, coalesce(description, ''), '', '' FROM tests
+    """))
+    if aggregate is None:
+        # Прочие диалекты: варианты попадут в индекс при rebuild-search-index
+        aggregate = "''"
+    conn.execute(text(f"""
+        INSERT INTO search_documents (test_id, question_id, {COLUMNS})
+        SELECT q.test_id, q.id, '', '', q.question_text,
+               coalesce((SELECT {aggregate} FROM options o WHERE o.question_id = q.id), '')
+        FROM questions q WHERE q.test_id IS NOT NULL
+    """))
+
+
+def upgrade(conn):
+    created = not has_table(conn, "search_documents")
+    create_table(conn, search_documents)
+    if created:
+        backfill(conn)
+    if conn.dialect.name == "sqlite" and fts5_available(conn):
+        conn.exec_driver_sql(FTS_DDL)
+        for trigger in TRIGGERS:
+            conn.exec_driver_sql(trigger)
+        conn.exec_driver_sql(f"INSERT INTO search_index (search_index, rank) VALUES ('rank', '{RANK}')")
+        # Индекс строится целиком по уже заполненной таблице - быстрее, чем построчно триггерами
+        conn.exec_driver_sql("INSERT INTO search_index (search_index) VALUES ('rebuild')")
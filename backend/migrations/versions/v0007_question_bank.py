@@ -0,0 +1,225 @@
+import hashlib
+import json
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, insert, text
+from answer_store import legacy_option_ids
+from migrations.ops import add_column, create_indexes, create_table, has_table, rebuild_sqlite_table
+
+# Банк вопросов (question_bank.py): вопрос - неизменяемая версия с хешем содержимого,
+# тест ссылается на версии через test_questions. Одинаковые вопросы разных тестов
+# сводятся к одной версии (с наименьшим id), ответы, выбранные варианты и статистика
+# переводятся на нее; статистика вопросов и вариантов становится статистикой в тесте.
+# Данные читаются в память целиком - миграция рассчитана на банки до миллионов вопросов
+
+revision = "0007"
+down_revision = "0006"
+description = "question bank with content-addressed versions"
+
+metadata = MetaData()
+
+Table("tests", metadata, Column("id", Integer, primary_key=True))
+Table("options", metadata, Column("id", Integer, primary_key=True))
+
+# Колонки, добавляемые к прежней таблице questions до ее пересоздания
+new_columns = Table(
+    "questions", MetaData(),
+    Column("content_hash", String(64)),
+    Column("created_at", DateTime),
+)
+
+questions = Table(
+    "questions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("content_hash", String(64), nullable=False, unique=True, index=True),
+    Column("question_text", Text, nullable=False),
+    Column("created_at", DateTime),
+    sqlite_autoincrement=True,
+)
+
+test_questions = Table(
+    "test_questions", metadata,
+    Column("test_id", Integer, ForeignKey("tests.id"), primary_key=True),
+    Column("question_id", Integer, ForeignKey("questions.id"), primary_key=True, index=True),
+    Column("position", Integer, nullable=False),
+    Index("ix_test_questions_test_position", "test_id", "position"),
+)
+
+question_stats = Table(
+    "question_stats", metadata,
+    Column("test_id", Integer, ForeignKey("tests.id"), primary_key=True),
+    Column("question_id", Integer, ForeignKey("questions.id"), primary_key=True, index=True),
+    Column("attempts", Integer, nullable=False),
+    Column("correct", Integer, nullable=False),
+    Column("score_sum", Float, nullable=False),
+    Column("score_sq_sum", Float, nullable=False),
+    Column("correct_score_sum", Float, nullable=False),
+)
+
+option_stats = Table(
+    "option_stats", metadata,
+    Column("test_id", Integer, ForeignKey("tests.id"), primary_key=True),
+    Column("option_id", Integer, ForeignKey("options.id"), primary_key=True),
+    Column("question_id", Integer, ForeignKey("questions.id"), index=True),
+    Column("selections", Integer, nullable=False),
+)
+
+QUESTION_SUMS = ("attempts", "correct", "score_sum", "score_sq_sum", "correct_score_sum")
+
+
+def content_hash(question_text, options) -> str:
+    # Копия question_bank.content_hash на момент миграции: хеши должны совпасть
+    # с теми, что приложение вычислит для того же содержимого
+    canonical = json.dumps([question_text, [[text, bool(correct)] for text, correct in options]],
+                           ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def upgrade(conn):
+    create_table(conn, test_questions)
+    for column in new_columns.columns:
+        add_column(conn, column)
+
+    placements = conn.execute(text(
+        "SELECT id, test_id, question_text FROM questions ORDER BY test_id, position, id"
+    )).all()
+    options = {}
+    for option_id, question_id, option_text, is_correct in conn.execute(text(
+        "SELECT id, question_id, option_text, is_correct FROM options ORDER BY question_id, position, id"
+    )):
+        options.setdefault(question_id, []).append((option_id, option_text, is_correct))
+
+    # Версия для каждого содержимого - вопрос с наименьшим id; remap - старый id -> версия
+    hashes, versions = {}, {}
+    for question_id, _, question_text in placements:
+        digest = content_hash(question_text, [(o[1], o[2]) for o in options.get(question_id, ())])
+        hashes[question_id] = digest
+        versions[digest] = min(versions.get(digest, question_id), question_id)
+    remap = {question_id: versions[digest] for question_id, digest in hashes.items()}
+    option_remap = {}
+    for question_id, version_id in remap.items():
+        if question_id != version_id:
+            for (option_id, _, _), (version_option_id, _, _) in zip(options.get(question_id, ()),
+                                                                   options.get(version_id, ())):
+                option_remap[option_id] = version_option_id
+    old_tests = {question_id: test_id for question_id, test_id, _ in placements}
+
+    _execute_many(conn, "UPDATE questions SET content_hash = :digest WHERE id = :id",
+                  [{"id": version_id, "digest": digest} for digest, version_id in versions.items()])
+    conn.execute(text(
+        "UPDATE questions SET created_at = (SELECT created_at FROM tests WHERE tests.id = questions.test_id)"
+    ))
+
+    # Ссылки тестов в прежнем порядке; одинаковые вопросы внутри теста - одна ссылка
+    links, positions = {}, {}
+    for question_id, test_id, _ in placements:
+        if test_id is None or (test_id, remap[question_id]) in links:
+            continue
+        position = positions[test_id] = positions.get(test_id, -1) + 1
+        links[test_id, remap[question_id]] = {"test_id": test_id, "question_id": remap[question_id],
+                                              "position": position}
+    if links:
+        conn.execute(insert(test_questions), list(links.values()))
+
+    _remap_answers(conn, remap, option_remap)
+    _merge_stats(conn, remap, option_remap, old_tests)
+
+    duplicates = [question_id for question_id, version_id in remap.items() if question_id != version_id]
+    _execute_many(conn, "DELETE FROM options WHERE question_id = :id", [{"id": question_id} for question_id in duplicates])
+    _execute_many(conn, "DELETE FROM questions WHERE id = :id", [{"id": question_id} for question_id in duplicates])
+
+    # Документы поиска - по ссылкам; снимки и закэшированные ключи ответов затронутых
+    # тестов содержат прежние id вопросов и вариантов - новая версия теста их отменяет
+    _reindex_questions(conn)
+    affected = sorted({old_tests[question_id] for question_id in duplicates if old_tests[question_id] is not None})
+    _execute_many(conn, "UPDATE tests SET version = version + 1 WHERE id = :id", [{"id": test_id} for test_id in affected])
+    _execute_many(conn, "DELETE FROM test_snapshots WHERE test_id = :id", [{"id": test_id} for test_id in affected])
+
+    _drop_placement_columns(conn)
+
+
+def _execute_many(conn, sql, rows):
+    if rows:
+        conn.execute(text(sql), rows)
+
+
+def _remap_answers(conn, remap, option_remap):
+    moved = [{"old": question_id, "new": version_id} for question_id, version_id in remap.items()
+             if question_id != version_id]
+    _execute_many(conn, "UPDATE user_answers SET question_id = :new WHERE question_id = :old", moved)
+    _execute_many(conn, "UPDATE user_answer_options SET option_id = :new WHERE option_id = :old",
+                  [{"old": old, "new": new} for old, new in option_remap.items()])
+    # Ответы в устаревшем JSON-формате, еще не перенесенные в user_answer_options.
+    # Поврежденная строка читается как пустой ответ и остается как есть, как и в приложении
+    if option_remap:
+        legacy = conn.execute(text(
+            "SELECT id, selected_options FROM user_answers WHERE selected_options IS NOT NULL"
+        )).all()
+        rows = []
+        for answer_id, selected in legacy:
+            option_ids = legacy_option_ids(selected)
+            if option_ids & option_remap.keys():
+                rows.append({"id": answer_id, "selected": json.dumps(
+                    sorted(option_remap.get(option_id, option_id) for option_id in option_ids)
+                )})
+        _execute_many(conn, "UPDATE user_answers SET selected_options = :selected WHERE id = :id", rows)
+
+
+def _merge_stats(conn, remap, option_remap, old_tests):
+    # Суммы по (тест, версия): у прежних строк тест берется из старого вопроса
+    merged_questions = {}
+    for row in conn.execute(text(f"SELECT question_id, test_id, {', '.join(QUESTION_SUMS)} FROM question_stats")):
+        test_id = row.test_id if row.test_id is not None else old_tests.get(row.question_id)
+        if test_id is None or row.question_id not in remap:
+            continue
+        key = (test_id, remap[row.question_id])
+        target = merged_questions.setdefault(key, {"test_id": key[0], "question_id": key[1],
+                                                   **{name: 0 for name in QUESTION_SUMS}})
+        for name in QUESTION_SUMS:
+            target[name] += getattr(row, name) or 0
+
+    merged_options = {}
+    for option_id, question_id, selections in conn.execute(
+        text("SELECT option_id, question_id, selections FROM option_stats")
+    ):
+        test_id = old_tests.get(question_id)
+        if test_id is None or question_id not in remap:
+            continue
+        key = (test_id, option_remap.get(option_id, option_id))
+        target = merged_options.setdefault(key, {"test_id": key[0], "option_id": key[1],
+                                                 "question_id": remap[question_id], "selections": 0})
+        target["selections"] += selections or 0
+
+    for table, rows in ((question_stats, merged_questions), (option_stats, merged_options)):
+        conn.execute(text(f"DROP TABLE {table.name}"))
+        table.create(conn)
+        if rows:
+            conn.execute(insert(table), list(rows.values()))
+
+
+def _reindex_questions(conn):
+    if not has_table(conn, "search_documents"):
+        return
+    aggregates = {"sqlite": "group_concat(o.option_text, ' ')", "postgresql": "string_agg(o.option_text, ' ')"}
+    aggregate = aggregates.get(conn.dialect.name, "''")
+    conn.execute(text("DELETE FROM search_documents WHERE question_id IS NOT NULL"))
+    conn.execute(text(f"""
+        INSERT INTO search_documents (test_id, question_id, title, description, question_text, option_text)
+        SELECT tq.test_id, q.id, '', '', q.question_text,
+               coalesce((SELECT {aggregate} FROM options o WHERE o.question_id = q.id), '')
+        FROM test_questions tq JOIN questions q ON q.id = tq.question_id
+        ORDER BY tq.test_id, tq.position
+    """))
+
+
+def _drop_placement_columns(conn):
+    if conn.dialect.name == "sqlite":
+        # Пересоздание без test_id и position; счетчик id не уменьшается: id удаленных
+        # дубликатов не достанутся новым версиям (ключи ответов кэшируются по id версии)
+        sequence = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'questions'")).scalar() or 0
+        rebuild_sqlite_table(conn, questions)
+        conn.execute(text("UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = 'questions'"),
+                     {"seq": sequence})
+        return
+    conn.execute(text("ALTER TABLE questions DROP COLUMN position"))
+    conn.execute(text("ALTER TABLE questions DROP COLUMN test_id"))
+    conn.execute(text("ALTER TABLE questions ALTER COLUMN content_hash SET NOT NULL"))
+    create_indexes(conn, questions)
@@ -0,0 +1,37 @@
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, Table, false
+from migrations.ops import add_column, create_table
+
+# Варианты попыток (variants.py): настройки перемешивания и выборки вопросов у теста
+# и таблица начатых попыток - по строке с seed на попытку
+
+revision = "0008"
+down_revision = "0007"
+description = "per-attempt test variants"
+
+metadata = MetaData()
+
+tests = Table(
+    "tests", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("shuffle_questions", Boolean, nullable=False, server_default=false()),
+    Column("shuffle_options", Boolean, nullable=False, server_default=false()),
+    Column("questions_per_attempt", Integer),
+)
+Table("users", metadata, Column("id", Integer, primary_key=True))
+
+attempts = Table(
+    "attempts", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("test_id", Integer, ForeignKey("tests.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("seed", BigInteger, nullable=False),
+    Column("started_at", DateTime),
+    Index("ix_attempts_user_test", "user_id", "test_id"),
+    Index("ix_attempts_test", "test_id"),
+)
+
+
+def upgrade(conn):
+    for column in (tests.c.shuffle_questions, tests.c.shuffle_options, tests.c.questions_per_attempt):
+        add_column(conn, column)
+    create_table(conn, attempts)
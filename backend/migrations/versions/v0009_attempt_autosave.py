@@ -0,0 +1,27 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text
+from migrations.ops import add_column
+
+# Автосохранение незавершенных попыток (autosave.py) и запечатывание попытки при отправке
+
+revision = "0009"
+down_revision = "0008"
+description = "attempt autosave and sealing"
+
+metadata = MetaData()
+
+attempts = Table(
+    "attempts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("answers", Text),
+    Column("saved_at", DateTime),
+    Column("submitted_at", DateTime),
+    Column("score", Integer),
+    Column("total_questions", Integer),
+    Column("result_id", Integer),
+)
+
+
+def upgrade(conn):
+    for column in attempts.columns:
+        if not column.primary_key:
+            add_column(conn, column)
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Index, Integer, MetaData, Table
+from migrations.ops import create_indexes
+
+# Попытка по результату: подробный результат показывает вопросы варианта попытки
+
+revision = "0010"
+down_revision = "0009"
+description = "attempt result index"
+
+metadata = MetaData()
+
+attempts = Table(
+    "attempts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("result_id", Integer),
+    Index("ix_attempts_result", "result_id"),
+)
+
+
+def upgrade(conn):
+    create_indexes(conn, attempts)
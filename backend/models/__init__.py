@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Text, Index, LargeBinary, Float, false
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -21,30 +21,64 @@ class Test(Base):
     description = Column(Text)
     teacher_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # увеличивается при каждом изменении
     
-    questions = relationship("Question", back_populates="test", cascade="all, delete-orphan")
+    # Вариант попытки (variants.py): перемешивание и случайная выборка N из всех вопросов
+    shuffle_questions = Column(Boolean, nullable=False, default=False, server_default=false())
+    shuffle_options = Column(Boolean, nullable=False, default=False, server_default=false())
+    questions_per_attempt = Column(Integer)  # None - все вопросы теста
+    
+    # Тест - упорядоченный список ссылок на версии вопросов из общего банка
+    question_links = relationship(
+        "TestQuestion", cascade="all, delete-orphan", order_by="TestQuestion.position"
+    )
+    questions = relationship(
+        "Question", secondary="test_questions", order_by="TestQuestion.position", viewonly=True
+    )
     results = relationship("TestResult", back_populates="test")
 
 class Question(Base):
     __tablename__ = "questions"
+    # Без повторного использования id удаленных строк: старые ответы не привязываются к новым вопросам
+    __table_args__ = {"sqlite_autoincrement": True}
     
+    # Неизменяемая версия вопроса в банке: текст и варианты с правильностью.
+    # Одинаковое содержимое хранится один раз (content_hash) и используется всеми тестами;
+    # изменение вопроса создает новую версию, прежние ответы ссылаются на старую
     id = Column(Integer, primary_key=True, index=True)
-    test_id = Column(Integer, ForeignKey("tests.id"))
+    content_hash = Column(String(64), nullable=False, unique=True, index=True)
     question_text = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
     
-    test = relationship("Test", back_populates="questions")
-    options = relationship("Option", back_populates="question", cascade="all, delete-orphan")
+    options = relationship(
+        "Option", back_populates="question", cascade="all, delete-orphan",
+        order_by="(Option.position, Option.id)"
+    )
 
 class Option(Base):
     __tablename__ = "options"
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
-    question_id = Column(Integer, ForeignKey("questions.id"))
+    question_id = Column(Integer, ForeignKey("questions.id"), index=True)
     option_text = Column(String, nullable=False)
     is_correct = Column(Boolean, default=False)
+    position = Column(Integer, nullable=False, default=0, server_default="0")  # порядок варианта в вопросе
     
     question = relationship("Question", back_populates="options")
 
+class TestQuestion(Base):
+    __tablename__ = "test_questions"
+    
+    # Вопрос в тесте: ссылка на версию вопроса и ее место в тесте
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True, index=True)
+    position = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_test_questions_test_position", "test_id", "position"),
+    )
+
 class TestResult(Base):
     __tablename__ = "test_results"
     
@@ -58,13 +92,123 @@ class TestResult(Base):
     user = relationship("User", back_populates="results")
     test = relationship("Test", back_populates="results")
     answers = relationship("UserAnswer", back_populates="result", cascade="all, delete-orphan")
+    
+    # Индексы под keyset-пагинацию и фильтры списков результатов
+    __table_args__ = (
+        Index("ix_test_results_completed", "completed_at", "id"),
+        Index("ix_test_results_test_completed", "test_id", "completed_at", "id"),
+        Index("ix_test_results_user_completed", "user_id", "completed_at", "id"),
+    )
+
+class Attempt(Base):
+    __tablename__ = "attempts"
+    
+    # Начатая попытка: вариант теста (выборка и порядок вопросов и вариантов) не хранится,
+    # а выводится из seed при каждом обращении
+    id = Column(Integer, primary_key=True, index=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    seed = Column(BigInteger, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Автосохранение (autosave.py): JSON {question_id: [option_id, ...]} незавершенной попытки
+    answers = Column(Text)
+    saved_at = Column(DateTime)
+    # Отправка запечатывает попытку: повторная отправка возвращает тот же балл.
+    # result_id - None, пока результат в очереди записи (SUBMIT_QUEUE)
+    submitted_at = Column(DateTime)
+    score = Column(Integer)
+    total_questions = Column(Integer)
+    result_id = Column(Integer)
+    
+    __table_args__ = (
+        Index("ix_attempts_user_test", "user_id", "test_id"),
+        Index("ix_attempts_test", "test_id"),
+        Index("ix_attempts_result", "result_id"),
+    )
 
 class UserAnswer(Base):
     __tablename__ = "user_answers"
     
     id = Column(Integer, primary_key=True, index=True)
-    result_id = Column(Integer, ForeignKey("test_results.id"))
+    result_id = Column(Integer, ForeignKey("test_results.id"), index=True)
     question_id = Column(Integer, ForeignKey("questions.id"))
-    selected_options = Column(Text)  # JSON строка с ID выбранных вариантов
+    selected_options = Column(Text)  # устаревшее: JSON с ID вариантов, переносится в user_answer_options
     
     result = relationship("TestResult", back_populates="answers")
+    selected = relationship("UserAnswerOption", cascade="all, delete-orphan")
+
+class UserAnswerOption(Base):
+    __tablename__ = "user_answer_options"
+    
+    # Выбранный вариант ответа: одна строка на (ответ, вариант)
+    user_answer_id = Column(Integer, ForeignKey("user_answers.id"), primary_key=True)
+    option_id = Column(Integer, ForeignKey("options.id"), primary_key=True, index=True)
+
+class TestScoreSummary(Base):
+    __tablename__ = "test_score_summary"
+    
+    # Гистограмма результатов теста: сколько попыток получили score из total_questions
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    score = Column(Integer, primary_key=True)
+    total_questions = Column(Integer, primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+class QuestionStat(Base):
+    __tablename__ = "question_stats"
+    
+    # Инкрементальный анализ вопроса в тесте: попытки, правильные ответы и суммы доли балла
+    # за попытку (score / total_questions) - из них считаются трудность и дискриминация.
+    # Одна версия вопроса может входить в несколько тестов - статистика у каждого своя
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0)
+    score_sq_sum = Column(Float, nullable=False, default=0)
+    correct_score_sum = Column(Float, nullable=False, default=0)
+
+class OptionStat(Base):
+    __tablename__ = "option_stats"
+    
+    # Сколько раз вариант был выбран в попытках теста
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    option_id = Column(Integer, ForeignKey("options.id"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), index=True)
+    selections = Column(Integer, nullable=False, default=0)
+
+class TestSnapshot(Base):
+    __tablename__ = "test_snapshots"
+    
+    # Готовый JSON теста для конкретной версии и представления ("teacher" / "student")
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    view = Column(String, primary_key=True)
+    etag = Column(String, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+    # Без повторного использования id: процессы читают события с id больше последнего прочитанного
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    # Событие шины инвалидации кэшей: тема ("test") и ключ (id теста)
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    # Документ полнотекстового поиска: строка теста (название, описание) или вопроса
+    # (текст вопроса и всех его вариантов). В SQLite по этой таблице построен индекс FTS5
+    # search_index, который обновляется триггерами (миграция 0006)
+    id = Column(Integer, primary_key=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), nullable=False, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"))  # NULL у строки самого теста
+    title = Column(Text, nullable=False, default="")
+    description = Column(Text, nullable=False, default="")
+    question_text = Column(Text, nullable=False, default="")
+    option_text = Column(Text, nullable=False, default="")
@@ -0,0 +1,133 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+from typing import Dict, List
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+from models import Test, Question, Option, TestQuestion, User, TestResult
+
+# Общие запросы для списков и деталей: всё, что раньше подгружалось лениво
+# построчно, выбирается фиксированным числом запросов
+
+
+def tests_with_content(db: Session):
+    # Тесты вместе с вопросами и вариантами (3 запроса на любое число тестов).
+    # Варианты - subqueryload: selectinload разбивает IN по 500 id, и на странице
+    # тестов с тысячами вопросов запросов вариантов становилось больше
+    return db.query(Test).options(
+        selectinload(Test.questions).subqueryload(Question.options)
+    )
+
+
+def get_test_with_content(db: Session, test_id: int):
+    return tests_with_content(db).filter(Test.id == test_id).first()
+
+
+def tests_with_questions_count(db: Session):
+    # Колонки теста и количество вопросов одним запросом с GROUP BY
+    return (
+        db.query(
+            Test.id,
+            Test.title,
+            Test.description,
+            Test.created_at,
+            func.count(TestQuestion.question_id).label("questions_count"),
+        )
+        .outerjoin(TestQuestion, TestQuestion.test_id == Test.id)
+        .group_by(Test.id)
+    )
+
+
+def bank_questions(db: Session, teacher_id: Optional[int] = None):
+    # Версии вопросов банка с числом тестов, в которые они входят; teacher_id - только
+    # версии из тестов этого преподавателя
+    query = (
+        db.query(
+            Question.id,
+            Question.question_text,
+            Question.created_at,
+            func.count(TestQuestion.test_id).label("tests_count"),
+        )
+        .outerjoin(TestQuestion, TestQuestion.question_id == Question.id)
+        .group_by(Question.id)
+    )
+    if teacher_id is not None:
+        query = query.filter(Question.id.in_(
+            db.query(TestQuestion.question_id)
+            .join(Test, Test.id == TestQuestion.test_id)
+            .filter(Test.teacher_id == teacher_id)
+        ))
+    return query
+
+
+def options_by_question(db: Session, question_ids: List[int]) -> Dict[int, List[Option]]:
+    # Варианты нескольких версий одним запросом, в порядке position
+    options: Dict[int, List[Option]] = {question_id: [] for question_id in question_ids}
+    for option in (
+        db.query(Option)
+        .filter(Option.question_id.in_(question_ids))
+        .order_by(Option.question_id, Option.position, Option.id)
+    ):
+        options[option.question_id].append(option)
+    return options
+
+
+def results_with_refs(db: Session):
+    # Результаты с именем студента и названием теста без загрузки ORM-объектов.
+    # Внешнее соединение с тестами: результаты удаленных тестов (test_id = NULL) остаются
+    # в списках, потоках и выгрузках с test_title = None - как и в выгрузке ответов
+    return (
+        db.query(
+            TestResult.id,
+            TestResult.user_id,
+            TestResult.test_id,
+            TestResult.score,
+            TestResult.total_questions,
+            TestResult.completed_at,
+            User.username.label("username"),
+            Test.title.label("test_title"),
+        )
+        .join(User, User.id == TestResult.user_id)
+        .outerjoin(Test, Test.id == TestResult.test_id)
+    )
+
+
+def get_result_with_content(db: Session, result_id: int):
+    # Результат с полным содержимым теста (выбранные варианты - answer_store.load_selected)
+    return (
+        db.query(TestResult)
+        .options(
+            selectinload(TestResult.test)
+            .selectinload(Test.questions)
+            .subqueryload(Question.options),
+        )
+        .filter(TestResult.id == result_id)
+        .first()
+    )
+
+
+def filter_results(query, test_id=None, student_id=None, date_from=None, date_to=None):
+    # Серверные фильтры списков результатов (покрываются составными индексами test_results)
+    if test_id is not None:
+        query = query.filter(TestResult.test_id == test_id)
+    if student_id is not None:
+        query = query.filter(TestResult.user_id == student_id)
+    if date_from is not None:
+        query = query.filter(TestResult.completed_at >= date_from)
+    if date_to is not None:
+        query = query.filter(TestResult.completed_at < date_to)
+    return query
+
+
+class ResultFilters(NamedTuple):
+    # Те же фильтры одним значением - для потоковых ответов и выгрузок
+    test_id: Optional[int] = None
+    student_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+    def apply(self, query):
+        return filter_results(query, self.test_id, self.student_id, self.date_from, self.date_to)
+
+
+# Порядок выдачи результатов: новые сначала
+RESULT_ORDER = (TestResult.completed_at, TestResult.id)
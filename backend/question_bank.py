@@ -0,0 +1,122 @@
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, except_, exists, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from database import supports_bulk_returning
+from models import Option, Question, QuestionStat, SearchDocument, TestQuestion, UserAnswer
+
+# Банк вопросов: версии вопросов неизменяемы и адресуются хешем содержимого
+# (текст вопроса, тексты вариантов с правильностью, порядок вариантов).
+# Одинаковый вопрос в любом числе тестов хранится одной строкой questions и одним
+# набором options; тест ссылается на версии через test_questions. Изменение вопроса
+# в тесте - это ссылка на другую версию, остальные тесты его не видят.
+
+# (текст вопроса, [(текст варианта, правильный), ...])
+QuestionContent = Tuple[str, Sequence[Tuple[str, bool]]]
+
+
+def content_of(question) -> QuestionContent:
+    # QuestionCreate / QuestionUpdate (или ORM-вопрос с загруженными вариантами)
+    return question.question_text, [(option.option_text, bool(option.is_correct)) for option in question.options]
+
+
+def content_hash(content: QuestionContent) -> str:
+    question_text, options = content
+    canonical = json.dumps([question_text, [[text, bool(correct)] for text, correct in options]],
+                           ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def store_questions(db: Session, contents: List[QuestionContent]) -> List[int]:
+    # id версий для содержимого в порядке contents; недостающие версии создаются.
+    # Одинаковое содержимое в одной пачке и у параллельной транзакции дает одну версию
+    hashes = [content_hash(content) for content in contents]
+    ids = _existing_versions(db, set(hashes))
+
+    missing: Dict[str, QuestionContent] = {}
+    for digest, content in zip(hashes, contents):
+        if digest not in ids:
+            missing.setdefault(digest, content)
+    if missing:
+        created = _insert_versions(db, missing)
+        option_rows = [
+            {"question_id": question_id, "option_text": text, "is_correct": correct, "position": position}
+            for digest, question_id in created.items()
+            for position, (text, correct) in enumerate(missing[digest][1])
+        ]
+        if option_rows:
+            db.execute(insert(Option), option_rows)
+        ids.update(created)
+        # Версии, которые успела создать другая транзакция
+        ids.update(_existing_versions(db, set(missing) - set(created)))
+
+    return [ids[digest] for digest in hashes]
+
+
+def _existing_versions(db: Session, hashes: set) -> Dict[str, int]:
+    if not hashes:
+        return {}
+    return dict(db.query(Question.content_hash, Question.id).filter(Question.content_hash.in_(hashes)))
+
+
+def _insert_versions(db: Session, missing: Dict[str, QuestionContent]) -> Dict[str, int]:
+    # content_hash -> id для версий, вставленных этим вызовом
+    rows = [{"content_hash": digest, "question_text": content[0]} for digest, content in missing.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql") and supports_bulk_returning(db):
+        insert_ = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert_(Question).on_conflict_do_nothing(index_elements=["content_hash"])
+        returned = db.execute(stmt.returning(Question.content_hash, Question.id), rows).all()
+        return dict(returned)
+    return {row["content_hash"]: db.execute(insert(Question).values(**row)).inserted_primary_key[0] for row in rows}
+
+
+def link_questions(db: Session, links: List[Tuple[int, int, int]]) -> None:
+    # links: (test_id, question_id, position)
+    if links:
+        db.execute(insert(TestQuestion), [
+            {"test_id": test_id, "question_id": question_id, "position": position}
+            for test_id, question_id, position in links
+        ])
+
+
+def test_question_ids(db: Session, test_id: int) -> List[int]:
+    return [
+        question_id for question_id, in db.query(TestQuestion.question_id)
+        .filter(TestQuestion.test_id == test_id)
+        .order_by(TestQuestion.position)
+    ]
+
+
+def get_version(db: Session, question_id: int) -> Optional[Question]:
+    return db.query(Question).filter(Question.id == question_id).first()
+
+
+def prune_unused(db: Session, batch_size: int = 1000) -> int:
+    # Удаление версий, на которые не ссылаются ни тесты, ни сохраненные ответы, ни статистика
+    # (старые версии измененных вопросов без попыток); возвращает число удаленных версий.
+    # Каждая таблица ссылок читается один раз (EXCEPT), а не проверяется построчно
+    unused = db.execute(except_(
+        select(Question.id),
+        select(TestQuestion.question_id),
+        select(UserAnswer.question_id).where(UserAnswer.question_id.isnot(None)),
+        select(QuestionStat.question_id),
+        select(SearchDocument.question_id).where(SearchDocument.question_id.isnot(None)),
+    )).scalars().all()
+
+    removed = 0
+    for start in range(0, len(unused), batch_size):
+        batch = unused[start:start + batch_size]
+        # Повторная проверка ссылок из тестов: версию могли снова выбрать после чтения списка
+        removed += db.execute(
+            delete(Question)
+            .where(Question.id.in_(batch), ~exists().where(TestQuestion.question_id == Question.id))
+        ).rowcount
+        db.execute(
+            delete(Option)
+            .where(Option.question_id.in_(batch), ~exists().where(Question.id == Option.question_id))
+        )
+        db.commit()
+    return removed
@@ -0,0 +1,202 @@
+import asyncio
+import math
+from time import monotonic
+from typing import Dict, Optional
+from starlette.responses import JSONResponse
+from cache import LRUCache
+from config import RATE_LIMIT_DEFAULTS, RATE_LIMITS, RATE_LIMIT_QUEUE_TIMEOUT, RATE_LIMIT_MAX_KEYS
+from security import read_token
+import metrics
+
+# Допуск запросов в пиковые часы: сначала маркерное ведро пользователя (запросы без токена -
+# ведро IP со своим лимитом anonymous: за NAT класса с одного адреса приходят все студенты),
+# затем общее ведро группы маршрутов, затем ограничение одновременных запросов группы.
+# Лишние запросы сразу получают 429 / 503 с Retry-After, а не копятся в очереди пула БД.
+# Middleware работает в цикле событий (один поток), поэтому ведра и счетчики без блокировок.
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def take(self, now: float) -> float:
+        # 0, если маркер взят, иначе через сколько секунд появится следующий
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ConcurrencyGate:
+    # Не больше limit запросов одновременно и не больше queue ожидающих; остальным - отказ
+    def __init__(self, limit: int, queue: int):
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self, timeout: float) -> bool:
+        if self._semaphore.locked():
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+
+def parse_limits(spec: str) -> Dict[str, float]:
+    # "user=5:20,anonymous=100:400,global=500:1000,concurrency=32,queue=256" -> плоский словарь значений
+    limits = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name in ("user", "anonymous", "global"):
+            rate, _, burst = value.partition(":")
+            limits[f"{name}_rate"] = float(rate)
+            limits[f"{name}_burst"] = float(burst or rate)
+        elif name in ("concurrency", "queue"):
+            limits[name] = int(value)
+        else:
+            raise ValueError(f"Unknown rate limit setting: {name!r}")
+    return limits
+
+
+class RouteGroup:
+    def __init__(self, name: str, limits: Dict[str, float], max_keys: int):
+        self.name = name
+        self.user_rate = limits.get("user_rate", 0)
+        self.user_burst = max(limits.get("user_burst", 0), 1)
+        # Без отдельного лимита anonymous адрес клиента ограничивается как пользователь
+        self.anonymous_rate = limits.get("anonymous_rate", self.user_rate)
+        self.anonymous_burst = max(limits.get("anonymous_burst", self.user_burst), 1)
+        self.user_buckets = LRUCache(max_keys)
+        self.global_bucket = (
+            TokenBucket(limits["global_rate"], max(limits.get("global_burst", 0), 1))
+            if limits.get("global_rate") else None
+        )
+        self.gate = ConcurrencyGate(int(limits["concurrency"]), int(limits.get("queue", 0))) \
+            if limits.get("concurrency") else None
+
+        labels = {"group": name}
+        self.admitted = metrics.counter("http_requests_admitted_total", "Requests admitted by rate limiter", labels)
+        self.rejected = {
+            reason: metrics.counter(
+                "http_requests_rejected_total", "Requests rejected by rate limiter",
+                {"group": name, "reason": reason},
+            )
+            for reason in ("user_rate", "anonymous_rate", "global_rate", "overloaded")
+        }
+        if self.gate is not None:
+            gate = self.gate
+            metrics.gauge("http_requests_in_flight", "Admitted requests in progress", lambda: gate.active, labels)
+            metrics.gauge("http_requests_queued", "Requests waiting for a concurrency slot",
+                          lambda: gate.waiting, labels)
+
+    def check_rate(self, key: str, now: float) -> Optional[tuple]:
+        # (причина, Retry-After) при превышении, иначе None
+        anonymous = key.startswith("ip:")
+        rate, burst = (self.anonymous_rate, self.anonymous_burst) if anonymous else (self.user_rate, self.user_burst)
+        if rate:
+            bucket = self.user_buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, burst)
+                self.user_buckets.put(key, bucket)
+            wait = bucket.take(now)
+            if wait:
+                return "anonymous_rate" if anonymous else "user_rate", wait
+        if self.global_bucket is not None:
+            wait = self.global_bucket.take(now)
+            if wait:
+                return "global_rate", wait
+        return None
+
+
+def build_groups(max_keys: int = RATE_LIMIT_MAX_KEYS) -> Dict[str, RouteGroup]:
+    # Значения по умолчанию из config, поверх них - переопределения RATE_LIMIT_<GROUP>
+    return {
+        name: RouteGroup(name, {**parse_limits(default), **parse_limits(RATE_LIMITS.get(name, ""))}, max_keys)
+        for name, default in RATE_LIMIT_DEFAULTS.items()
+    }
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_key(scope) -> str:
+    # Пользователь из подписанного токена (без БД), иначе адрес клиента
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization[:7].lower() == "bearer ":
+        claims = read_token(authorization[7:].strip())
+        if claims is not None and "sub" in claims:
+            return f"user:{claims['sub']}"
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail}, status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionControlMiddleware:
+    # ASGI-middleware: ответ (в том числе потоковый) держит место в группе до конца отправки
+    def __init__(self, app, groups: Optional[Dict[str, RouteGroup]] = None,
+                 queue_timeout: float = RATE_LIMIT_QUEUE_TIMEOUT):
+        self.app = app
+        self.groups = groups if groups is not None else build_groups()
+        self.queue_timeout = queue_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        group = self.groups.get(scope["path"].strip("/").partition("/")[0])
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        limited = group.check_rate(client_key(scope), monotonic())
+        if limited is not None:
+            reason, retry_after = limited
+            group.rejected[reason].inc()
+            await _reject(429, "Too many requests", retry_after)(scope, receive, send)
+            return
+
+        gate = group.gate
+        if gate is not None and not await gate.acquire(self.queue_timeout):
+            group.rejected["overloaded"].inc()
+            await _reject(503, "Server is busy, try again later", 1)(scope, receive, send)
+            return
+
+        group.admitted.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if gate is not None:
+                gate.release()
@@ -1,40 +1,78 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, Database
+from config import AUTH_TOKEN_TTL
+from security import hash_password, verify_password, needs_rehash, issue_token, principal_cache
 from models import User
-from schemas import UserCreate, UserLogin, UserResponse
+from schemas import UserCreate, UserLogin, UserResponse, LoginResponse
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# Хеширование пароля намеренно медленное (PBKDF2), поэтому выполняется в пуле потоков,
+# вне run_sync: в асинхронном режиме run_sync работает в потоке event loop
+
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: Database = Depends(get_db)):
+    # Проверки до хеширования: заведомо отклоняемая регистрация не тратит раунд PBKDF2
+    await db.run_sync(_check_registration, user)
+    password_hash = await run_in_threadpool(hash_password, user.password)
+    return await db.run_sync(_register, user, password_hash)
+
+def _check_registration(db: Session, user: UserCreate):
     # Проверка существования пользователя
-    existing_user = db.query(User).filter(User.username == user.username).first()
-    if existing_user:
+    if db.query(User.id).filter(User.username == user.username).first():
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Проверка роли
     if user.role not in ["student", "teacher"]:
         raise HTTPException(status_code=400, detail="Role must be 'student' or 'teacher'")
-    
-    # Создание пользователя (без хеширования)
+
+def _register(db: Session, user: UserCreate, password_hash: str):
+    # Создание пользователя; одновременную регистрацию того же имени
+    # останавливает уникальный индекс username
     new_user = User(
         username=user.username,
-        password=user.password,
+        password=password_hash,
         role=user.role
     )
     db.add(new_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Username already exists")
     db.refresh(new_user)
     
     return new_user
 
-@router.post("/login", response_model=UserResponse)
-def login(user: UserLogin, db: Session = Depends(get_db)):
+@router.post("/login", response_model=LoginResponse)
+async def login(user: UserLogin, db: Database = Depends(get_db)):
     # Поиск пользователя
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await db.run_sync(
+        lambda session: session.query(User.id, User.username, User.role, User.password)
+        .filter(User.username == user.username).first()
+    )
     
-    if not db_user or db_user.password != user.password:
+    if not db_user or not await run_in_threadpool(verify_password, user.password, db_user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    return db_user
+    # Старый формат хранения (открытый текст или меньше итераций) - перехешируем
+    if needs_rehash(db_user.password):
+        password_hash = await run_in_threadpool(hash_password, user.password)
+        await db.run_sync(_update_password, db_user.id, password_hash)
+    
+    principal_cache.invalidate(db_user.id)
+    
+    return LoginResponse(
+        id=db_user.id,
+        username=db_user.username,
+        role=db_user.role,
+        access_token=issue_token(db_user.id, db_user.role),
+        expires_in=AUTH_TOKEN_TTL
+    )
+
+def _update_password(db: Session, user_id: int, password_hash: str):
+    db.query(User).filter(User.id == user_id).update({User.password: password_hash}, synchronize_session=False)
+    db.commit()
@@ -1,21 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-import json
-from database import get_db
+from typing import List, Optional, Union
+from datetime import datetime
+from database import get_db, Database
+from answer_keys import get_answer_key, grade, restrict_key
+from answer_store import load_selected
+from config import SUBMIT_QUEUE
+from submission_queue import PendingSubmission, submission_writer, write_submissions
+from snapshots import get_test_snapshot, snapshot_response
+from variants import get_attempt, get_canonical, render_variant, start_attempt, variant_question_ids, seal_attempt, attempt_question_ids, has_variants, requires_attempt
+from autosave import answer_list, answer_patch, answers_json, autosave_buffer, current_answers, decode_answers, encode_answers, save_answers
+from queries import tests_with_content, tests_with_questions_count, get_result_with_content, results_with_refs, filter_results, ResultFilters, RESULT_ORDER
+from streaming import stream_results
+from pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from security import Principal, require_student
 from models import Test, Question, Option, User, TestResult, UserAnswer
-from schemas import TestResponseStudent, TestSubmit, DetailedResultResponse, ResultResponse
+from schemas import TestResponseStudent, TestCatalogResponse, TestSubmit, DetailedResultResponse, ResultResponse, AttemptResponse, AttemptAnswersPatch
 
 router = APIRouter(prefix="/student", tags=["student"])
 
-@router.get("/tests", response_model=List[TestResponseStudent])
-def get_tests_for_student(db: Session = Depends(get_db)):
-    tests = db.query(Test).all()
+@router.get("/tests", response_model=Union[List[TestCatalogResponse], List[TestResponseStudent]])
+async def get_tests_for_student(
+    response: Response,
+    full: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_get_tests_for_student, response, full, cursor, limit)
+
+def _get_tests_for_student(
+    db: Session,
+    response: Response,
+    full: bool,
+    cursor: Optional[str],
+    limit: int
+):
+    # По умолчанию - каталог (без вопросов) одним запросом;
+    # содержимое теста загружается через /student/tests/{test_id}
+    if not full:
+        tests, next_cursor = paginate(tests_with_questions_count(db), (Test.id,), cursor, limit)
+        set_next_cursor(response, next_cursor)
+        return [TestCatalogResponse(**row._mapping) for row in tests]
+    
+    tests, next_cursor = paginate(tests_with_content(db), (Test.id,), cursor, limit)
+    set_next_cursor(response, next_cursor)
     
     result = []
     for test in tests:
         questions_data = []
-        for question in test.questions:
+        # Вопросы теста с вариантами выдаются только через попытку
+        questions = [] if has_variants(test) else test.questions
+        for question in questions:
             options_data = [
                 {"id": opt.id, "option_text": opt.option_text}
                 for opt in question.options
@@ -36,95 +72,199 @@ def get_tests_for_student(db: Session = Depends(get_db)):
     return result
 
 @router.get("/tests/{test_id}", response_model=TestResponseStudent)
-def get_test_for_student(test_id: int, db: Session = Depends(get_db)):
-    test = db.query(Test).filter(Test.id == test_id).first()
-    if not test:
+async def get_test_for_student(test_id: int, request: Request, db: Database = Depends(get_db)):
+    return await db.run_sync(_get_test_for_student, test_id, request)
+
+def _get_test_for_student(db: Session, test_id: int, request: Request):
+    if requires_attempt(db, test_id):
+        raise HTTPException(status_code=403, detail="This test is available only through an attempt")
+    
+    snapshot = get_test_snapshot(db, test_id, "student")
+    if not snapshot:
         raise HTTPException(status_code=404, detail="Test not found")
     
-    questions_data = []
-    for question in test.questions:
-        options_data = [
-            {"id": opt.id, "option_text": opt.option_text}
-            for opt in question.options
-        ]
-        questions_data.append({
-            "id": question.id,
-            "question_text": question.question_text,
-            "options": options_data
-        })
+    return snapshot_response(request, snapshot)
+
+@router.post("/tests/{test_id}/attempts", response_model=AttemptResponse)
+async def start_test_attempt(
+    test_id: int,
+    student: Principal = Depends(require_student),
+    db: Database = Depends(get_db)
+):
+    # Новая попытка со своим вариантом теста; ответы отправляются с attempt_id
+    return await db.run_sync(_start_test_attempt, test_id, student.id)
+
+def _start_test_attempt(db: Session, test_id: int, student_id: int):
+    body = start_attempt(db, test_id, student_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Test not found")
     
-    return TestResponseStudent(
-        id=test.id,
-        title=test.title,
-        description=test.description,
-        questions=questions_data
-    )
+    return Response(content=body, media_type="application/json")
+
+@router.get("/attempts/{attempt_id}", response_model=AttemptResponse)
+async def get_test_attempt(
+    attempt_id: int,
+    student: Principal = Depends(require_student),
+    db: Database = Depends(get_db)
+):
+    # Тот же вариант повторно (например, после перезагрузки страницы) с сохраненными ответами
+    return await db.run_sync(_get_test_attempt, attempt_id, student.id)
+
+def _get_test_attempt(db: Session, attempt_id: int, student_id: int):
+    attempt = _own_attempt(db, attempt_id, student_id)
+    canonical = get_canonical(db, attempt.test_id)
+    if canonical is None:
+        raise HTTPException(status_code=404, detail="Test not found")
+    
+    if attempt.submitted_at is not None:
+        answers = decode_answers(attempt.answers)
+    else:
+        answers = current_answers(attempt.answers, attempt.id)
+    body = render_variant(canonical, attempt.id, attempt.seed, answers_json(answers), attempt.submitted_at is not None)
+    return Response(content=body, media_type="application/json")
+
+@router.patch("/attempts/{attempt_id}/answers")
+async def save_attempt_answers(
+    attempt_id: int,
+    patch: AttemptAnswersPatch,
+    student: Principal = Depends(require_student),
+    db: Database = Depends(get_db)
+):
+    # Автосохранение: изменения ответов копятся в памяти и записываются пачками (autosave.py)
+    return await db.run_sync(_save_attempt_answers, attempt_id, patch, student.id)
+
+def _save_attempt_answers(db: Session, attempt_id: int, patch: AttemptAnswersPatch, student_id: int):
+    attempt = _own_attempt(db, attempt_id, student_id)
+    if attempt.submitted_at is not None:
+        raise HTTPException(status_code=409, detail="Attempt already submitted")
+    canonical = get_canonical(db, attempt.test_id)
+    if canonical is None:
+        raise HTTPException(status_code=404, detail="Test not found")
+    
+    question_ids = set(variant_question_ids(canonical, attempt.seed))
+    if any(answer.question_id not in question_ids for answer in patch.answers):
+        raise HTTPException(status_code=400, detail="Question is not part of this attempt")
+    
+    answers = answer_patch(patch.answers)
+    queued = save_answers(db, attempt.id, answers) if answers else False
+    return {"attempt_id": attempt.id, "saved": len(answers), "queued": queued}
+
+def _own_attempt(db: Session, attempt_id: int, student_id: int):
+    attempt = get_attempt(db, attempt_id)
+    if not attempt:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    if attempt.user_id != student_id:
+        raise HTTPException(status_code=403, detail="You can only access your own attempts")
+    return attempt
 
 @router.post("/submit")
-def submit_test(submission: TestSubmit, student_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - студент
-    student = db.query(User).filter(User.id == student_id, User.role == "student").first()
-    if not student:
-        raise HTTPException(status_code=403, detail="Only students can submit tests")
-    
-    # Поиск теста
-    test = db.query(Test).filter(Test.id == submission.test_id).first()
-    if not test:
+async def submit_test(
+    submission: TestSubmit,
+    student: Principal = Depends(require_student),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_submit_test, submission, student.id)
+
+def _submit_test(db: Session, submission: TestSubmit, student_id: int):
+    # Ключ ответов теста (из кэша, без запросов к вопросам и вариантам)
+    answer_key = get_answer_key(db, submission.test_id)
+    if answer_key is None:
         raise HTTPException(status_code=404, detail="Test not found")
     
+    # Попытка с вариантом: проверяются только вопросы варианта, выведенные из seed.
+    # Ответы - автосохраненные, поверх них присланные с отправкой
+    attempt, answers = None, submission.answers
+    if submission.attempt_id is None and requires_attempt(db, submission.test_id):
+        raise HTTPException(status_code=400, detail="This test must be submitted with attempt_id")
+    if submission.attempt_id is not None:
+        attempt = _own_attempt(db, submission.attempt_id, student_id)
+        if attempt.test_id != submission.test_id:
+            raise HTTPException(status_code=400, detail="Attempt belongs to another test")
+        # Повторная отправка (повтор запроса клиентом) - тот же результат без записи
+        if attempt.submitted_at is not None:
+            return _sealed_result(attempt)
+        canonical = get_canonical(db, submission.test_id)
+        question_ids = variant_question_ids(canonical, attempt.seed)
+        answer_key = restrict_key(answer_key, question_ids)
+        # Буфер автосохранения очищается только после коммита запечатанной попытки:
+        # при ошибке записи несохраненные изменения остаются в нем
+        final_answers = {
+            **decode_answers(attempt.answers), **autosave_buffer.peek(attempt.id), **answer_patch(submission.answers)
+        }
+        answers = answer_list(final_answers)
+    
     # Проверка ответов и подсчет баллов
-    score = 0
-    total_questions = len(test.questions)
+    score, graded = grade(answer_key, answers)
+    total_questions = len(answer_key.correct)
     
-    for answer in submission.answers:
-        question = db.query(Question).filter(Question.id == answer.question_id).first()
-        if not question:
-            continue
-        
-        # Получаем правильные варианты для вопроса
-        correct_options = set(
-            opt.id for opt in question.options if opt.is_correct
-        )
-        
-        # Получаем выбранные студентом варианты
-        selected_options = set(answer.selected_option_ids)
-        
-        # Ответ правильный только если выбраны ВСЕ правильные и НЕ выбраны неправильные
-        if correct_options == selected_options:
-            score += 1
+    # В запечатанной попытке хранятся все вопросы варианта: по ним строится подробный результат
+    if attempt is not None and not seal_attempt(
+        db, attempt.id, encode_answers({question_id: final_answers.get(question_id, []) for question_id in question_ids}),
+        score, total_questions
+    ):
+        # Попытку запечатала одновременная отправка
+        db.rollback()
+        return _sealed_result(get_attempt(db, attempt.id))
     
-    # Создание результата
-    result = TestResult(
-        user_id=student_id,
+    percentage = round((score / total_questions * 100), 2) if total_questions > 0 else 0
+    pending = PendingSubmission(
+        student_id=student_id,
         test_id=submission.test_id,
         score=score,
-        total_questions=total_questions
+        total_questions=total_questions,
+        graded=graded,
+        completed_at=datetime.utcnow(),
+        attempt_id=attempt.id if attempt is not None else None
     )
-    db.add(result)
-    db.flush()
-    
-    # Сохранение ответов
-    for answer in submission.answers:
-        user_answer = UserAnswer(
-            result_id=result.id,
-            question_id=answer.question_id,
-            selected_options=json.dumps(answer.selected_option_ids)
-        )
-        db.add(user_answer)
     
+    # Отложенная запись: результат появится в базе при ближайшей записи пачки.
+    # Попытка запечатывается до постановки в очередь - повторная отправка не попадет туда дважды
+    if attempt is not None and SUBMIT_QUEUE:
+        db.commit()
+        autosave_buffer.discard(attempt.id)
+    if SUBMIT_QUEUE and submission_writer.submit(pending):
+        return {
+            "result_id": None,
+            "queued": True,
+            "score": score,
+            "total_questions": total_questions,
+            "percentage": percentage
+        }
+    
+    # Результат, ответы (пакетно), инкрементальная статистика и result_id попытки - в одной транзакции
+    result_id, = write_submissions(db, [pending])
     db.commit()
-    db.refresh(result)
+    if attempt is not None:
+        autosave_buffer.discard(attempt.id)
     
     return {
-        "result_id": result.id,
+        "result_id": result_id,
+        "queued": False,
         "score": score,
         "total_questions": total_questions,
-        "percentage": round((score / total_questions * 100), 2) if total_questions > 0 else 0
+        "percentage": percentage
+    }
+
+def _sealed_result(attempt):
+    # Ответ на отправку уже запечатанной попытки; result_id - None, если результат был в очереди
+    return {
+        "result_id": attempt.result_id,
+        "queued": attempt.result_id is None,
+        "score": attempt.score,
+        "total_questions": attempt.total_questions,
+        "percentage": round((attempt.score / attempt.total_questions * 100), 2) if attempt.total_questions > 0 else 0
     }
 
 @router.get("/results/{result_id}", response_model=DetailedResultResponse)
-def get_result_details(result_id: int, student_id: int, db: Session = Depends(get_db)):
-    result = db.query(TestResult).filter(TestResult.id == result_id).first()
+async def get_result_details(
+    result_id: int,
+    student: Principal = Depends(require_student),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_get_result_details, result_id, student.id)
+
+def _get_result_details(db: Session, result_id: int, student_id: int):
+    result = get_result_with_content(db, result_id)
     if not result:
         raise HTTPException(status_code=404, detail="Result not found")
     
@@ -133,22 +273,33 @@ def get_result_details(result_id: int, student_id: int, db: Session = Depends(ge
         raise HTTPException(status_code=403, detail="You can only view your own results")
     
     test = result.test
+    if test is None:
+        # Тест удален: балл сохранился, содержимого вопросов больше нет
+        return DetailedResultResponse(
+            id=result.id,
+            score=result.score,
+            total_questions=result.total_questions,
+            completed_at=result.completed_at,
+            test_title=None,
+            questions=[]
+        )
+    
+    selected_by_question = load_selected(db, result.id)
     questions_data = []
     
-    for question in test.questions:
-        # Находим ответ студента на этот вопрос
-        user_answer = next(
-            (ans for ans in result.answers if ans.question_id == question.id),
-            None
-        )
-        
-        selected_ids = []
-        if user_answer:
-            selected_ids = json.loads(user_answer.selected_options)
+    # Результат попытки с вариантом - вопросы варианта, в том числе оставленные без ответа
+    questions = test.questions
+    question_ids = attempt_question_ids(db, result.id)
+    if question_ids is not None:
+        questions = [question for question in questions if question.id in question_ids]
+    
+    for question in questions:
+        # Выбранные студентом варианты по этому вопросу
+        selected_ids = selected_by_question.get(question.id, frozenset())
         
         # Собираем информацию о вариантах
         options_info = []
-        correct_ids = []
+        correct_ids = set()
         for opt in question.options:
             options_info.append({
                 "id": opt.id,
@@ -157,10 +308,10 @@ def get_result_details(result_id: int, student_id: int, db: Session = Depends(ge
                 "was_selected": opt.id in selected_ids
             })
             if opt.is_correct:
-                correct_ids.append(opt.id)
+                correct_ids.add(opt.id)
         
         # Определяем правильность ответа
-        is_correct = set(selected_ids) == set(correct_ids)
+        is_correct = selected_ids == correct_ids
         
         questions_data.append({
             "question_text": question.question_text,
@@ -178,20 +329,40 @@ def get_result_details(result_id: int, student_id: int, db: Session = Depends(ge
     )
 
 @router.get("/my-results", response_model=List[ResultResponse])
-def get_my_results(student_id: int, db: Session = Depends(get_db)):
-    results = db.query(TestResult).filter(TestResult.user_id == student_id).all()
+async def get_my_results(
+    request: Request,
+    response: Response,
+    test_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    student: Principal = Depends(require_student),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(
+        _get_my_results, student.id, request, response, test_id, date_from, date_to, cursor, limit, stream
+    )
+
+def _get_my_results(
+    db: Session,
+    student_id: int,
+    request: Request,
+    response: Response,
+    test_id: Optional[int],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    stream: bool
+):
+    # Потоковый режим: все результаты студента после курсора одним ответом
+    if stream:
+        return stream_results(request, ResultFilters(test_id, student_id, date_from, date_to), cursor)
     
-    response = []
-    for result in results:
-        response.append(ResultResponse(
-            id=result.id,
-            user_id=result.user_id,
-            test_id=result.test_id,
-            score=result.score,
-            total_questions=result.total_questions,
-            completed_at=result.completed_at,
-            username=result.user.username,
-            test_title=result.test.title
-        ))
+    query = filter_results(results_with_refs(db), test_id, student_id, date_from, date_to)
+    results, next_cursor = paginate(query, RESULT_ORDER, cursor, limit, descending=True)
+    set_next_cursor(response, next_cursor)
     
-    return response
+    return [ResultResponse(**row._mapping) for row in results]
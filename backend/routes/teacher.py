@@ -1,133 +1,284 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
+from typing import List, Optional
+from datetime import datetime
+from database import get_db, Database
+from queries import results_with_refs, filter_results, ResultFilters, RESULT_ORDER
+from pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from config import USE_STATS_SUMMARY, PASS_THRESHOLD
+from score_stats import histogram_from_results, histogram_from_summary, summarize
+from item_stats import item_analysis
+from streaming import stream_results
+from export import FORMATS, arrow_available, iter_export, score_distribution
+from security import Principal, require_teacher
 from models import TestResult, User, Test
 from schemas import ResultResponse
 
 router = APIRouter(prefix="/teacher", tags=["teacher"])
 
 @router.get("/results", response_model=List[ResultResponse])
-def get_all_results(teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can view all results")
-    
-    # Получаем все результаты
-    results = db.query(TestResult).all()
+async def get_all_results(
+    request: Request,
+    response: Response,
+    test_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(
+        _get_all_results,
+        request,
+        response,
+        test_id,
+        student_id,
+        date_from,
+        date_to,
+        cursor,
+        limit,
+        stream,
+    )
+
+def _get_all_results(
+    db: Session,
+    request: Request,
+    response: Response,
+    test_id: Optional[int],
+    student_id: Optional[int],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    stream: bool
+):
+    # Потоковый режим: все строки после курсора, без построения списка моделей
+    if stream:
+        return stream_results(request, ResultFilters(test_id, student_id, date_from, date_to), cursor)
     
-    response = []
-    for result in results:
-        response.append(ResultResponse(
-            id=result.id,
-            user_id=result.user_id,
-            test_id=result.test_id,
-            score=result.score,
-            total_questions=result.total_questions,
-            completed_at=result.completed_at,
-            username=result.user.username,
-            test_title=result.test.title
-        ))
+    # Получаем результаты страницами с фильтрами
+    query = filter_results(results_with_refs(db), test_id, student_id, date_from, date_to)
+    results, next_cursor = paginate(query, RESULT_ORDER, cursor, limit, descending=True)
+    set_next_cursor(response, next_cursor)
     
-    return response
+    return [ResultResponse(**row._mapping) for row in results]
 
 @router.get("/results/test/{test_id}", response_model=List[ResultResponse])
-def get_results_by_test(test_id: int, teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can view results")
-    
+async def get_results_by_test(
+    test_id: int,
+    request: Request,
+    response: Response,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(
+        _get_results_by_test,
+        test_id,
+        request,
+        response,
+        date_from,
+        date_to,
+        cursor,
+        limit,
+        stream,
+    )
+
+def _get_results_by_test(
+    db: Session,
+    test_id: int,
+    request: Request,
+    response: Response,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    stream: bool
+):
     # Проверка существования теста
     test = db.query(Test).filter(Test.id == test_id).first()
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     
-    # Получаем результаты по конкретному тесту
-    results = db.query(TestResult).filter(TestResult.test_id == test_id).all()
+    if stream:
+        return stream_results(request, ResultFilters(test_id=test_id, date_from=date_from, date_to=date_to), cursor)
     
-    response = []
-    for result in results:
-        response.append(ResultResponse(
-            id=result.id,
-            user_id=result.user_id,
-            test_id=result.test_id,
-            score=result.score,
-            total_questions=result.total_questions,
-            completed_at=result.completed_at,
-            username=result.user.username,
-            test_title=result.test.title
-        ))
+    # Получаем результаты по конкретному тесту
+    query = filter_results(results_with_refs(db), test_id=test_id, date_from=date_from, date_to=date_to)
+    results, next_cursor = paginate(query, RESULT_ORDER, cursor, limit, descending=True)
+    set_next_cursor(response, next_cursor)
     
-    return response
+    return [ResultResponse(**row._mapping) for row in results]
 
 @router.get("/results/student/{student_id}", response_model=List[ResultResponse])
-def get_results_by_student(student_id: int, teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can view results")
-    
+async def get_results_by_student(
+    student_id: int,
+    request: Request,
+    response: Response,
+    test_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(
+        _get_results_by_student,
+        student_id,
+        request,
+        response,
+        test_id,
+        date_from,
+        date_to,
+        cursor,
+        limit,
+        stream,
+    )
+
+def _get_results_by_student(
+    db: Session,
+    student_id: int,
+    request: Request,
+    response: Response,
+    test_id: Optional[int],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    cursor: Optional[str],
+    limit: int,
+    stream: bool
+):
     # Проверка существования студента
     student = db.query(User).filter(User.id == student_id, User.role == "student").first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
+    if stream:
+        return stream_results(request, ResultFilters(test_id, student_id, date_from, date_to), cursor)
+    
     # Получаем результаты конкретного студента
-    results = db.query(TestResult).filter(TestResult.user_id == student_id).all()
+    query = filter_results(results_with_refs(db), test_id, student_id, date_from, date_to)
+    results, next_cursor = paginate(query, RESULT_ORDER, cursor, limit, descending=True)
+    set_next_cursor(response, next_cursor)
     
-    response = []
-    for result in results:
-        response.append(ResultResponse(
-            id=result.id,
-            user_id=result.user_id,
-            test_id=result.test_id,
-            score=result.score,
-            total_questions=result.total_questions,
-            completed_at=result.completed_at,
-            username=result.user.username,
-            test_title=result.test.title
-        ))
+    return [ResultResponse(**row._mapping) for row in results]
+
+@router.get("/export")
+async def export_results(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|arrow|parquet)$"),
+    answers: bool = False,
+    test_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    teacher: Principal = Depends(require_teacher)
+):
+    # Потоковая выгрузка результатов (answers=true - по строке на ответ) в CSV / Arrow / Parquet
+    if fmt != "csv" and not arrow_available():
+        raise HTTPException(status_code=400, detail="Arrow and Parquet export require pyarrow")
     
-    return response
+    filters = ResultFilters(test_id, student_id, date_from, date_to)
+    filename = f"{'answers' if answers else 'results'}.{fmt}"
+    return StreamingResponse(
+        iter_export(fmt, answers, filters),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/export/summary")
+async def export_summary(
+    test_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    teacher: Principal = Depends(require_teacher)
+):
+    # Распределение процентов по отфильтрованным попыткам без выгрузки самих строк
+    return await run_in_threadpool(score_distribution, ResultFilters(test_id, student_id, date_from, date_to))
 
 @router.get("/statistics")
-def get_statistics(teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can view statistics")
-    
+async def get_statistics(
+    pass_threshold: Optional[float] = None,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_get_statistics, pass_threshold)
+
+def _get_statistics(db: Session, pass_threshold: Optional[float]):
     # Общая статистика
     total_tests = db.query(Test).count()
     total_students = db.query(User).filter(User.role == "student").count()
-    total_attempts = db.query(TestResult).count()
+    
+    # Гистограмма баллов по всем тестам одним GROUP BY
+    if USE_STATS_SUMMARY:
+        histogram = histogram_from_summary(db)
+    else:
+        histogram = histogram_from_results(db)
+    
+    total_attempts = sum(row[3] for row in histogram)
+    threshold = PASS_THRESHOLD if pass_threshold is None else pass_threshold
+    summary = summarize(histogram, threshold)
     
     # Статистика по тестам
-    tests = db.query(Test).all()
+    tests = db.query(Test.id, Test.title).order_by(Test.id).all()
     tests_stats = []
+    empty = {
+        "attempts": 0,
+        "avg_score": 0,
+        "avg_percentage": 0,
+        "median_percentage": 0,
+        "p90_percentage": 0,
+        "pass_rate": 0,
+    }
     
-    for test in tests:
-        results = db.query(TestResult).filter(TestResult.test_id == test.id).all()
-        if results:
-            avg_score = sum(r.score for r in results) / len(results)
-            avg_percentage = (avg_score / test.questions.__len__() * 100) if test.questions else 0
-        else:
-            avg_score = 0
-            avg_percentage = 0
-        
+    for test_id, title in tests:
+        stats = summary.get(test_id, empty)
         tests_stats.append({
-            "test_id": test.id,
-            "test_title": test.title,
-            "attempts": len(results),
-            "avg_score": round(avg_score, 2),
-            "avg_percentage": round(avg_percentage, 2)
+            "test_id": test_id,
+            "test_title": title,
+            "attempts": stats["attempts"],
+            "avg_score": round(stats["avg_score"], 2),
+            "avg_percentage": round(stats["avg_percentage"], 2),
+            "median_percentage": round(stats["median_percentage"], 2),
+            "p90_percentage": round(stats["p90_percentage"], 2),
+            "pass_rate": round(stats["pass_rate"], 2)
         })
     
     return {
         "total_tests": total_tests,
         "total_students": total_students,
         "total_attempts": total_attempts,
+        "pass_threshold": threshold,
         "tests_statistics": tests_stats
     }
+
+@router.get("/tests/{test_id}/item-analysis")
+async def get_item_analysis(
+    test_id: int,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_get_item_analysis, test_id)
+
+def _get_item_analysis(db: Session, test_id: int):
+    test = db.query(Test.id, Test.title).filter(Test.id == test_id).first()
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    
+    # Трудность и дискриминация по вопросам из предрасчитанных сумм
+    # (первичное заполнение: python maintenance.py rebuild-item-stats)
+    return {
+        "test_id": test.id,
+        "test_title": test.title,
+        "questions": item_analysis(db, test_id)
+    }
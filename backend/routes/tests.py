@@ -1,81 +1,242 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import ValidationError
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
-from models import Test, Question, Option, User
-from schemas import TestCreate, TestResponse, TestUpdate, TestListResponse
+from typing import List, Optional
+from database import get_db, Database
+from answer_keys import invalidate_answer_key
+from queries import tests_with_questions_count, get_test_with_content, bank_questions, options_by_question
+from content_writer import insert_questions, insert_tests, apply_question_diff
+from config import IMPORT_CHUNK_SIZE, MAX_IMPORT_CHUNK_SIZE
+from score_stats import forget_test
+from item_stats import forget_items
+from invalidation import publish_invalidation
+from search import index_tests, remove_tests, search
+from variants import forget_attempts, invalidate_canonical
+from snapshots import get_test_snapshot, snapshot_response, forget_snapshots, invalidate_snapshots
+from pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from security import Principal, require_teacher
+from models import Test, Question
+from schemas import TestCreate, TestResponse, TestUpdate, TestListResponse, SearchHit, BankQuestionResponse
 
 router = APIRouter(prefix="/tests", tags=["tests"])
 
 @router.post("/", response_model=TestResponse)
-def create_test(test: TestCreate, teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can create tests")
-    
-    # Создание теста
+async def create_test(
+    test: TestCreate,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_create_test, test, teacher.id)
+
+def _create_test(db: Session, test: TestCreate, teacher_id: int):
+    # Создание теста, затем всех вопросов и вариантов пакетными INSERT
     new_test = Test(
         title=test.title,
         description=test.description,
-        teacher_id=teacher_id
+        teacher_id=teacher_id,
+        shuffle_questions=test.shuffle_questions,
+        shuffle_options=test.shuffle_options,
+        questions_per_attempt=test.questions_per_attempt
     )
     db.add(new_test)
     db.flush()
     
-    # Создание вопросов и вариантов
-    for question_data in test.questions:
-        new_question = Question(
-            test_id=new_test.id,
-            question_text=question_data.question_text
-        )
-        db.add(new_question)
-        db.flush()
-        
-        for option_data in question_data.options:
-            new_option = Option(
-                question_id=new_question.id,
-                option_text=option_data.option_text,
-                is_correct=option_data.is_correct
-            )
-            db.add(new_option)
+    insert_questions(db, new_test.id, test.questions)
+    index_tests(db, [new_test.id])
     
     db.commit()
-    db.refresh(new_test)
     
-    return new_test
+    return get_test_with_content(db, new_test.id)
+
+@router.post("/import")
+async def import_tests(
+    request: Request,
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=MAX_IMPORT_CHUNK_SIZE),
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    # Импорт банка тестов в формате JSON Lines: одна строка - один TestCreate.
+    # Тело читается потоково, тесты записываются и коммитятся пачками по chunk_size.
+    # Каждый тест либо записан, либо указан в errors со своей строкой: пачка, в которой
+    # запись теста отклонена (HTTPException), откатывается и записывается по одному тесту,
+    # уже закоммиченные пачки не затрагиваются
+    def write_tests(session, tests):
+        test_ids = insert_tests(session, tests, teacher.id)
+        index_tests(session, test_ids)
+        session.commit()
+        return test_ids
+    
+    def write_chunk(session, chunk):
+        try:
+            return write_tests(session, [test for _, test in chunk]), []
+        except HTTPException:
+            session.rollback()
+        test_ids, failed = [], []
+        for line, test in chunk:
+            try:
+                test_ids.extend(write_tests(session, [test]))
+            except HTTPException as exc:
+                session.rollback()
+                failed.append({"line": line, "detail": exc.detail})
+        return test_ids, failed
+    
+    imported = []
+    errors = []
+    chunk = []
+    line_number = 0
+    buffer = b""
+    
+    async def flush_chunk():
+        if chunk:
+            test_ids, failed = await db.run_sync(write_chunk, list(chunk))
+            imported.extend(test_ids)
+            errors.extend(failed)
+            chunk.clear()
+    
+    def parse_line(line):
+        # Повторы вопросов внутри теста отклоняет валидатор TestCreate - до записи
+        try:
+            chunk.append((line_number, TestCreate.model_validate_json(line)))
+        except ValidationError as exc:
+            errors.append({"line": line_number, "detail": exc.errors(include_url=False)})
+    
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                parse_line(line)
+            if len(chunk) >= chunk_size:
+                await flush_chunk()
+    
+    if buffer.strip():
+        line_number += 1
+        parse_line(buffer)
+    await flush_chunk()
+    errors.sort(key=lambda error: error["line"])
+    
+    return {
+        "imported": len(imported),
+        "test_ids": imported,
+        "errors": errors
+    }
 
 @router.get("/", response_model=List[TestListResponse])
-def get_all_tests(db: Session = Depends(get_db)):
-    tests = db.query(Test).all()
+async def get_all_tests(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_get_all_tests, response, cursor, limit)
+
+def _get_all_tests(
+    db: Session,
+    response: Response,
+    cursor: Optional[str],
+    limit: int
+):
+    tests, next_cursor = paginate(tests_with_questions_count(db), (Test.id,), cursor, limit)
+    set_next_cursor(response, next_cursor)
+    
+    return [TestListResponse(**row._mapping) for row in tests]
+
+@router.get("/search", response_model=List[SearchHit])
+async def search_tests(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    mine: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    # Поиск по названиям и описаниям тестов, текстам вопросов и вариантов.
+    # Совпадения - по убыванию релевантности, следующая страница - по X-Next-Cursor
+    return await db.run_sync(_search_tests, response, q, teacher.id if mine else None, cursor, limit)
+
+def _search_tests(
+    db: Session,
+    response: Response,
+    q: str,
+    teacher_id: Optional[int],
+    cursor: Optional[str],
+    limit: int
+):
+    hits, next_cursor = search(db, q, cursor, limit, teacher_id)
+    set_next_cursor(response, next_cursor)
     
-    result = []
-    for test in tests:
-        result.append(TestListResponse(
-            id=test.id,
-            title=test.title,
-            description=test.description,
-            created_at=test.created_at,
-            questions_count=len(test.questions)
-        ))
+    return hits
+
+@router.get("/questions", response_model=List[BankQuestionResponse])
+async def get_bank_questions(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    # Банк вопросов преподавателя: версии из его тестов для сборки тестов ссылками
+    # (TestUpdate.questions с одним id)
+    return await db.run_sync(_get_bank_questions, response, teacher.id, cursor, limit)
+
+def _get_bank_questions(
+    db: Session,
+    response: Response,
+    teacher_id: int,
+    cursor: Optional[str],
+    limit: int
+):
+    rows, next_cursor = paginate(bank_questions(db, teacher_id), (Question.id,), cursor, limit)
+    set_next_cursor(response, next_cursor)
     
-    return result
+    options = options_by_question(db, [row.id for row in rows])
+    return [BankQuestionResponse(**row._mapping, options=options[row.id]) for row in rows]
+
+@router.get("/questions/{question_id}", response_model=BankQuestionResponse)
+async def get_bank_question(
+    question_id: int,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_get_bank_question, question_id, teacher.id)
+
+def _get_bank_question(db: Session, question_id: int, teacher_id: int):
+    row = bank_questions(db, teacher_id).filter(Question.id == question_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Question not found")
+    
+    return BankQuestionResponse(**row._mapping, options=options_by_question(db, [question_id])[question_id])
 
 @router.get("/{test_id}", response_model=TestResponse)
-def get_test(test_id: int, db: Session = Depends(get_db)):
-    test = db.query(Test).filter(Test.id == test_id).first()
-    if not test:
+async def get_test(
+    test_id: int,
+    request: Request,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    # Полное содержимое с правильными ответами - только для преподавателей
+    return await db.run_sync(_get_test, test_id, request)
+
+def _get_test(db: Session, test_id: int, request: Request):
+    snapshot = get_test_snapshot(db, test_id, "teacher")
+    if not snapshot:
         raise HTTPException(status_code=404, detail="Test not found")
     
-    return test
+    return snapshot_response(request, snapshot)
 
 @router.put("/{test_id}", response_model=TestResponse)
-def update_test(test_id: int, test_update: TestUpdate, teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can update tests")
-    
+async def update_test(
+    test_id: int,
+    test_update: TestUpdate,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_update_test, test_id, test_update, teacher.id)
+
+def _update_test(db: Session, test_id: int, test_update: TestUpdate, teacher_id: int):
     # Поиск теста
     test = db.query(Test).filter(Test.id == test_id).first()
     if not test:
@@ -85,46 +246,49 @@ def update_test(test_id: int, test_update: TestUpdate, teacher_id: int, db: Sess
     if test.teacher_id != teacher_id:
         raise HTTPException(status_code=403, detail="You can only update your own tests")
     
+    # Новая версия теста: прежние снимки и ETag перестают совпадать. Увеличение в SQL:
+    # одновременные изменения одного теста получают разные версии
+    db.execute(
+        update(Test).where(Test.id == test_id).values(version=Test.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    forget_snapshots(db, test_id)
+    
     # Обновление полей
     if test_update.title is not None:
         test.title = test_update.title
     if test_update.description is not None:
         test.description = test_update.description
+    if test_update.shuffle_questions is not None:
+        test.shuffle_questions = test_update.shuffle_questions
+    if test_update.shuffle_options is not None:
+        test.shuffle_options = test_update.shuffle_options
+    if "questions_per_attempt" in test_update.model_fields_set:
+        test.questions_per_attempt = test_update.questions_per_attempt
     
-    # Если есть новые вопросы - удаляем старые и создаем новые
+    # Если переданы вопросы - применяем только разницу с текущим содержимым
     if test_update.questions is not None:
-        # Удаление старых вопросов (каскадно удалятся и варианты)
-        db.query(Question).filter(Question.test_id == test_id).delete()
-        
-        # Создание новых вопросов
-        for question_data in test_update.questions:
-            new_question = Question(
-                test_id=test.id,
-                question_text=question_data.question_text
-            )
-            db.add(new_question)
-            db.flush()
-            
-            for option_data in question_data.options:
-                new_option = Option(
-                    question_id=new_question.id,
-                    option_text=option_data.option_text,
-                    is_correct=option_data.is_correct
-                )
-                db.add(new_option)
+        apply_question_diff(db, test_id, test_update.questions, teacher_id)
+    index_tests(db, [test_id])
     
+    # Остальные воркеры сбросят кэши теста, когда увидят событие (вместе с изменением)
+    publish_invalidation(db, "test", test_id)
     db.commit()
-    db.refresh(test)
+    invalidate_answer_key(test_id)
+    invalidate_snapshots(test_id)
+    invalidate_canonical(test_id)
     
-    return test
+    return get_test_with_content(db, test_id)
 
 @router.delete("/{test_id}")
-def delete_test(test_id: int, teacher_id: int, db: Session = Depends(get_db)):
-    # Проверка что пользователь - преподаватель
-    teacher = db.query(User).filter(User.id == teacher_id, User.role == "teacher").first()
-    if not teacher:
-        raise HTTPException(status_code=403, detail="Only teachers can delete tests")
-    
+async def delete_test(
+    test_id: int,
+    teacher: Principal = Depends(require_teacher),
+    db: Database = Depends(get_db)
+):
+    return await db.run_sync(_delete_test, test_id, teacher.id)
+
+def _delete_test(db: Session, test_id: int, teacher_id: int):
     # Поиск теста
     test = db.query(Test).filter(Test.id == test_id).first()
     if not test:
@@ -134,7 +298,16 @@ def delete_test(test_id: int, teacher_id: int, db: Session = Depends(get_db)):
     if test.teacher_id != teacher_id:
         raise HTTPException(status_code=403, detail="You can only delete your own tests")
     
+    forget_snapshots(db, test_id)
+    forget_test(db, test_id)
+    forget_items(db, test_id)
+    remove_tests(db, [test_id])
+    forget_attempts(db, test_id)
     db.delete(test)
+    publish_invalidation(db, "test", test_id)
     db.commit()
+    invalidate_answer_key(test_id)
+    invalidate_snapshots(test_id)
+    invalidate_canonical(test_id)
     
     return {"message": "Test deleted successfully"}
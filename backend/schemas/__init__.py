@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Optional
 from datetime import datetime
 
@@ -20,11 +20,21 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class LoginResponse(UserResponse):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 # Option schemas
 class OptionCreate(BaseModel):
     option_text: str
     is_correct: bool
 
+class OptionUpdate(BaseModel):
+    id: Optional[int] = None  # id существующего варианта; None - новый вариант
+    option_text: str
+    is_correct: bool
+
 class OptionResponse(BaseModel):
     id: int
     option_text: str
@@ -45,6 +55,21 @@ class QuestionCreate(BaseModel):
     question_text: str
     options: List[OptionCreate]
 
+class QuestionUpdate(BaseModel):
+    # id с содержимым - изменение вопроса этого теста; id без содержимого - вопрос из банка
+    # (только версия, входящая в тесты этого преподавателя); без id - новый вопрос
+    id: Optional[int] = None
+    question_text: Optional[str] = None
+    options: Optional[List[OptionUpdate]] = None
+
+    @model_validator(mode="after")
+    def check_content(self):
+        if (self.question_text is None) != (self.options is None):
+            raise ValueError("question_text and options must be given together")
+        if self.id is None and self.question_text is None:
+            raise ValueError("new question requires question_text and options")
+        return self
+
 class QuestionResponse(BaseModel):
     id: int
     question_text: str
@@ -66,11 +91,30 @@ class TestCreate(BaseModel):
     title: str
     description: Optional[str] = None
     questions: List[QuestionCreate]
+    # Вариант попытки: перемешивание и выборка N вопросов (None - все)
+    shuffle_questions: bool = False
+    shuffle_options: bool = False
+    questions_per_attempt: Optional[int] = Field(None, ge=1)
+
+    @field_validator("questions")
+    @classmethod
+    def unique_questions(cls, questions):
+        # Одинаковые вопросы - одна версия банка, а версия входит в тест один раз
+        seen = set()
+        for question in questions:
+            content = (question.question_text, tuple((o.option_text, o.is_correct) for o in question.options))
+            if content in seen:
+                raise ValueError(f"duplicate question: {question.question_text!r}")
+            seen.add(content)
+        return questions
 
 class TestUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
-    questions: Optional[List[QuestionCreate]] = None
+    questions: Optional[List[QuestionUpdate]] = None
+    shuffle_questions: Optional[bool] = None
+    shuffle_options: Optional[bool] = None
+    questions_per_attempt: Optional[int] = Field(None, ge=1)  # явный null - снова все вопросы
 
 class TestResponse(BaseModel):
     id: int
@@ -78,6 +122,10 @@ class TestResponse(BaseModel):
     description: Optional[str]
     teacher_id: int
     created_at: datetime
+    version: int = 1
+    shuffle_questions: bool = False
+    shuffle_options: bool = False
+    questions_per_attempt: Optional[int] = None
     questions: List[QuestionResponse]
     
     class Config:
@@ -93,6 +141,29 @@ class TestListResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TestCatalogResponse(BaseModel):
+    id: int
+    title: str
+    description: Optional[str]
+    questions_count: int
+    
+    class Config:
+        from_attributes = True
+
+class BankQuestionResponse(BaseModel):
+    id: int  # id версии: ссылка на вопрос в TestUpdate.questions
+    question_text: str
+    created_at: datetime
+    tests_count: int  # число тестов, в которые входит версия
+    options: List[OptionResponse]
+
+class SearchHit(BaseModel):
+    test_id: int
+    test_title: str
+    question_id: Optional[int]  # None - совпадение в названии или описании теста
+    snippet: str  # фрагмент текста, совпавшие слова в <mark>...</mark>
+    score: float  # больше - релевантнее
+
 class TestResponseStudent(BaseModel):
     id: int
     title: str
@@ -107,20 +178,32 @@ class AnswerSubmit(BaseModel):
     question_id: int
     selected_option_ids: List[int]
 
+class AttemptResponse(TestResponseStudent):
+    # Вариант теста для попытки: вопросы и варианты в порядке этой попытки
+    attempt_id: int
+    submitted: bool = False
+    answers: List[AnswerSubmit] = []  # автосохраненные ответы - для продолжения после перезагрузки
+
+class AttemptAnswersPatch(BaseModel):
+    # Изменившиеся ответы попытки; вопросы, которых нет в изменении, не затрагиваются
+    answers: List[AnswerSubmit]
+
 class TestSubmit(BaseModel):
     test_id: int
-    answers: List[AnswerSubmit]
+    # С attempt_id ответы необязательны: к автосохраненным добавляются присланные
+    answers: List[AnswerSubmit] = []
+    attempt_id: Optional[int] = None  # попытка из POST /student/tests/{test_id}/attempts
 
 # Result schemas
 class ResultResponse(BaseModel):
     id: int
     user_id: int
-    test_id: int
+    test_id: Optional[int]  # None - тест удален
     score: int
     total_questions: int
     completed_at: datetime
     username: str
-    test_title: str
+    test_title: Optional[str]
     
     class Config:
         from_attributes = True
@@ -130,7 +213,7 @@ class DetailedResultResponse(BaseModel):
     score: int
     total_questions: int
     completed_at: datetime
-    test_title: str
+    test_title: Optional[str]
     questions: List[dict]
     
     class Config:
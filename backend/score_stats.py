@@ -0,0 +1,144 @@
+from math import floor, ceil
+from typing import Dict, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import Test, TestResult, TestScoreSummary
+
+# Статистика по тестам строится из гистограммы (test_id, score, total_questions) -> attempts.
+# Гистограмма либо агрегируется одним GROUP BY по test_results,
+# либо читается из инкрементально поддерживаемой таблицы test_score_summary.
+# Число строк гистограммы - O(тестов × различных баллов), а не O(попыток).
+# Оба источника считают одни и те же попытки: результаты существующих тестов с баллом.
+# Результаты удаленных тестов остаются в списках результатов, но не в статистике -
+# строки test_score_summary удаляются вместе с тестом (forget_test).
+
+HistogramRow = Tuple[int, int, int, int]
+
+
+def histogram_from_results(db: Session) -> List[HistogramRow]:
+    return (
+        db.query(
+            TestResult.test_id,
+            TestResult.score,
+            TestResult.total_questions,
+            func.count(TestResult.id),
+        )
+        .join(Test, Test.id == TestResult.test_id)
+        .filter(TestResult.score.isnot(None), TestResult.total_questions.isnot(None))
+        .group_by(TestResult.test_id, TestResult.score, TestResult.total_questions)
+        .all()
+    )
+
+
+def histogram_from_summary(db: Session) -> List[HistogramRow]:
+    return (
+        db.query(
+            TestScoreSummary.test_id,
+            TestScoreSummary.score,
+            TestScoreSummary.total_questions,
+            TestScoreSummary.attempts,
+        )
+        .join(Test, Test.id == TestScoreSummary.test_id)
+        .filter(TestScoreSummary.attempts > 0)
+        .all()
+    )
+
+
+def record_score(db: Session, test_id: int, score: int, total_questions: int, attempts: int = 1) -> None:
+    # Выполняется в той же транзакции, что и вставка результата (не в отдельной): счетчики
+    # test_score_summary и test_results фиксируются или откатываются вместе. Коммит делает вызывающий код.
+    # attempts > 1 - несколько одинаковых попыток из одной пачки отложенной записи
+    dialect = db.get_bind().dialect.name
+    values = {"test_id": test_id, "score": score, "total_questions": total_questions, "attempts": attempts}
+
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(TestScoreSummary).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["test_id", "score", "total_questions"],
+            set_={"attempts": TestScoreSummary.attempts + attempts},
+        )
+        db.execute(stmt)
+        return
+
+    updated = (
+        db.query(TestScoreSummary)
+        .filter(
+            TestScoreSummary.test_id == test_id,
+            TestScoreSummary.score == score,
+            TestScoreSummary.total_questions == total_questions,
+        )
+        .update({TestScoreSummary.attempts: TestScoreSummary.attempts + attempts}, synchronize_session=False)
+    )
+    if not updated:
+        db.add(TestScoreSummary(**values))
+
+
+def forget_test(db: Session, test_id: int) -> None:
+    db.query(TestScoreSummary).filter(TestScoreSummary.test_id == test_id).delete(synchronize_session=False)
+
+
+def rebuild_summary(db: Session) -> int:
+    # Полный пересчет таблицы из test_results (для первичного заполнения)
+    db.query(TestScoreSummary).delete(synchronize_session=False)
+    rows = histogram_from_results(db)
+    db.bulk_insert_mappings(TestScoreSummary, [
+        {"test_id": test_id, "score": score, "total_questions": total, "attempts": attempts}
+        for test_id, score, total, attempts in rows
+    ])
+    db.commit()
+    return len(rows)
+
+
+def _percentage(score: int, total_questions: int) -> float:
+    return score / total_questions * 100 if total_questions else 0
+
+
+def _percentile(values: List[Tuple[float, int]], n: int, q: float) -> float:
+    # Перцентиль с линейной интерполяцией по отсортированной гистограмме (value, count)
+    position = q * (n - 1)
+    lower, upper = floor(position), ceil(position)
+
+    def value_at(index: int) -> float:
+        seen = 0
+        for value, count in values:
+            seen += count
+            if index < seen:
+                return value
+        return values[-1][0]
+
+    low = value_at(lower)
+    if upper == lower:
+        return low
+    return low + (value_at(upper) - low) * (position - lower)
+
+
+def summarize(rows: List[HistogramRow], pass_threshold: float) -> Dict[int, dict]:
+    by_test: Dict[int, List[Tuple[int, int, int]]] = {}
+    for test_id, score, total, attempts in rows:
+        if score is None or total is None:
+            continue
+        by_test.setdefault(test_id, []).append((score, total, attempts))
+
+    summary = {}
+    for test_id, buckets in by_test.items():
+        attempts = sum(count for _, _, count in buckets)
+        if not attempts:
+            continue
+
+        percentages = sorted(
+            (_percentage(score, total), count) for score, total, count in buckets
+        )
+        passed = sum(count for value, count in percentages if value >= pass_threshold)
+
+        summary[test_id] = {
+            "attempts": attempts,
+            "avg_score": sum(score * count for score, _, count in buckets) / attempts,
+            "avg_percentage": sum(value * count for value, count in percentages) / attempts,
+            "median_percentage": _percentile(percentages, attempts, 0.5),
+            "p90_percentage": _percentile(percentages, attempts, 0.9),
+            "pass_rate": passed / attempts * 100,
+        }
+
+    return summary
@@ -0,0 +1,242 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Float, column, delete, insert, or_, text
+from sqlalchemy.orm import Session
+from config import SEARCH_MAX_RANKED
+from models import Option, Question, SearchDocument, Test, TestQuestion
+from pagination import decode_cursor, encode_cursor
+
+# Полнотекстовый поиск по тестам и вопросам. Документы - строки search_documents:
+# одна на тест (название и описание) и одна на вопрос (текст вопроса и всех вариантов).
+# Любое изменение теста заново записывает документы этого теста в той же транзакции;
+# индекс FTS5 search_index (SQLite) следует за таблицей через триггеры (миграция 0006).
+# Без FTS5 (PostgreSQL и другие) поиск идет по той же таблице через LIKE - те же
+# результаты без ранжирования, но полным просмотром.
+
+FTS_TABLE = "search_index"
+MAX_TERMS = 16
+SNIPPET_TOKENS = 12
+HIGHLIGHT = ("<mark>", "</mark>")
+ELLIPSIS = "…"
+INDEX_BATCH = 500
+
+# Колонки курсора: (rank, id документа); rank FTS5 - bm25 со знаком минус, меньше - лучше.
+# rank = None - запрос без ранжирования (слишком много совпадений), страницы по убыванию id
+CURSOR_COLUMNS = (column("rank", Float), SearchDocument.id)
+
+# Колонки документа в порядке весов bm25 (миграция 0006)
+TEXT_FIELDS = (SearchDocument.title, SearchDocument.description, SearchDocument.question_text,
+               SearchDocument.option_text)
+
+_fts_tables: Dict[str, bool] = {}
+
+
+def fts_enabled(db: Session) -> bool:
+    # Есть ли индекс FTS5 в базе сессии; проверяется один раз на базу
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _fts_tables:
+        _fts_tables[key] = bind.dialect.name == "sqlite" and db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first() is not None
+    return _fts_tables[key]
+
+
+def _documents(db: Session, test_ids: List[int]) -> List[dict]:
+    documents = [
+        {"test_id": test_id, "question_id": None, "title": title, "description": description or "",
+         "question_text": "", "option_text": ""}
+        for test_id, title, description in db.query(Test.id, Test.title, Test.description)
+        .filter(Test.id.in_(test_ids))
+    ]
+    # Версия из банка, входящая в несколько тестов, индексируется в каждом из них:
+    # результат поиска - место вопроса в конкретном тесте
+    links = (
+        db.query(TestQuestion.test_id, Question.id, Question.question_text)
+        .join(Question, Question.id == TestQuestion.question_id)
+        .filter(TestQuestion.test_id.in_(test_ids))
+        .order_by(TestQuestion.test_id, TestQuestion.position)
+        .all()
+    )
+    options: Dict[int, List[str]] = {}
+    question_ids = list({question_id for _, question_id, _ in links})
+    for start in range(0, len(question_ids), INDEX_BATCH):
+        batch = question_ids[start:start + INDEX_BATCH]
+        for question_id, option_text in (
+            db.query(Option.question_id, Option.option_text)
+            .filter(Option.question_id.in_(batch))
+            .order_by(Option.question_id, Option.position, Option.id)
+        ):
+            options.setdefault(question_id, []).append(option_text)
+    documents.extend(
+        {"test_id": test_id, "question_id": question_id, "title": "", "description": "",
+         "question_text": question_text, "option_text": " ".join(options.get(question_id, ()))}
+        for test_id, question_id, question_text in links
+    )
+    return documents
+
+
+def index_tests(db: Session, test_ids: List[int]) -> None:
+    # Переиндексация тестов после создания или изменения; коммит делает вызывающий код
+    db.flush()
+    for start in range(0, len(test_ids), INDEX_BATCH):
+        batch = test_ids[start:start + INDEX_BATCH]
+        db.execute(delete(SearchDocument).where(SearchDocument.test_id.in_(batch)))
+        documents = _documents(db, batch)
+        if documents:
+            db.execute(insert(SearchDocument), documents)
+
+
+def remove_tests(db: Session, test_ids: List[int]) -> None:
+    # До удаления самих тестов (внешний ключ на tests)
+    db.execute(delete(SearchDocument).where(SearchDocument.test_id.in_(test_ids)))
+
+
+def rebuild_index(db: Session) -> int:
+    # Полная пересборка: документы всех тестов заново, затем индекс FTS5 целиком
+    db.execute(delete(SearchDocument))
+    test_ids = [test_id for test_id, in db.query(Test.id).order_by(Test.id)]
+    index_tests(db, test_ids)
+    if fts_enabled(db):
+        db.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"))
+    db.commit()
+    return db.query(SearchDocument).count()
+
+
+def query_terms(q: str) -> List[str]:
+    # Слова запроса (буквы и цифры любого алфавита); операторы FTS5 в запросе не действуют
+    return re.findall(r"\w+", q)[:MAX_TERMS]
+
+
+def match_expression(terms: List[str]) -> str:
+    # Все слова обязательны, каждое - как префикс: "уравн" находит "уравнение" и "уравнения"
+    return " AND ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+def search(db: Session, q: str, cursor: Optional[str], limit: int,
+           teacher_id: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    # Возвращает (совпадения по убыванию релевантности, курсор следующей страницы или None)
+    terms = query_terms(q)
+    if not terms:
+        return [], None
+    after = decode_cursor(cursor, CURSOR_COLUMNS) if cursor else None
+
+    if fts_enabled(db):
+        hits = _search_fts(db, terms, after, limit + 1, teacher_id)
+    else:
+        hits = _search_like(db, terms, after, limit + 1, teacher_id)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor([hits[-1]["rank"], hits[-1]["id"]])
+    return [
+        {"test_id": hit["test_id"], "test_title": hit["test_title"], "question_id": hit["question_id"],
+         "snippet": hit["snippet"], "score": -hit["rank"] if hit["rank"] is not None else 0.0}
+        for hit in hits
+    ], next_cursor
+
+
+def _search_fts(db: Session, terms: List[str], after: Optional[list], limit: int,
+                teacher_id: Optional[int]) -> List[dict]:
+    # Из индекса - только id и rank страницы; текст документов читается по первичному ключу.
+    # snippet() FTS5 здесь не используется: с условием на rowid он заново выполняет MATCH
+    # для каждой строки страницы
+    joins, conditions = "", ""
+    params = {"query": match_expression(terms), "limit": limit}
+    if teacher_id is not None:
+        joins = f" JOIN search_documents d ON d.id = {FTS_TABLE}.rowid JOIN tests t ON t.id = d.test_id"
+        conditions += " AND t.teacher_id = :teacher_id"
+        params["teacher_id"] = teacher_id
+    source = f"FROM {FTS_TABLE}{joins} WHERE {FTS_TABLE} MATCH :query{conditions}"
+
+    if after is None:
+        # Число совпадений считается только до порога - это один проход по спискам документов
+        ranked = db.execute(
+            text(f"SELECT count(*) FROM (SELECT 1 {source} LIMIT :cap)"), {**params, "cap": SEARCH_MAX_RANKED + 1}
+        ).scalar() <= SEARCH_MAX_RANKED
+    else:
+        ranked = after[0] is not None
+
+    if ranked:
+        if after is not None:
+            source += f" AND ({FTS_TABLE}.rank, {FTS_TABLE}.rowid) > (:after_rank, :after_id)"
+            params.update(after_rank=after[0], after_id=after[1])
+        page = db.execute(text(
+            f"SELECT {FTS_TABLE}.rowid, {FTS_TABLE}.rank {source} ORDER BY {FTS_TABLE}.rank, {FTS_TABLE}.rowid"
+            " LIMIT :limit"
+        ), params).all()
+    else:
+        # Без bm25: FTS5 идет по спискам документов от больших rowid и останавливается на LIMIT
+        if after is not None:
+            source += f" AND {FTS_TABLE}.rowid < :after_id"
+            params["after_id"] = after[1]
+        page = db.execute(text(
+            f"SELECT {FTS_TABLE}.rowid, NULL {source} ORDER BY {FTS_TABLE}.rowid DESC LIMIT :limit"
+        ), params).all()
+    if not page:
+        return []
+
+    row_ids = [row_id for row_id, _ in page]
+    documents = {row.id: row for row in _document_query(db).filter(SearchDocument.id.in_(row_ids))}
+    return [_hit(documents[row_id], terms, rank) for row_id, rank in page if row_id in documents]
+
+
+def _search_like(db: Session, terms: List[str], after: Optional[list], limit: int,
+                 teacher_id: Optional[int]) -> List[dict]:
+    # Запасной вариант без FTS5: каждое слово должно встретиться в одной из колонок документа
+    query = _document_query(db).filter(
+        *(or_(*(field.ilike(f"%{term}%") for field in TEXT_FIELDS)) for term in terms)
+    )
+    if teacher_id is not None:
+        query = query.filter(Test.teacher_id == teacher_id)
+    if after is not None:
+        # rank без FTS5 всегда 0: порядок и курсор - по id документа
+        query = query.filter(SearchDocument.id > after[1])
+    return [_hit(row, terms, 0.0) for row in query.order_by(SearchDocument.id).limit(limit)]
+
+
+def _document_query(db: Session):
+    return (
+        db.query(SearchDocument.id, SearchDocument.test_id, SearchDocument.question_id,
+                 Test.title.label("test_title"), *TEXT_FIELDS)
+        .join(Test, Test.id == SearchDocument.test_id)
+    )
+
+
+def _hit(row, terms: List[str], rank: float) -> dict:
+    return {"id": row.id, "test_id": row.test_id, "question_id": row.question_id,
+            "test_title": row.test_title, "snippet": snippet(row, terms), "rank": rank}
+
+
+def snippet(row, terms: List[str]) -> str:
+    # Фрагмент первой колонки документа (в порядке весов), где есть совпадение:
+    # до SNIPPET_TOKENS слов, совпавшие слова (по префиксу, без учета регистра) выделены
+    prefixes = tuple(term.casefold() for term in terms)
+    texts = [getattr(row, field.key) for field in TEXT_FIELDS]
+    for value in texts:
+        words = list(re.finditer(r"\w+", value))
+        matched = [index for index, word in enumerate(words) if word.group().casefold().startswith(prefixes)]
+        if not matched:
+            continue
+        start = max(0, min(matched[0] - SNIPPET_TOKENS // 4, len(words) - SNIPPET_TOKENS))
+        end = min(len(words), start + SNIPPET_TOKENS)
+        parts, position = [ELLIPSIS] if start else [], words[start].start()
+        for word in words[start:end]:
+            parts.append(value[position:word.start()])
+            if word.group().casefold().startswith(prefixes):
+                parts.append(HIGHLIGHT[0] + word.group() + HIGHLIGHT[1])
+            else:
+                parts.append(word.group())
+            position = word.end()
+        if end < len(words):
+            parts.append(ELLIPSIS)
+        else:
+            parts.append(value[position:])
+        return "".join(parts)
+    # Совпадение только по части слова внутри (LIKE) - начало текста без выделения
+    value = next(filter(None, texts), "")
+    words = list(re.finditer(r"\w+", value))
+    if len(words) <= SNIPPET_TOKENS:
+        return value
+    return value[:words[SNIPPET_TOKENS - 1].end()] + ELLIPSIS
@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from typing import NamedTuple, Optional
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.orm import Session
+from cache import make_cache
+from config import (
+    AUTH_SECRET, AUTH_TOKEN_TTL, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL,
+    PASSWORD_HASH_ITERATIONS, ALLOW_ID_PARAMS,
+)
+from database import get_db, Database
+from models import User
+
+# Пароли хранятся как PBKDF2-HMAC-SHA256 с солью. Токен доступа - base64url(JSON) + "." + HMAC,
+# проверка подписи не требует БД. Пользователь по id берется из TTL-кэша, поэтому
+# проверка роли на горячем пути обходится без запросов; в БД идем раз в PRINCIPAL_CACHE_TTL.
+
+PASSWORD_SCHEME = "pbkdf2_sha256"
+
+
+class Principal(NamedTuple):
+    id: int
+    username: str
+    role: str
+
+
+# --- Пароли ---
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def hash_password(password: str, iterations: int = PASSWORD_HASH_ITERATIONS) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"{PASSWORD_SCHEME}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not stored.startswith(PASSWORD_SCHEME + "$"):
+        # Пароль, сохраненный до введения хеширования
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, iterations, salt, digest = stored.split("$")
+        expected = _b64decode(digest)
+        actual = hashlib.pbkdf2_hmac("sha256", password.encode(), _b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    if not stored.startswith(PASSWORD_SCHEME + "$"):
+        return True
+    try:
+        return int(stored.split("$")[1]) < PASSWORD_HASH_ITERATIONS
+    except (IndexError, ValueError):
+        return True
+
+
+# --- Токены ---
+
+def _sign(payload: str, secret: str) -> str:
+    return _b64encode(hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, role: str, secret: str = AUTH_SECRET, ttl: int = AUTH_TOKEN_TTL) -> str:
+    claims = {"sub": user_id, "role": role, "exp": int(time.time()) + ttl}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload, secret)}"
+
+
+def read_token(token: str, secret: str = AUTH_SECRET) -> Optional[dict]:
+    # Содержимое токена или None, если подпись неверна или срок истек
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _sign(payload, secret)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+# --- Текущий пользователь ---
+
+principal_cache = make_cache("principals", PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def load_principal(db: Session, user_id: int) -> Optional[Principal]:
+    row = db.query(User.id, User.username, User.role).filter(User.id == user_id).first()
+    return Principal(*row) if row else None
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+async def resolve_principal(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials],
+    db: Database,
+    id_param: str,
+) -> Principal:
+    role = None
+    if credentials is not None:
+        claims = read_token(credentials.credentials)
+        if claims is None:
+            raise _unauthorized("Invalid or expired token")
+        user_id, role = claims.get("sub"), claims.get("role")
+    elif ALLOW_ID_PARAMS and request.query_params.get(id_param, "").isdigit():
+        user_id = int(request.query_params[id_param])
+    else:
+        raise _unauthorized("Not authenticated")
+
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        principal = await db.run_sync(load_principal, user_id)
+        if principal is None:
+            raise _unauthorized("User not found")
+        principal_cache.put(user_id, principal)
+
+    # Роль в токене устарела (пользователь изменен после выдачи токена)
+    if role is not None and role != principal.role:
+        raise _unauthorized("Token is out of date")
+    return principal
+
+
+def require_role(role: str, id_param: str, detail: str):
+    # Зависимость маршрута: пользователь из токена с нужной ролью, иначе 401 / 403
+    async def dependency(
+        request: Request,
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+        db: Database = Depends(get_db),
+    ) -> Principal:
+        principal = await resolve_principal(request, credentials, db, id_param)
+        if principal.role != role:
+            raise HTTPException(status_code=403, detail=detail)
+        return principal
+
+    return dependency
+
+
+require_teacher = require_role("teacher", "teacher_id", "Only teachers can access this resource")
+require_student = require_role("student", "student_id", "Only students can access this resource")
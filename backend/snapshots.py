@@ -0,0 +1,123 @@
+import hashlib
+from typing import NamedTuple, Optional
+from fastapi import Request, Response
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from cache import make_cache
+from config import SNAPSHOT_CACHE_SIZE, PERSIST_TEST_SNAPSHOTS
+from invalidation import invalidation_bus
+from models import Test, TestSnapshot
+from queries import get_test_with_content
+from schemas import TestResponse, TestResponseStudent
+
+# Неизменяемые JSON-снимки теста: содержимое версии теста сериализуется один раз,
+# дальше отдаются готовые байты со строгим ETag. Ключ снимка - (test_id, version, view),
+# поэтому после update_test (version + 1) старый снимок просто перестает запрашиваться.
+
+VIEWS = {
+    "teacher": TestResponse,
+    "student": TestResponseStudent,
+}
+
+
+class Snapshot(NamedTuple):
+    etag: str
+    body: bytes
+
+
+snapshot_cache = make_cache("snapshots", SNAPSHOT_CACHE_SIZE)
+
+
+def make_etag(test_id: int, version: int, body: bytes) -> str:
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return f'"{test_id}-{version}-{digest}"'
+
+
+def build_snapshot(db: Session, test_id: int, version: int, view: str) -> Optional[Snapshot]:
+    test = get_test_with_content(db, test_id)
+    if not test:
+        return None
+    body = VIEWS[view].model_validate(test).model_dump_json().encode()
+    return Snapshot(make_etag(test_id, version, body), body)
+
+
+def get_test_snapshot(db: Session, test_id: int, view: str) -> Optional[Snapshot]:
+    # Единственный обязательный запрос - версия теста по первичному ключу
+    version = db.query(Test.version).filter(Test.id == test_id).scalar()
+    if version is None:
+        return None
+
+    key = (test_id, version, view)
+    snapshot = snapshot_cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    if PERSIST_TEST_SNAPSHOTS:
+        stored = db.query(TestSnapshot).filter(
+            TestSnapshot.test_id == test_id,
+            TestSnapshot.version == version,
+            TestSnapshot.view == view,
+        ).first()
+        if stored:
+            snapshot = Snapshot(stored.etag, stored.body)
+
+    if snapshot is None:
+        snapshot = build_snapshot(db, test_id, version, view)
+        if snapshot is None:
+            return None
+        if PERSIST_TEST_SNAPSHOTS:
+            store_snapshot(db, test_id, version, view, snapshot)
+
+    snapshot_cache.put(key, snapshot)
+    return snapshot
+
+
+def store_snapshot(db: Session, test_id: int, version: int, view: str, snapshot: Snapshot) -> None:
+    # Первое открытие теста целым классом: несколько запросов строят один и тот же снимок
+    # одновременно. Снимок версии неизменен, поэтому уже записанная строка не перезаписывается,
+    # а конфликт первичного ключа - не ошибка: запрос отдает собранный им снимок
+    values = {"test_id": test_id, "version": version, "view": view, "etag": snapshot.etag, "body": snapshot.body}
+    dialect = db.get_bind().dialect.name
+    try:
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            db.execute(insert(TestSnapshot).values(**values).on_conflict_do_nothing(
+                index_elements=["test_id", "version", "view"]
+            ))
+        else:
+            db.add(TestSnapshot(**values))
+        db.commit()
+    except IntegrityError:
+        # Другие СУБД или тест удален одновременно (внешний ключ)
+        db.rollback()
+
+
+def forget_snapshots(db: Session, test_id: int) -> None:
+    # Удаление сохраненных снимков устаревших версий; вызывается в транзакции изменения теста
+    if PERSIST_TEST_SNAPSHOTS:
+        db.query(TestSnapshot).filter(TestSnapshot.test_id == test_id).delete(synchronize_session=False)
+
+
+def invalidate_snapshots(test_id: int) -> None:
+    snapshot_cache.invalidate_where(lambda key: key[0] == test_id)
+
+
+invalidation_bus.track(snapshot_cache)
+invalidation_bus.subscribe("test", lambda key: invalidate_snapshots(int(key)))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Для If-None-Match допускается слабое сравнение: префикс W/ не учитывается
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    # no-cache: клиент может хранить ответ, но обязан перепроверять его через If-None-Match
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
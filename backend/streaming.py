@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+from typing import Iterator, List, Optional
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from database import SessionLocal
+from export import partitions
+from pagination import after_cursor, decode_cursor
+from queries import results_with_refs, ResultFilters, RESULT_ORDER
+
+# Потоковые JSON-ответы для больших списков (?stream=true): строки читаются порциями
+# (yield_per) и сразу кодируются в байты - JSON-массивом или, при Accept: application/x-ndjson,
+# по объекту на строку. Время до первого байта и пиковая память не зависят от числа строк.
+# Кодировщик - orjson, если установлен, иначе стандартный json.
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_array_items(items: List[dict]) -> bytes:
+    # Элементы массива через запятую, без внешних скобок
+    if orjson is not None:
+        return orjson.dumps(items)[1:-1]
+    return json.dumps(items, default=_default, separators=(",", ":"), ensure_ascii=False)[1:-1].encode()
+
+
+def encode_lines(items: List[dict]) -> bytes:
+    if orjson is not None:
+        return b"".join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in items)
+    return "".join(
+        json.dumps(item, default=_default, separators=(",", ":"), ensure_ascii=False) + "\n" for item in items
+    ).encode()
+
+
+def iter_json_array(chunks: Iterator[List[dict]]) -> Iterator[bytes]:
+    yield b"["
+    first = True
+    for items in chunks:
+        if not items:
+            continue
+        body = encode_array_items(items)
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def iter_ndjson(chunks: Iterator[List[dict]]) -> Iterator[bytes]:
+    for items in chunks:
+        if items:
+            yield encode_lines(items)
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def stream_json(request: Request, chunks: Iterator[List[dict]]) -> StreamingResponse:
+    if wants_ndjson(request):
+        return StreamingResponse(iter_ndjson(chunks), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(iter_json_array(chunks), media_type="application/json")
+
+
+def result_item_chunks(filters: ResultFilters, cursor: Optional[str]) -> Iterator[List[dict]]:
+    # Порядок и курсор - как у постраничных списков результатов (новые сначала).
+    # Отдельная сессия: ответ отдается уже после выхода из обработчика
+    session = SessionLocal()
+    try:
+        query = after_cursor(filters.apply(results_with_refs(session)), RESULT_ORDER, cursor, descending=True)
+        for rows in partitions(session, query.statement):
+            yield [row._asdict() for row in rows]
+    finally:
+        session.close()
+
+
+def stream_results(request: Request, filters: ResultFilters, cursor: Optional[str]) -> StreamingResponse:
+    # Те же поля, что у ResultResponse. Курсор проверяется до начала ответа,
+    # чтобы ошибка 400 не возникла посреди потока
+    if cursor:
+        decode_cursor(cursor, RESULT_ORDER)
+    return stream_json(request, result_item_chunks(filters, cursor))
@@ -0,0 +1,183 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter as Tally
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from answer_keys import GradedAnswer
+from answer_store import save_answer_sets
+from config import SUBMIT_BATCH_SIZE, SUBMIT_FLUSH_INTERVAL_MS, SUBMIT_QUEUE_MAX
+from database import SessionLocal
+from metrics import counter, distribution, gauge
+from models import TestResult
+from score_stats import record_score
+from item_stats import record_items
+from variants import record_attempt_result
+
+# Отложенная запись отправленных тестов (write-behind): маршрут проверяет ответы по ключу
+# из кэша и сразу возвращает балл, а строки TestResult / UserAnswer уходят в очередь.
+# Фоновый поток записывает очередь пачками - одна транзакция (один fsync) на пачку,
+# пачка закрывается по размеру SUBMIT_BATCH_SIZE или по времени SUBMIT_FLUSH_INTERVAL_MS.
+# При остановке приложения очередь дописывается полностью (см. lifespan в main.py).
+
+logger = logging.getLogger(__name__)
+
+
+class PendingSubmission(NamedTuple):
+    student_id: int
+    test_id: int
+    score: int
+    total_questions: int
+    graded: List[GradedAnswer]
+    completed_at: datetime
+    # Попытка с вариантом: ей проставляется result_id в транзакции записи результата
+    attempt_id: Optional[int] = None
+
+
+def write_submissions(db: Session, submissions: List[PendingSubmission]) -> List[int]:
+    # Результаты, ответы, статистика и анализ вопросов пачки попыток; коммит делает вызывающий код
+    result_ids = [
+        db.execute(
+            insert(TestResult).values(
+                user_id=submission.student_id,
+                test_id=submission.test_id,
+                score=submission.score,
+                total_questions=submission.total_questions,
+                completed_at=submission.completed_at,
+            )
+        ).inserted_primary_key[0]
+        for submission in submissions
+    ]
+
+    for result_id, submission in zip(result_ids, submissions):
+        if submission.attempt_id is not None:
+            record_attempt_result(db, submission.attempt_id, result_id)
+
+    save_answer_sets(db, [
+        (result_id, submission.graded) for result_id, submission in zip(result_ids, submissions)
+    ])
+
+    # Одинаковые попытки пачки - одним обновлением строки гистограммы
+    scores = Tally((submission.test_id, submission.score, submission.total_questions) for submission in submissions)
+    for (test_id, score, total_questions), attempts in scores.items():
+        record_score(db, test_id, score, total_questions, attempts)
+
+    record_items(db, [
+        (submission.test_id, submission.score / submission.total_questions if submission.total_questions else 0.0,
+         submission.graded)
+        for submission in submissions
+    ])
+
+    return result_ids
+
+
+queue_depth = gauge("submission_queue_depth", "Submissions waiting to be written")
+flush_seconds = distribution("submission_flush_seconds", "Time to write and commit one batch")
+flush_batch_size = distribution("submission_flush_batch_size", "Submissions per committed batch")
+submissions_written = counter("submissions_written_total", "Submissions written by the background writer")
+submissions_failed = counter("submissions_failed_total", "Queued submissions that could not be written")
+submissions_rejected = counter("submissions_queue_full_total", "Submissions written synchronously because the queue was full")
+
+_STOP = object()
+
+
+class SubmissionWriter:
+    def __init__(self, session_factory=SessionLocal, batch_size: int = SUBMIT_BATCH_SIZE,
+                 flush_interval: float = SUBMIT_FLUSH_INTERVAL_MS / 1000, max_pending: int = SUBMIT_QUEUE_MAX):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        # Новые попытки больше не принимаются, уже принятые дописываются до выхода
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def submit(self, submission: PendingSubmission) -> bool:
+        # False - писатель не запущен или очередь переполнена: вызывающий код пишет сам
+        with self._lock:
+            if not self._running:
+                return False
+            try:
+                self._queue.put_nowait(submission)
+            except queue.Full:
+                submissions_rejected.inc()
+                return False
+        return True
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[PendingSubmission]) -> None:
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            try:
+                write_submissions(db, batch)
+                db.commit()
+                submissions_written.inc(len(batch))
+            except Exception:
+                # Одна ошибочная попытка не должна терять всю пачку: дописываем по одной
+                db.rollback()
+                logger.exception("Batch of %d submissions failed, retrying one by one", len(batch))
+                for submission in batch:
+                    try:
+                        write_submissions(db, [submission])
+                        db.commit()
+                        submissions_written.inc()
+                    except Exception:
+                        db.rollback()
+                        submissions_failed.inc()
+                        logger.exception("Dropping submission of test %d by student %d",
+                                         submission.test_id, submission.student_id)
+        finally:
+            db.close()
+            flush_seconds.observe(time.perf_counter() - started)
+            flush_batch_size.observe(len(batch))
+
+
+submission_writer = SubmissionWriter()
+queue_depth.set_function(submission_writer.pending)
@@ -0,0 +1,48 @@
+import os
+import sys
+import pytest
+
+# Тесты запускаются из backend/ (python -m pytest tests) или из корня репозитория:
+# модули приложения импортируются как в main.py - от каталога backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Без файла секрета в рабочем каталоге; быстрые хеши паролей
+os.environ.setdefault("AUTH_SECRET", "test-secret")
+os.environ.setdefault("PASSWORD_HASH_ITERATIONS", "1000")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # Отдельная база теста со схемой после всех миграций
+    import migrations
+    from bench.common import make_engine
+
+    engine = make_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    # Кэши процесса держат id из баз предыдущих тестов
+    from answer_keys import answer_key_cache, question_key_cache
+    from bench.common import make_client
+    from security import principal_cache
+    from snapshots import snapshot_cache
+    from variants import canonical_cache
+
+    for cache in (answer_key_cache, question_key_cache, principal_cache, snapshot_cache, canonical_cache):
+        cache.clear()
+    client = make_client(engine)
+    yield client
+    client.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def login(client):
+    # Регистрация и заголовок Authorization пользователя
+    def login(username, role):
+        client.post("/auth/register", json={"username": username, "password": "pw", "role": role})
+        token = client.post("/auth/login", json={"username": username, "password": "pw"}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return login
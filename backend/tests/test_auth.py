@@ -0,0 +1,50 @@
+from sqlalchemy import text
+import routes.auth
+from security import issue_token, needs_rehash, read_token, verify_password
+
+# Регистрация и вход: токены, перехеширование старых паролей, проверки до PBKDF2
+
+
+def test_rejected_registration_skips_password_hashing(client, monkeypatch):
+    hashed = []
+    hash_password = routes.auth.hash_password
+    monkeypatch.setattr(routes.auth, "hash_password", lambda password: hashed.append(password) or hash_password(password))
+
+    assert client.post("/auth/register", json={"username": "u", "password": "pw", "role": "student"}).status_code == 200
+    assert client.post("/auth/register", json={"username": "u", "password": "pw", "role": "student"}).status_code == 400
+    assert client.post("/auth/register", json={"username": "v", "password": "pw", "role": "admin"}).status_code == 400
+    assert len(hashed) == 1
+
+
+def test_token_round_trip():
+    token = issue_token(5, "teacher", secret="s")
+    claims = read_token(token, secret="s")
+    assert (claims["sub"], claims["role"]) == (5, "teacher")
+    # Чужой секрет, подделанное содержимое и истекший срок
+    assert read_token(token, secret="other") is None
+    signature = token.partition(".")[2]
+    forged = issue_token(6, "teacher", secret="s").partition(".")[0]
+    assert read_token(f"{forged}.{signature}", secret="s") is None
+    assert read_token(issue_token(5, "teacher", secret="s", ttl=-1), secret="s") is None
+    assert read_token("garbage", secret="s") is None
+
+
+def test_login_issues_token_accepted_by_protected_routes(client, login):
+    headers = login("t", "teacher")
+    assert client.get("/teacher/statistics", headers=headers).status_code == 200
+    assert client.get("/teacher/statistics", headers={"Authorization": "Bearer garbage"}).status_code == 401
+    assert client.post("/auth/login", json={"username": "t", "password": "wrong"}).status_code == 401
+
+
+def test_login_rehashes_legacy_plaintext_password(client, engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (username, password, role) VALUES ('old', 'secret', 'student')"))
+
+    response = client.post("/auth/login", json={"username": "old", "password": "secret"})
+    assert response.status_code == 200
+    with engine.connect() as conn:
+        stored = conn.execute(text("SELECT password FROM users WHERE username = 'old'")).scalar()
+    assert stored != "secret" and not needs_rehash(stored) and verify_password("secret", stored)
+    # Вход с новым хешем
+    assert client.post("/auth/login", json={"username": "old", "password": "secret"}).status_code == 200
+    assert client.post("/auth/login", json={"username": "old", "password": "wrong"}).status_code == 401
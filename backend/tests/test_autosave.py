@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy.orm import sessionmaker
+from autosave import autosave_buffer, decode_answers, write_progress
+from variants import get_attempt
+
+# Автосохранение: ответы из буфера попадают в запечатанную попытку, запоздавшая запись буфера
+# не меняет отправленные ответы
+
+
+@pytest.fixture
+def buffer(engine, monkeypatch):
+    # Буфер приложения с базой теста; фоновая запись не успевает сработать за время теста
+    monkeypatch.setattr(autosave_buffer, "session_factory", sessionmaker(bind=engine))
+    monkeypatch.setattr(autosave_buffer, "flush_interval", 3600)
+    autosave_buffer.start()
+    yield autosave_buffer
+    autosave_buffer.stop()
+
+
+def start_attempt(client, login):
+    teacher, student = login("t", "teacher"), login("s", "student")
+    questions = [{"question_text": f"Q{i}", "options": [{"option_text": "a", "is_correct": True},
+                                                        {"option_text": "b", "is_correct": False}]}
+                 for i in range(2)]
+    test = client.post("/tests/", headers=teacher, json={"title": "T", "questions": questions}).json()
+    attempt = client.post(f"/student/tests/{test['id']}/attempts", headers=student).json()
+    # {question_id: (id правильного варианта, id неправильного)}
+    options = {question["id"]: tuple(option["id"] for option in sorted(question["options"],
+                                                                       key=lambda option: option["option_text"]))
+               for question in attempt["questions"]}
+    return student, test["id"], attempt["attempt_id"], options
+
+
+def test_buffered_answers_reach_sealed_attempt(client, login, buffer):
+    student, test_id, attempt_id, options = start_attempt(client, login)
+    first, second = options
+    response = client.patch(f"/student/attempts/{attempt_id}/answers", headers=student,
+                            json={"answers": [{"question_id": first, "selected_option_ids": [options[first][0]]}]})
+    assert response.json()["queued"] is True
+    assert buffer.peek(attempt_id) == {first: [options[first][0]]}
+
+    # Ответ на второй вопрос приходит с отправкой, первый - только из буфера
+    response = client.post("/student/submit", headers=student, json={
+        "test_id": test_id, "attempt_id": attempt_id,
+        "answers": [{"question_id": second, "selected_option_ids": [options[second][1]]}],
+    })
+    assert response.status_code == 200
+    assert response.json()["score"] == 1
+    assert buffer.peek(attempt_id) == {}
+
+    sealed = client.get(f"/student/attempts/{attempt_id}", headers=student).json()
+    assert sealed["submitted"] is True
+    assert {answer["question_id"]: answer["selected_option_ids"] for answer in sealed["answers"]} \
+        == {first: [options[first][0]], second: [options[second][1]]}
+
+
+def test_late_flush_does_not_overwrite_submitted_attempt(client, login, buffer, engine):
+    student, test_id, attempt_id, options = start_attempt(client, login)
+    first, second = options
+    client.post("/student/submit", headers=student, json={
+        "test_id": test_id, "attempt_id": attempt_id,
+        "answers": [{"question_id": first, "selected_option_ids": [options[first][0]]}],
+    })
+
+    # Изменение, пришедшее после отправки (например, из другого процесса), записывается позже
+    assert buffer.patch(attempt_id, {first: [options[first][1]], second: [options[second][0]]})
+    assert buffer.flush() == 0
+
+    with sessionmaker(bind=engine)() as db:
+        assert write_progress(db, {attempt_id: {first: [options[first][1]]}}) == 0
+        db.commit()
+        assert decode_answers(get_attempt(db, attempt_id).answers) == {first: [options[first][0]], second: []}
@@ -0,0 +1,54 @@
+import json
+from fastapi import HTTPException
+import content_writer
+
+# Импорт JSON Lines: ошибочная строка попадает в errors, остальные тесты записываются
+
+
+def line(title, questions=2):
+    return json.dumps({"title": title, "questions": [
+        {"question_text": f"{title}-{number}", "options": [{"option_text": "a", "is_correct": True}]}
+        for number in range(questions)
+    ]})
+
+
+def import_lines(client, headers, lines, chunk_size=3):
+    response = client.post(f"/tests/import?chunk_size={chunk_size}", headers=headers, content="\n".join(lines))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def titles(client):
+    return sorted(row["title"] for row in client.get("/tests/?limit=100").json())
+
+
+def test_invalid_lines_do_not_drop_valid_ones(client, login):
+    teacher = login("t", "teacher")
+    duplicate = json.loads(line("D", 1))
+    duplicate["questions"] *= 2
+    lines = [line("A"), "not json", line("B"), json.dumps(duplicate), line("C")]
+
+    result = import_lines(client, teacher, lines)
+    assert result["imported"] == 3
+    assert [error["line"] for error in result["errors"]] == [2, 4]
+    assert titles(client) == ["A", "B", "C"]
+
+
+def test_rejected_write_falls_back_to_single_tests(client, login, monkeypatch):
+    # Запись теста из трех вопросов отклоняется: его пачка записывается по одному тесту
+    check_unique = content_writer._check_unique
+
+    def reject_three(question_ids):
+        if len(question_ids) == 3:
+            raise HTTPException(status_code=400, detail="Duplicate question in test")
+        check_unique(question_ids)
+
+    monkeypatch.setattr(content_writer, "_check_unique", reject_three)
+    teacher = login("t", "teacher")
+    lines = [line(f"T{number}", 3 if number in (4, 7) else 2) for number in range(9)]
+
+    result = import_lines(client, teacher, lines)
+    assert result["imported"] == 7
+    assert result["errors"] == [{"line": 5, "detail": "Duplicate question in test"},
+                                {"line": 8, "detail": "Duplicate question in test"}]
+    assert titles(client) == sorted(f"T{number}" for number in range(9) if number not in (4, 7))
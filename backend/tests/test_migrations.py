@@ -0,0 +1,52 @@
+import json
+from sqlalchemy import create_engine, text
+import migrations
+
+# Цепочка миграций на базе исходной схемы (0001) с данными старого формата:
+# одинаковые вопросы разных тестов и ответы в JSON user_answers.selected_options
+
+
+def baseline(path):
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.upgrade(engine, "0001")
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, password, role) VALUES (1, 't', 'pw', 'teacher')"))
+        conn.execute(text("INSERT INTO users (id, username, password, role) VALUES (2, 's', 'pw', 'student')"))
+        for test_id in (1, 2):
+            conn.execute(text(
+                "INSERT INTO tests (id, title, teacher_id, created_at) VALUES (:id, 'T', 1, '2024-01-01')"
+            ), {"id": test_id})
+            # Вопрос 1 теста 1 и вопрос 2 теста 2 одинаковы: варианты 3, 4 сводятся к 1, 2
+            conn.execute(text("INSERT INTO questions (id, test_id, question_text) VALUES (:id, :id, 'Q')"),
+                         {"id": test_id})
+            for option_id, correct in ((test_id * 2 - 1, True), (test_id * 2, False)):
+                conn.execute(text(
+                    "INSERT INTO options (id, question_id, option_text, is_correct) "
+                    "VALUES (:id, :question_id, :text, :correct)"
+                ), {"id": option_id, "question_id": test_id, "text": "a" if correct else "b", "correct": correct})
+        conn.execute(text(
+            "INSERT INTO test_results (id, user_id, test_id, score, total_questions) VALUES (1, 2, 2, 1, 1)"
+        ))
+        for answer_id, selected in ((1, "[3]"), (2, "not json"), (3, "[4]")):
+            conn.execute(text(
+                "INSERT INTO user_answers (id, result_id, question_id, selected_options) VALUES (:id, 1, 2, :selected)"
+            ), {"id": answer_id, "selected": selected})
+    return engine
+
+
+def test_upgrade_from_baseline_schema(tmp_path):
+    engine = baseline(tmp_path / "baseline.db")
+    try:
+        migrations.upgrade(engine)
+        assert migrations.pending(engine) == []
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT id FROM questions")).scalars().all() == [1]
+            assert conn.execute(text("SELECT test_id, question_id FROM test_questions ORDER BY test_id")).all() \
+                == [(1, 1), (2, 1)]
+            answers = dict(conn.execute(text("SELECT id, selected_options FROM user_answers")).all())
+    finally:
+        engine.dispose()
+    # Ответы переведены на варианты версии; поврежденная строка не мешает миграции
+    assert json.loads(answers[1]) == [1]
+    assert json.loads(answers[3]) == [2]
+    assert answers[2] == "not json"
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy.orm import sessionmaker
+from bench.common import make_engine, make_client
+from bench.seed import seed
+from config import AUTH_SECRET
+from database import count_queries
+import models
+from security import issue_token, principal_cache
+from answer_keys import answer_key_cache, question_key_cache
+from snapshots import snapshot_cache
+from variants import canonical_cache
+
+# Число SQL-запросов списков и карточек не должно зависеть от объема данных:
+# одни и те же запросы выполняются на маленькой и на большой базе, счетчики сравниваются.
+# Кэши процесса очищаются перед каждым запросом - учитываются и запросы их заполнения
+
+SCALES = {
+    "small": {"students": 3, "tests": 3, "questions": 2, "attempts": 5},
+    "large": {"students": 40, "tests": 60, "questions": 15, "attempts": 400},
+}
+
+CACHES = (answer_key_cache, question_key_cache, principal_cache, snapshot_cache, canonical_cache)
+
+
+def endpoints(ids):
+    return {
+        "tests": ("teacher", "/tests/"),
+        "student_catalog": ("student", "/student/tests"),
+        "student_tests_full": ("student", "/student/tests?full=true"),
+        "teacher_results": ("teacher", "/teacher/results"),
+        "teacher_statistics": ("teacher", "/teacher/statistics"),
+        "my_results": ("student", "/student/my-results"),
+        "result_details": ("student", f"/student/results/{ids['result_id']}"),
+    }
+
+
+def measure(scale):
+    engine = make_engine(f"sqlite:///{scale['path']}")
+    seed(engine, teachers=1, **scale["params"])
+    db = sessionmaker(bind=engine)()
+    try:
+        result_id, student_id = db.query(models.TestResult.id, models.TestResult.user_id).order_by(models.TestResult.id).first()
+        teacher_id = db.query(models.User.id).filter(models.User.role == "teacher").scalar()
+    finally:
+        db.close()
+
+    headers = {
+        "teacher": {"Authorization": f"Bearer {issue_token(teacher_id, 'teacher', secret=AUTH_SECRET)}"},
+        "student": {"Authorization": f"Bearer {issue_token(student_id, 'student', secret=AUTH_SECRET)}"},
+    }
+    client = make_client(engine)
+    counts = {}
+    try:
+        for name, (role, url) in endpoints({"result_id": result_id}).items():
+            for cache in CACHES:
+                cache.clear()
+            with count_queries(engine) as counter:
+                response = client.get(url, headers=headers[role])
+            assert response.status_code == 200, (name, response.text)
+            counts[name] = counter["count"]
+    finally:
+        client.app.dependency_overrides.clear()
+        engine.dispose()
+    return counts
+
+
+@pytest.fixture(scope="module")
+def query_counts(tmp_path_factory):
+    return {
+        name: measure({"path": tmp_path_factory.mktemp(name) / "counts.db", "params": params})
+        for name, params in SCALES.items()
+    }
+
+
+@pytest.mark.parametrize("endpoint", list(endpoints({"result_id": 0})))
+def test_query_count_does_not_grow_with_data(query_counts, endpoint):
+    assert query_counts["small"][endpoint] == query_counts["large"][endpoint]
@@ -0,0 +1,38 @@
+# Банк вопросов преподавателя: версии из его тестов; чужие версии не видны и не ссылаются
+
+
+def question(text, correct="a"):
+    return {"question_text": text, "options": [{"option_text": "a", "is_correct": correct == "a"},
+                                               {"option_text": "b", "is_correct": correct == "b"}]}
+
+
+def test_bank_is_scoped_to_the_teacher(client, login):
+    first, second = login("t1", "teacher"), login("t2", "teacher")
+    own = client.post("/tests/", headers=first, json={"title": "A", "questions": [question("Q1")]}).json()
+    other = client.post("/tests/", headers=second, json={"title": "B", "questions": [question("Q2")]}).json()
+    own_id, other_id = own["questions"][0]["id"], other["questions"][0]["id"]
+
+    assert [row["id"] for row in client.get("/tests/questions", headers=first).json()] == [own_id]
+    assert client.get(f"/tests/questions/{own_id}", headers=first).status_code == 200
+    assert client.get(f"/tests/questions/{other_id}", headers=first).status_code == 404
+
+    # Ссылка на чужую версию отклоняется так же, как на несуществующую
+    response = client.put(f"/tests/{own['id']}", headers=first, json={"questions": [{"id": own_id}, {"id": other_id}]})
+    assert response.status_code == 400
+    assert client.put(f"/tests/{own['id']}", headers=first, json={"questions": [{"id": 9999}]}).status_code == 400
+    # Изменение чужого теста
+    assert client.put(f"/tests/{other['id']}", headers=first, json={"title": "X"}).status_code == 403
+
+
+def test_teacher_reuses_own_versions_by_reference(client, login):
+    teacher = login("t", "teacher")
+    source = client.post("/tests/", headers=teacher, json={"title": "A", "questions": [question("Q1")]}).json()
+    target = client.post("/tests/", headers=teacher, json={"title": "B", "questions": [question("Q2")]}).json()
+    version_id = source["questions"][0]["id"]
+
+    response = client.put(f"/tests/{target['id']}", headers=teacher,
+                          json={"questions": [{"id": target["questions"][0]["id"]}, {"id": version_id}]})
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()["questions"]] == [target["questions"][0]["id"], version_id]
+    bank = {row["id"]: row["tests_count"] for row in client.get("/tests/questions", headers=teacher).json()}
+    assert bank[version_id] == 2
@@ -0,0 +1,31 @@
+from time import monotonic
+from ratelimit import RouteGroup, build_groups, client_key, parse_limits
+from security import issue_token
+
+# Ключи и ведра ограничения нагрузки: запросы без токена - по IP со своим лимитом
+
+
+def scope(ip, token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return {"type": "http", "client": (ip, 50000), "headers": headers}
+
+
+def test_tokenless_clients_from_different_ips_have_separate_buckets():
+    group = RouteGroup("auth", parse_limits("anonymous=1:3"), 100)
+    now = monotonic() + 1
+    first, second = client_key(scope("10.0.0.1")), client_key(scope("10.0.0.2"))
+    assert first != second
+    for key in (first, second):
+        assert [group.check_rate(key, now) is None for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_keys_by_user_not_ip():
+    token = issue_token(7, "student")
+    assert client_key(scope("10.0.0.1", token)) == client_key(scope("10.0.0.2", token)) == "user:7"
+
+
+def test_default_groups_admit_a_classroom_behind_one_ip():
+    groups = build_groups()
+    now = monotonic() + 1
+    for name in ("auth", "student"):
+        assert all(groups[name].check_rate("ip:10.0.0.1", now) is None for _ in range(30)), name
@@ -0,0 +1,32 @@
+from sqlalchemy import text
+import routes.teacher
+
+# Статистика преподавателя из test_results и из test_score_summary (USE_STATS_SUMMARY)
+# на одних и тех же данных должна совпадать
+
+
+def test_summary_mode_matches_results_mode(client, login, engine, monkeypatch):
+    teacher, student = login("t", "teacher"), login("s", "student")
+    question = {"question_text": "Q", "options": [{"option_text": "a", "is_correct": True},
+                                                  {"option_text": "b", "is_correct": False}]}
+    tests = [client.post("/tests/", headers=teacher, json={"title": f"T{number}", "questions": [question]}).json()
+             for number in range(3)]
+    for number, test in enumerate(tests):
+        options = test["questions"][0]["options"]
+        for attempt in range(number + 2):
+            selected = [options[attempt % 2]["id"]]
+            assert client.post("/student/submit", headers=student, json={"test_id": test["id"], "answers": [
+                {"question_id": test["questions"][0]["id"], "selected_option_ids": selected}
+            ]}).status_code == 200
+    # Результат без балла (старые данные) и удаленный тест с попытками
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO test_results (user_id, test_id) VALUES (2, :test_id)"), {"test_id": tests[0]["id"]})
+    assert client.delete(f"/tests/{tests[1]['id']}", headers=teacher).status_code == 200
+
+    statistics = {}
+    for mode in (False, True):
+        monkeypatch.setattr(routes.teacher, "USE_STATS_SUMMARY", mode)
+        statistics[mode] = client.get("/teacher/statistics", headers=teacher).json()
+
+    assert statistics[False] == statistics[True]
+    assert statistics[False]["total_attempts"] == 2 + 4
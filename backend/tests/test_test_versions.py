@@ -0,0 +1,35 @@
+import threading
+
+# Одновременные изменения одного теста: каждое получает свою версию, и один ETag
+# никогда не соответствует разному содержимому
+
+UPDATES = 8
+
+
+def test_concurrent_updates_get_distinct_versions(client, login):
+    headers = login("t", "teacher")
+    test = client.post("/tests/", headers=headers, json={"title": "T", "questions": [
+        {"question_text": "Q", "options": [{"option_text": "a", "is_correct": True}]}
+    ]}).json()
+
+    barrier = threading.Barrier(UPDATES)
+    seen = []
+
+    def update(number):
+        barrier.wait()
+        status = client.put(f"/tests/{test['id']}", headers=headers, json={"title": f"T{number}"}).status_code
+        snapshot = client.get(f"/tests/{test['id']}", headers=headers)
+        seen.append((status, snapshot.headers["etag"], snapshot.json()["title"]))
+
+    threads = [threading.Thread(target=update, args=(number,)) for number in range(UPDATES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _, _ in seen] == [200] * UPDATES
+    assert client.get(f"/tests/{test['id']}", headers=headers).json()["version"] == test["version"] + UPDATES
+    titles_by_etag = {}
+    for _, etag, title in seen:
+        titles_by_etag.setdefault(etag, set()).add(title)
+    assert all(len(titles) == 1 for titles in titles_by_etag.values())
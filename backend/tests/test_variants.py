@@ -0,0 +1,59 @@
+# Варианты попыток: вопросы варианта выводятся из seed попытки, проверка и подробный
+# результат - только по ним
+
+
+def create_test(client, headers, questions=4, per_attempt=2):
+    body = {
+        "title": "T",
+        "questions": [{"question_text": f"Q{i}", "options": [{"option_text": "a", "is_correct": True},
+                                                            {"option_text": "b", "is_correct": False}]}
+                      for i in range(questions)],
+        "shuffle_questions": True,
+        "shuffle_options": True,
+        "questions_per_attempt": per_attempt,
+    }
+    return client.post("/tests/", headers=headers, json=body).json()
+
+
+def correct_option(question):
+    return next(option["id"] for option in question["options"] if option["option_text"] == "a")
+
+
+def test_attempt_variant_is_stable(client, login):
+    teacher, student = login("t", "teacher"), login("s", "student")
+    test = create_test(client, teacher)
+    attempt = client.post(f"/student/tests/{test['id']}/attempts", headers=student).json()
+    assert len(attempt["questions"]) == 2
+
+    # Перезагрузка страницы возвращает тот же вариант в том же порядке
+    again = client.get(f"/student/attempts/{attempt['attempt_id']}", headers=student).json()
+    assert again["questions"] == attempt["questions"]
+
+    # Вопрос не из варианта не принимается; без attempt_id тест с выборкой не отправляется
+    outside = next(question["id"] for question in test["questions"]
+                   if question["id"] not in {question["id"] for question in attempt["questions"]})
+    response = client.patch(f"/student/attempts/{attempt['attempt_id']}/answers", headers=student,
+                            json={"answers": [{"question_id": outside, "selected_option_ids": []}]})
+    assert response.status_code == 400
+    assert client.post("/student/submit", headers=student,
+                       json={"test_id": test["id"], "answers": []}).status_code == 400
+
+
+def test_result_details_list_unanswered_variant_questions(client, login):
+    teacher, student = login("t", "teacher"), login("s", "student")
+    test = create_test(client, teacher)
+    attempt = client.post(f"/student/tests/{test['id']}/attempts", headers=student).json()
+    answered, unanswered = attempt["questions"]
+
+    submitted = client.post("/student/submit", headers=student, json={
+        "test_id": test["id"], "attempt_id": attempt["attempt_id"],
+        "answers": [{"question_id": answered["id"], "selected_option_ids": [correct_option(answered)]}],
+    }).json()
+    assert (submitted["score"], submitted["total_questions"]) == (1, 2)
+
+    details = client.get(f"/student/results/{submitted['result_id']}", headers=student).json()
+    by_text = {question["question_text"]: question for question in details["questions"]}
+    assert set(by_text) == {answered["question_text"], unanswered["question_text"]}
+    assert by_text[answered["question_text"]]["is_correct"] is True
+    assert by_text[unanswered["question_text"]]["is_correct"] is False
+    assert not any(option["was_selected"] for option in by_text[unanswered["question_text"]]["options"])
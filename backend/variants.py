@@ -0,0 +1,228 @@
+import itertools
+import json
+import random
+import secrets
+from datetime import datetime
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.orm import Session
+from cache import make_cache
+from config import SNAPSHOT_CACHE_SIZE
+from invalidation import invalidation_bus
+from models import Attempt, Test
+from queries import get_test_with_content
+
+# Варианты теста для попыток: выборка questions_per_attempt вопросов из всех, порядок вопросов
+# и порядок вариантов выводятся из seed попытки детерминированно - в базе хранится только seed.
+# Каноническая структура версии теста (готовые JSON-фрагменты вопросов и вариантов без
+# правильных ответов) кэшируется по (test_id, version), как снимки тестов: вариант - это
+# перестановки random.Random(seed) и склейка байтов, без запросов к вопросам и без сериализации.
+# Вариант строится по текущей версии теста: после изменения теста незавершенная попытка
+# получает и сдает уже новое содержимое, как и без вариантов.
+
+
+class CanonicalQuestion(NamedTuple):
+    id: int
+    head: bytes  # {"id":..,"question_text":..,"options":[
+    options: Tuple[bytes, ...]  # {"id":..,"option_text":..} по одному на вариант
+
+
+class CanonicalTest(NamedTuple):
+    head: bytes  # {"id":..,"title":..,"description":..,
+    questions: Tuple[CanonicalQuestion, ...]
+    shuffle_questions: bool
+    shuffle_options: bool
+    questions_per_attempt: Optional[int]
+
+
+canonical_cache = make_cache("canonical_tests", SNAPSHOT_CACHE_SIZE)
+
+
+def _json(value: dict) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _open_object(value: dict) -> bytes:
+    # JSON-объект без закрывающей скобки: к нему дописываются следующие поля
+    return _json(value)[:-1] + b","
+
+
+def build_canonical(db: Session, test_id: int) -> Optional[CanonicalTest]:
+    test = get_test_with_content(db, test_id)
+    if not test:
+        return None
+    return CanonicalTest(
+        head=_open_object({"id": test.id, "title": test.title, "description": test.description}),
+        questions=tuple(
+            CanonicalQuestion(
+                id=question.id,
+                head=_open_object({"id": question.id, "question_text": question.question_text}) + b'"options":[',
+                options=tuple(_json({"id": option.id, "option_text": option.option_text})
+                              for option in question.options),
+            )
+            for question in test.questions
+        ),
+        shuffle_questions=bool(test.shuffle_questions),
+        shuffle_options=bool(test.shuffle_options),
+        questions_per_attempt=test.questions_per_attempt,
+    )
+
+
+def get_canonical(db: Session, test_id: int) -> Optional[CanonicalTest]:
+    # Единственный обязательный запрос - версия теста по первичному ключу
+    version = db.query(Test.version).filter(Test.id == test_id).scalar()
+    if version is None:
+        return None
+    canonical = canonical_cache.get((test_id, version))
+    if canonical is None:
+        canonical = build_canonical(db, test_id)
+        if canonical is None:
+            return None
+        canonical_cache.put((test_id, version), canonical)
+    return canonical
+
+
+def has_variants(test) -> bool:
+    return bool(test.shuffle_questions or test.shuffle_options or test.questions_per_attempt is not None)
+
+
+def requires_attempt(db: Session, test_id: int) -> bool:
+    # Тест с выборкой или перемешиванием выдается и сдается только через попытку:
+    # полный тест или отправка без attempt_id обходили бы вариант
+    return db.query(Test.id).filter(
+        Test.id == test_id,
+        or_(Test.shuffle_questions, Test.shuffle_options, Test.questions_per_attempt.isnot(None)),
+    ).first() is not None
+
+
+def invalidate_canonical(test_id: int) -> None:
+    canonical_cache.invalidate_where(lambda key: key[0] == test_id)
+
+
+invalidation_bus.track(canonical_cache)
+invalidation_bus.subscribe("test", lambda key: invalidate_canonical(int(key)))
+
+
+# Перестановки вариантов считаются заранее для вопросов с числом вариантов до этого порога
+MAX_PRECOMPUTED_OPTIONS = 6
+
+
+def _draw(rnd: random.Random, items: list, size: int) -> list:
+    # Частичное перемешивание Фишера - Йетса: случайные size элементов в случайном порядке.
+    # Только rnd.random() - последовательность не зависит от реализации sample/shuffle
+    count = len(items)
+    for i in range(size):
+        j = i + int(rnd.random() * (count - i))
+        items[i], items[j] = items[j], items[i]
+    return items[:size]
+
+
+@lru_cache(maxsize=None)
+def _permutations(count: int) -> Tuple[Tuple[int, ...], ...]:
+    return tuple(itertools.permutations(range(count)))
+
+
+def _question_order(canonical: CanonicalTest, rnd: random.Random) -> List[int]:
+    # Индексы вопросов варианта; первые числа последовательности seed уходят на выбор
+    # вопросов, поэтому список вопросов выводится без перестановки вариантов
+    count = len(canonical.questions)
+    size = canonical.questions_per_attempt
+    if size is not None and size < count:
+        picked = _draw(rnd, list(range(count)), size)
+        if not canonical.shuffle_questions:
+            picked.sort()
+        return picked
+    if canonical.shuffle_questions:
+        return _draw(rnd, list(range(count)), count)
+    return list(range(count))
+
+
+def _shuffled_options(rnd: random.Random, options: Tuple[bytes, ...]) -> bytes:
+    if len(options) <= MAX_PRECOMPUTED_OPTIONS:
+        permutations = _permutations(len(options))
+        order = permutations[int(rnd.random() * len(permutations))]
+        return b",".join([options[index] for index in order])
+    return b",".join(_draw(rnd, list(options), len(options)))
+
+
+def variant_question_ids(canonical: CanonicalTest, seed: int) -> List[int]:
+    # Вопросы попытки - по ним проверяются ответы
+    return [canonical.questions[index].id for index in _question_order(canonical, random.Random(seed))]
+
+
+def render_variant(canonical: CanonicalTest, attempt_id: int, seed: int,
+                   answers: bytes = b"[]", submitted: bool = False) -> bytes:
+    # JSON варианта в форме AttemptResponse: answers - готовый JSON сохраненных ответов
+    rnd = random.Random(seed)
+    questions = []
+    for index in _question_order(canonical, rnd):
+        question = canonical.questions[index]
+        if canonical.shuffle_options:
+            options = _shuffled_options(rnd, question.options)
+        else:
+            options = b",".join(question.options)
+        questions.append(question.head + options + b"]}")
+    return (canonical.head + b'"attempt_id":%d,"submitted":%s,"answers":' % (attempt_id, b"true" if submitted else b"false")
+            + answers + b',"questions":[' + b",".join(questions) + b"]}")
+
+
+def start_attempt(db: Session, test_id: int, student_id: int) -> Optional[bytes]:
+    # Новая попытка: строка с seed и ее вариант; None - теста нет
+    canonical = get_canonical(db, test_id)
+    if canonical is None:
+        return None
+    seed = secrets.randbits(63)
+    attempt_id = db.execute(
+        insert(Attempt).values(test_id=test_id, user_id=student_id, seed=seed, started_at=datetime.utcnow())
+    ).inserted_primary_key[0]
+    db.commit()
+    return render_variant(canonical, attempt_id, seed)
+
+
+def get_attempt(db: Session, attempt_id: int):
+    return db.query(
+        Attempt.id, Attempt.test_id, Attempt.user_id, Attempt.seed, Attempt.answers,
+        Attempt.submitted_at, Attempt.score, Attempt.total_questions, Attempt.result_id,
+    ).filter(Attempt.id == attempt_id).first()
+
+
+def seal_attempt(db: Session, attempt_id: int, answers: str, score: int, total_questions: int) -> bool:
+    # Условное UPDATE - единственная запись, которая может запечатать попытку: из нескольких
+    # одновременных отправок (повторы клиента, разные процессы) проходит одна.
+    # False - попытка уже отправлена; коммит делает вызывающий код
+    return db.execute(
+        update(Attempt)
+        .where(Attempt.id == attempt_id, Attempt.submitted_at.is_(None))
+        .values(answers=answers, submitted_at=datetime.utcnow(), score=score, total_questions=total_questions)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def attempt_question_ids(db: Session, result_id: int) -> Optional[Set[int]]:
+    # Вопросы варианта попытки, сданной с этим результатом; None - результат без попытки.
+    # При отправке в ответы попытки записываются все вопросы варианта (без ответа - пустые),
+    # у попыток, отправленных раньше, недостающие вопросы выводятся из seed
+    attempt = db.query(Attempt.test_id, Attempt.seed, Attempt.answers, Attempt.total_questions).filter(
+        Attempt.result_id == result_id
+    ).first()
+    if attempt is None:
+        return None
+    question_ids = {int(question_id) for question_id in json.loads(attempt.answers or "{}")}
+    if len(question_ids) < (attempt.total_questions or 0):
+        canonical = get_canonical(db, attempt.test_id)
+        if canonical is not None:
+            question_ids.update(variant_question_ids(canonical, attempt.seed))
+    return question_ids
+
+
+def record_attempt_result(db: Session, attempt_id: int, result_id: int) -> None:
+    db.execute(
+        update(Attempt).where(Attempt.id == attempt_id).values(result_id=result_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def forget_attempts(db: Session, test_id: int) -> None:
+    # До удаления теста (внешний ключ на tests)
+    db.execute(delete(Attempt).where(Attempt.test_id == test_id))
@@ -45,7 +45,7 @@ async function login() {
         
         const data = await response.json();
         
-        // Сохраняем данные пользователя
+        // Сохраняем данные пользователя вместе с токеном доступа
         localStorage.setItem('user', JSON.stringify(data));
         
         // Перенаправляем в зависимости от роли
@@ -1,6 +1,13 @@
 const API_URL = 'http://localhost:8000';
 let currentUser = null;
 let currentTest = null;
+let testsCursor = null;
+let resultsCursor = null;
+
+// Автосохранение: изменения ответов копятся и отправляются одним запросом после паузы
+const AUTOSAVE_DELAY_MS = 1000;
+let unsavedAnswers = {};
+let autosaveTimer = null;
 
 // Проверка авторизации
 function checkAuth() {
@@ -11,7 +18,7 @@ function checkAuth() {
     }
     
     const user = JSON.parse(userStr);
-    if (user.role !== 'student') {
+    if (user.role !== 'student' || !user.access_token) {
         window.location.href = 'index.html';
         return null;
     }
@@ -25,53 +32,90 @@ document.addEventListener('DOMContentLoaded', () => {
     if (currentUser) {
         document.getElementById('username').textContent = currentUser.username;
         loadTests();
+        resumeAttempt();
     }
 });
 
+// Несохраненные изменения отправляются и при закрытии страницы
+window.addEventListener('beforeunload', () => saveAnswers(true));
+
+// Запрос к API с токеном доступа; при истекшем токене - повторный вход
+async function apiFetch(url, options = {}) {
+    const headers = { ...(options.headers || {}), 'Authorization': `Bearer ${currentUser.access_token}` };
+    const response = await fetch(url, { ...options, headers });
+    if (response.status === 401) {
+        logout();
+    }
+    return response;
+}
+
 function logout() {
     localStorage.removeItem('user');
     window.location.href = 'index.html';
 }
 
+// Загрузка одной страницы списка (keyset-пагинация через заголовок X-Next-Cursor)
+async function fetchPage(url, cursor) {
+    const separator = url.includes('?') ? '&' : '?';
+    const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+    const response = await apiFetch(pageUrl);
+    if (!response.ok) throw new Error('Failed to load page');
+    
+    return {
+        items: await response.json(),
+        nextCursor: response.headers.get('X-Next-Cursor')
+    };
+}
+
+function toggleMoreButton(buttonId, cursor) {
+    document.getElementById(buttonId).classList.toggle('hidden', !cursor);
+}
+
 // Загрузка списка тестов
-async function loadTests() {
+async function loadTests(append = false) {
     try {
-        const response = await fetch(`${API_URL}/student/tests`);
-        if (!response.ok) throw new Error('Failed to load tests');
-        
-        const tests = await response.json();
-        displayTests(tests);
+        const page = await fetchPage(`${API_URL}/student/tests`, append ? testsCursor : null);
+        testsCursor = page.nextCursor;
+        displayTests(page.items, append);
+        toggleMoreButton('moreTestsBtn', testsCursor);
     } catch (error) {
         console.error('Error loading tests:', error);
         alert('Ошибка загрузки тестов');
     }
 }
 
-function displayTests(tests) {
+function displayTests(tests, append = false) {
     const container = document.getElementById('testsList');
     
-    if (tests.length === 0) {
+    if (tests.length === 0 && !append) {
         container.innerHTML = '<p>Нет доступных тестов</p>';
         return;
     }
     
-    container.innerHTML = tests.map(test => `
+    const html = tests.map(test => `
         <div class="test-card">
             <h3>${test.title}</h3>
             <p>${test.description || 'Без описания'}</p>
-            <p><strong>Вопросов:</strong> ${test.questions.length}</p>
+            <p><strong>Вопросов:</strong> ${test.questions_count}</p>
             <button onclick="startTest(${test.id})">Начать тест</button>
         </div>
     `).join('');
+    
+    if (append) {
+        container.insertAdjacentHTML('beforeend', html);
+    } else {
+        container.innerHTML = html;
+    }
 }
 
-// Начало теста
+// Начало теста: новая попытка со своим вариантом (порядок и выборка вопросов)
 async function startTest(testId) {
     try {
-        const response = await fetch(`${API_URL}/student/tests/${testId}`);
+        const response = await apiFetch(`${API_URL}/student/tests/${testId}/attempts`, { method: 'POST' });
         if (!response.ok) throw new Error('Failed to load test');
         
         currentTest = await response.json();
+        localStorage.setItem(attemptKey(), currentTest.attempt_id);
         displayTest(currentTest);
     } catch (error) {
         console.error('Error loading test:', error);
@@ -79,6 +123,79 @@ async function startTest(testId) {
     }
 }
 
+// Незавершенная попытка этого пользователя (id хранится до отправки)
+function attemptKey() {
+    return `attempt_${currentUser.id}`;
+}
+
+// Продолжение попытки после перезагрузки: тот же вариант с сохраненными ответами
+async function resumeAttempt() {
+    const attemptId = localStorage.getItem(attemptKey());
+    if (!attemptId) return;
+    
+    try {
+        const response = await apiFetch(`${API_URL}/student/attempts/${attemptId}`);
+        if (!response.ok) throw new Error('Failed to load attempt');
+        
+        const attempt = await response.json();
+        if (attempt.submitted) {
+            localStorage.removeItem(attemptKey());
+            return;
+        }
+        currentTest = attempt;
+        displayTest(currentTest);
+        attempt.answers.forEach(answer => {
+            answer.selected_option_ids.forEach(optionId => {
+                const checkbox = document.getElementById(`option_${optionId}`);
+                if (checkbox) checkbox.checked = true;
+            });
+        });
+    } catch (error) {
+        console.error('Error resuming attempt:', error);
+        localStorage.removeItem(attemptKey());
+    }
+}
+
+function selectedOptions(questionId) {
+    const checkboxes = document.querySelectorAll(`input[name="question_${questionId}"]:checked`);
+    return Array.from(checkboxes).map(cb => parseInt(cb.value));
+}
+
+// Изменение ответа: последнее состояние вопроса попадает в ближайшее автосохранение
+function queueAnswer(questionId) {
+    unsavedAnswers[questionId] = selectedOptions(questionId);
+    clearTimeout(autosaveTimer);
+    autosaveTimer = setTimeout(() => saveAnswers(), AUTOSAVE_DELAY_MS);
+}
+
+async function saveAnswers(keepalive = false) {
+    clearTimeout(autosaveTimer);
+    const questionIds = Object.keys(unsavedAnswers);
+    if (!currentTest || questionIds.length === 0) return;
+    
+    const batch = unsavedAnswers;
+    unsavedAnswers = {};
+    try {
+        const response = await apiFetch(`${API_URL}/student/attempts/${currentTest.attempt_id}/answers`, {
+            method: 'PATCH',
+            keepalive,
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                answers: questionIds.map(id => ({ question_id: parseInt(id), selected_option_ids: batch[id] }))
+            })
+        });
+        // 409 - попытка уже отправлена, сохранять нечего
+        if (!response.ok && response.status !== 409) throw new Error('Failed to save answers');
+    } catch (error) {
+        // Повтор при следующем изменении или через паузу; более новые ответы не затираются
+        console.error('Error saving answers:', error);
+        unsavedAnswers = { ...batch, ...unsavedAnswers };
+        autosaveTimer = setTimeout(() => saveAnswers(), AUTOSAVE_DELAY_MS * 5);
+    }
+}
+
 function displayTest(test) {
     document.getElementById('testsView').classList.add('hidden');
     document.getElementById('testView').classList.remove('hidden');
@@ -104,6 +221,12 @@ function displayTest(test) {
         </div>
     `).join('');
     
+    // Каждое изменение ответа - в автосохранение
+    container.onchange = (e) => {
+        const questionId = e.target.name && e.target.name.replace('question_', '');
+        if (questionId) queueAnswer(questionId);
+    };
+    
     // Обработчик отправки
     const form = document.getElementById('testForm');
     form.onsubmit = (e) => {
@@ -117,25 +240,23 @@ async function submitTest() {
         return;
     }
     
-    // Собираем ответы
-    const answers = currentTest.questions.map(question => {
-        const checkboxes = document.querySelectorAll(`input[name="question_${question.id}"]:checked`);
-        const selectedIds = Array.from(checkboxes).map(cb => parseInt(cb.value));
-        
-        return {
-            question_id: question.id,
-            selected_option_ids: selectedIds
-        };
-    });
+    // Собираем ответы; отправка включает все несохраненные изменения
+    clearTimeout(autosaveTimer);
+    unsavedAnswers = {};
+    const answers = currentTest.questions.map(question => ({
+        question_id: question.id,
+        selected_option_ids: selectedOptions(question.id)
+    }));
     
     try {
-        const response = await fetch(`${API_URL}/student/submit?student_id=${currentUser.id}`, {
+        const response = await apiFetch(`${API_URL}/student/submit`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
                 test_id: currentTest.id,
+                attempt_id: currentTest.attempt_id,
                 answers: answers
             })
         });
@@ -143,7 +264,14 @@ async function submitTest() {
         if (!response.ok) throw new Error('Failed to submit test');
         
         const result = await response.json();
-        showResult(result.result_id);
+        localStorage.removeItem(attemptKey());
+        currentTest = null;
+        if (result.queued) {
+            // Результат принят в очередь записи: балл уже известен, детали появятся в "Мои результаты"
+            displayQueuedResult(result);
+        } else {
+            showResult(result.result_id);
+        }
         
     } catch (error) {
         console.error('Error submitting test:', error);
@@ -153,7 +281,7 @@ async function submitTest() {
 
 async function showResult(resultId) {
     try {
-        const response = await fetch(`${API_URL}/student/results/${resultId}?student_id=${currentUser.id}`);
+        const response = await apiFetch(`${API_URL}/student/results/${resultId}`);
         if (!response.ok) throw new Error('Failed to load result');
         
         const result = await response.json();
@@ -165,6 +293,16 @@ async function showResult(resultId) {
     }
 }
 
+function displayQueuedResult(result) {
+    document.getElementById('testView').classList.add('hidden');
+    document.getElementById('resultView').classList.remove('hidden');
+    
+    document.getElementById('scoreDisplay').textContent = `${result.score} / ${result.total_questions}`;
+    document.getElementById('scoreText').textContent = `Процент правильных ответов: ${Math.round(result.percentage)}%`;
+    document.getElementById('detailedResults').innerHTML =
+        '<p>Детальные результаты скоро будут доступны в разделе "Мои результаты".</p>';
+}
+
 function displayResult(result) {
     document.getElementById('testView').classList.add('hidden');
     document.getElementById('resultView').classList.remove('hidden');
@@ -207,6 +345,7 @@ function displayResult(result) {
 }
 
 function backToTests() {
+    saveAnswers();
     document.getElementById('testsView').classList.remove('hidden');
     document.getElementById('testView').classList.add('hidden');
     document.getElementById('resultView').classList.add('hidden');
@@ -214,13 +353,15 @@ function backToTests() {
     loadTests();
 }
 
-async function showMyResults() {
+async function showMyResults(append = false) {
     try {
-        const response = await fetch(`${API_URL}/student/my-results?student_id=${currentUser.id}`);
-        if (!response.ok) throw new Error('Failed to load results');
-        
-        const results = await response.json();
-        displayMyResults(results);
+        const page = await fetchPage(
+            `${API_URL}/student/my-results`,
+            append ? resultsCursor : null
+        );
+        resultsCursor = page.nextCursor;
+        displayMyResults(page.items, append);
+        toggleMoreButton('moreResultsBtn', resultsCursor);
         
     } catch (error) {
         console.error('Error loading results:', error);
@@ -228,24 +369,24 @@ async function showMyResults() {
     }
 }
 
-function displayMyResults(results) {
+function displayMyResults(results, append = false) {
     document.getElementById('testsView').classList.add('hidden');
     document.getElementById('myResultsView').classList.remove('hidden');
     
     const tbody = document.querySelector('#resultsTable tbody');
     
-    if (results.length === 0) {
+    if (results.length === 0 && !append) {
         tbody.innerHTML = '<tr><td colspan="4" style="text-align: center;">Нет результатов</td></tr>';
         return;
     }
     
-    tbody.innerHTML = results.map(result => {
+    const html = results.map(result => {
         const percentage = Math.round((result.score / result.total_questions) * 100);
         const date = new Date(result.completed_at).toLocaleString('ru-RU');
         
         return `
             <tr>
-                <td>${result.test_title}</td>
+                <td>${result.test_title ?? 'Тест удален'}</td>
                 <td>${result.score} / ${result.total_questions} (${percentage}%)</td>
                 <td>${date}</td>
                 <td>
@@ -254,4 +395,10 @@ function displayMyResults(results) {
             </tr>
         `;
     }).join('');
+    
+    if (append) {
+        tbody.insertAdjacentHTML('beforeend', html);
+    } else {
+        tbody.innerHTML = html;
+    }
 }
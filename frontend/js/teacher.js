@@ -1,6 +1,10 @@
 const API_URL = 'http://localhost:8000';
 let currentUser = null;
 let editingTestId = null;
+let testsCursor = null;
+let resultsCursor = null;
+let searchCursor = null;
+let searchTimer = null;
 
 // Проверка авторизации
 function checkAuth() {
@@ -11,7 +15,7 @@ function checkAuth() {
     }
     
     const user = JSON.parse(userStr);
-    if (user.role !== 'teacher') {
+    if (user.role !== 'teacher' || !user.access_token) {
         window.location.href = 'index.html';
         return null;
     }
@@ -28,34 +32,60 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
+// Запрос к API с токеном доступа; при истекшем токене - повторный вход
+async function apiFetch(url, options = {}) {
+    const headers = { ...(options.headers || {}), 'Authorization': `Bearer ${currentUser.access_token}` };
+    const response = await fetch(url, { ...options, headers });
+    if (response.status === 401) {
+        logout();
+    }
+    return response;
+}
+
 function logout() {
     localStorage.removeItem('user');
     window.location.href = 'index.html';
 }
 
+// Загрузка одной страницы списка (keyset-пагинация через заголовок X-Next-Cursor)
+async function fetchPage(url, cursor) {
+    const separator = url.includes('?') ? '&' : '?';
+    const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+    const response = await apiFetch(pageUrl);
+    if (!response.ok) throw new Error('Failed to load page');
+    
+    return {
+        items: await response.json(),
+        nextCursor: response.headers.get('X-Next-Cursor')
+    };
+}
+
+function toggleMoreButton(buttonId, cursor) {
+    document.getElementById(buttonId).classList.toggle('hidden', !cursor);
+}
+
 // Загрузка списка тестов
-async function loadTests() {
+async function loadTests(append = false) {
     try {
-        const response = await fetch(`${API_URL}/tests/`);
-        if (!response.ok) throw new Error('Failed to load tests');
-        
-        const tests = await response.json();
-        displayTests(tests);
+        const page = await fetchPage(`${API_URL}/tests/`, append ? testsCursor : null);
+        testsCursor = page.nextCursor;
+        displayTests(page.items, append);
+        toggleMoreButton('moreTestsBtn', testsCursor);
     } catch (error) {
         console.error('Error loading tests:', error);
         alert('Ошибка загрузки тестов');
     }
 }
 
-function displayTests(tests) {
+function displayTests(tests, append = false) {
     const container = document.getElementById('testsList');
     
-    if (tests.length === 0) {
+    if (tests.length === 0 && !append) {
         container.innerHTML = '<p>Нет созданных тестов</p>';
         return;
     }
     
-    container.innerHTML = tests.map(test => `
+    const html = tests.map(test => `
         <div class="test-card">
             <h3>${test.title}</h3>
             <p>${test.description || 'Без описания'}</p>
@@ -67,13 +97,100 @@ function displayTests(tests) {
             </div>
         </div>
     `).join('');
+    
+    if (append) {
+        container.insertAdjacentHTML('beforeend', html);
+    } else {
+        container.innerHTML = html;
+    }
+}
+
+// Поиск по тестам и вопросам (/tests/search): запрос отправляется после паузы в наборе
+function scheduleSearch() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => searchTests(), 250);
+}
+
+async function searchTests(append = false) {
+    const query = document.getElementById('searchQuery').value.trim();
+    const resultsView = document.getElementById('searchResults');
+    if (!query) {
+        resultsView.classList.add('hidden');
+        document.getElementById('testsList').classList.remove('hidden');
+        return;
+    }
+    
+    const mine = document.getElementById('searchMine').checked;
+    const url = `${API_URL}/tests/search?q=${encodeURIComponent(query)}&mine=${mine}`;
+    try {
+        const page = await fetchPage(url, append ? searchCursor : null);
+        // Ответ на устаревший запрос (текст уже изменился) не показываем
+        if (document.getElementById('searchQuery').value.trim() !== query) return;
+        searchCursor = page.nextCursor;
+        displaySearchHits(page.items, append);
+        toggleMoreButton('moreSearchBtn', searchCursor);
+        resultsView.classList.remove('hidden');
+        document.getElementById('testsList').classList.add('hidden');
+    } catch (error) {
+        console.error('Error searching tests:', error);
+    }
+}
+
+// Фрагмент приходит как текст с выделением <mark>...</mark>: экранируем всё, кроме выделения
+function renderSnippet(snippet) {
+    const escaped = snippet
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;');
+    return escaped.replace(/&lt;mark&gt;/g, '<mark>').replace(/&lt;\/mark&gt;/g, '</mark>');
+}
+
+function displaySearchHits(hits, append = false) {
+    const container = document.getElementById('searchHits');
+    
+    if (hits.length === 0 && !append) {
+        container.innerHTML = '<p>Ничего не найдено</p>';
+        return;
+    }
+    
+    const html = hits.map(hit => `
+        <div class="search-hit">
+            <strong>${renderSnippet(hit.test_title)}</strong>
+            <span class="search-hit-kind">${hit.question_id ? 'вопрос' : 'тест'}</span>
+            <p>${renderSnippet(hit.snippet)}</p>
+            <button onclick="editTest(${hit.test_id})" class="btn-small">Открыть тест</button>
+        </div>
+    `).join('');
+    
+    if (append) {
+        container.insertAdjacentHTML('beforeend', html);
+    } else {
+        container.innerHTML = html;
+    }
 }
 
 // Модальное окно создания теста
+// Настройки варианта попытки в формах создания ('test') и редактирования ('editTest')
+function fillVariantSettings(prefix, test) {
+    document.getElementById(`${prefix}ShuffleQuestions`).checked = Boolean(test.shuffle_questions);
+    document.getElementById(`${prefix}ShuffleOptions`).checked = Boolean(test.shuffle_options);
+    document.getElementById(`${prefix}QuestionsPerAttempt`).value = test.questions_per_attempt || '';
+}
+
+function readVariantSettings(prefix) {
+    const perAttempt = parseInt(document.getElementById(`${prefix}QuestionsPerAttempt`).value);
+    return {
+        shuffle_questions: document.getElementById(`${prefix}ShuffleQuestions`).checked,
+        shuffle_options: document.getElementById(`${prefix}ShuffleOptions`).checked,
+        questions_per_attempt: perAttempt > 0 ? perAttempt : null
+    };
+}
+
 function showCreateTestModal() {
     document.getElementById('createTestModal').classList.add('active');
     document.getElementById('testTitle').value = '';
     document.getElementById('testDescription').value = '';
+    fillVariantSettings('test', {});
     document.getElementById('questionsContainer').innerHTML = '';
     document.getElementById('createTestError').textContent = '';
     addQuestion();
@@ -209,7 +326,7 @@ async function saveTest() {
     }
     
     try {
-        const response = await fetch(`${API_URL}/tests/?teacher_id=${currentUser.id}`, {
+        const response = await apiFetch(`${API_URL}/tests/`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -217,6 +334,7 @@ async function saveTest() {
             body: JSON.stringify({
                 title: title,
                 description: description,
+                ...readVariantSettings('test'),
                 questions: questions
             })
         });
@@ -240,7 +358,7 @@ async function saveTest() {
 // Редактирование теста
 async function editTest(testId) {
     try {
-        const response = await fetch(`${API_URL}/tests/${testId}`);
+        const response = await apiFetch(`${API_URL}/tests/${testId}`);
         if (!response.ok) throw new Error('Failed to load test');
         
         const test = await response.json();
@@ -257,6 +375,7 @@ function showEditTestModal(test) {
     document.getElementById('editTestModal').classList.add('active');
     document.getElementById('editTestTitle').value = test.title;
     document.getElementById('editTestDescription').value = test.description || '';
+    fillVariantSettings('editTest', test);
     
     const container = document.getElementById('editQuestionsContainer');
     container.innerHTML = '';
@@ -269,12 +388,13 @@ function showEditTestModal(test) {
         const questionDiv = document.createElement('div');
         questionDiv.className = 'question-form';
         questionDiv.id = `edit_question_${questionCounter}`;
+        questionDiv.dataset.id = question.id;
         
         let optionsHtml = '';
         question.options.forEach(option => {
             optionCounter++;
             optionsHtml += `
-                <div class="option-input" id="edit_option_${optionCounter}">
+                <div class="option-input" id="edit_option_${optionCounter}" data-id="${option.id}">
                     <input type="text" class="option-text" placeholder="Текст варианта" value="${option.option_text}">
                     <label>
                         <input type="checkbox" class="option-correct" ${option.is_correct ? 'checked' : ''}>
@@ -403,7 +523,9 @@ async function updateTest() {
             
             if (isCorrect) hasCorrect = true;
             
+            // id существующего варианта: сервер обновит только изменившиеся строки
             options.push({
+                id: optionDiv.dataset.id ? parseInt(optionDiv.dataset.id) : null,
                 option_text: optionText,
                 is_correct: isCorrect
             });
@@ -415,6 +537,7 @@ async function updateTest() {
         }
         
         questions.push({
+            id: questionDiv.dataset.id ? parseInt(questionDiv.dataset.id) : null,
             question_text: questionText,
             options: options
         });
@@ -426,7 +549,7 @@ async function updateTest() {
     }
     
     try {
-        const response = await fetch(`${API_URL}/tests/${editingTestId}?teacher_id=${currentUser.id}`, {
+        const response = await apiFetch(`${API_URL}/tests/${editingTestId}`, {
             method: 'PUT',
             headers: {
                 'Content-Type': 'application/json',
@@ -434,6 +557,7 @@ async function updateTest() {
             body: JSON.stringify({
                 title: title,
                 description: description,
+                ...readVariantSettings('editTest'),
                 questions: questions
             })
         });
@@ -461,7 +585,7 @@ async function deleteTest(testId) {
     }
     
     try {
-        const response = await fetch(`${API_URL}/tests/${testId}?teacher_id=${currentUser.id}`, {
+        const response = await apiFetch(`${API_URL}/tests/${testId}`, {
             method: 'DELETE'
         });
         
@@ -483,7 +607,7 @@ async function deleteTest(testId) {
 // Статистика
 async function showStatistics() {
     try {
-        const response = await fetch(`${API_URL}/teacher/statistics?teacher_id=${currentUser.id}`);
+        const response = await apiFetch(`${API_URL}/teacher/statistics`);
         if (!response.ok) throw new Error('Failed to load statistics');
         
         const stats = await response.json();
@@ -519,7 +643,7 @@ function displayStatistics(stats) {
     // Таблица статистики по тестам
     const tbody = document.querySelector('#statsTable tbody');
     if (stats.tests_statistics.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="4" style="text-align: center;">Нет данных</td></tr>';
+        tbody.innerHTML = '<tr><td colspan="8" style="text-align: center;">Нет данных</td></tr>';
     } else {
         tbody.innerHTML = stats.tests_statistics.map(test => `
             <tr>
@@ -527,6 +651,10 @@ function displayStatistics(stats) {
                 <td>${test.attempts}</td>
                 <td>${test.avg_score}</td>
                 <td>${test.avg_percentage}%</td>
+                <td>${test.median_percentage}%</td>
+                <td>${test.p90_percentage}%</td>
+                <td>${test.pass_rate}%</td>
+                <td><button class="btn-secondary" onclick="showItemAnalysis(${test.test_id})">Анализ</button></td>
             </tr>
         `).join('');
     }
@@ -537,14 +665,61 @@ function hideStatistics() {
     document.getElementById('testsView').classList.remove('hidden');
 }
 
-// Все результаты
-async function showAllResults() {
+// Анализ вопросов теста
+async function showItemAnalysis(testId) {
     try {
-        const response = await fetch(`${API_URL}/teacher/results?teacher_id=${currentUser.id}`);
-        if (!response.ok) throw new Error('Failed to load results');
+        const response = await apiFetch(`${API_URL}/teacher/tests/${testId}/item-analysis`);
+        if (!response.ok) throw new Error('Failed to load item analysis');
         
-        const results = await response.json();
-        displayAllResults(results);
+        const analysis = await response.json();
+        displayItemAnalysis(analysis);
+        
+    } catch (error) {
+        console.error('Error loading item analysis:', error);
+        alert('Ошибка загрузки анализа вопросов');
+    }
+}
+
+function displayItemAnalysis(analysis) {
+    document.getElementById('statisticsView').classList.add('hidden');
+    document.getElementById('itemAnalysisView').classList.remove('hidden');
+    document.getElementById('itemAnalysisTitle').textContent = `Анализ вопросов: ${analysis.test_title}`;
+    
+    const formatValue = (value) => value === null ? '—' : value.toFixed(2);
+    const tbody = document.querySelector('#itemAnalysisTable tbody');
+    if (analysis.questions.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="5" style="text-align: center;">Нет вопросов</td></tr>';
+        return;
+    }
+    
+    tbody.innerHTML = analysis.questions.map(question => `
+        <tr>
+            <td>${question.question_text}</td>
+            <td>${question.attempts}</td>
+            <td>${formatValue(question.difficulty)}</td>
+            <td>${formatValue(question.discrimination)}</td>
+            <td>${question.options.map(option => `
+                ${option.option_text}${option.is_correct ? ' ✓' : ''}: ${option.selections}
+            `).join('<br>')}</td>
+        </tr>
+    `).join('');
+}
+
+function hideItemAnalysis() {
+    document.getElementById('itemAnalysisView').classList.add('hidden');
+    document.getElementById('statisticsView').classList.remove('hidden');
+}
+
+// Все результаты
+async function showAllResults(append = false) {
+    try {
+        const page = await fetchPage(
+            `${API_URL}/teacher/results`,
+            append ? resultsCursor : null
+        );
+        resultsCursor = page.nextCursor;
+        displayAllResults(page.items, append);
+        toggleMoreButton('moreResultsBtn', resultsCursor);
         
     } catch (error) {
         console.error('Error loading results:', error);
@@ -552,30 +727,54 @@ async function showAllResults() {
     }
 }
 
-function displayAllResults(results) {
+function displayAllResults(results, append = false) {
     document.getElementById('testsView').classList.add('hidden');
     document.getElementById('resultsView').classList.remove('hidden');
     
     const tbody = document.querySelector('#resultsTable tbody');
     
-    if (results.length === 0) {
+    if (results.length === 0 && !append) {
         tbody.innerHTML = '<tr><td colspan="4" style="text-align: center;">Нет результатов</td></tr>';
         return;
     }
     
-    tbody.innerHTML = results.map(result => {
+    const html = results.map(result => {
         const percentage = Math.round((result.score / result.total_questions) * 100);
         const date = new Date(result.completed_at).toLocaleString('ru-RU');
         
         return `
             <tr>
                 <td>${result.username}</td>
-                <td>${result.test_title}</td>
+                <td>${result.test_title ?? 'Тест удален'}</td>
                 <td>${result.score} / ${result.total_questions} (${percentage}%)</td>
                 <td>${date}</td>
             </tr>
         `;
     }).join('');
+    
+    if (append) {
+        tbody.insertAdjacentHTML('beforeend', html);
+    } else {
+        tbody.innerHTML = html;
+    }
+}
+
+async function exportResults(format) {
+    // Запрос с токеном, затем сохранение полученного файла
+    try {
+        const response = await apiFetch(`${API_URL}/teacher/export?format=${format}`);
+        if (!response.ok) throw new Error('Failed to export results');
+        
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(await response.blob());
+        link.download = `results.${format}`;
+        link.click();
+        URL.revokeObjectURL(link.href);
+        
+    } catch (error) {
+        console.error('Error exporting results:', error);
+        alert('Ошибка экспорта результатов');
+    }
 }
 
 function hideResults() {